@@ -1,5 +1,7 @@
 import ROOT
-#import os
+import os
+import optparse
+import numpy as np
 
 ROOT.gROOT.SetBatch(ROOT.kTRUE)
 ROOT.gStyle.SetLabelFont(42,"xyz")
@@ -27,52 +29,111 @@ five =ROOT.TColor(2005,0.388,0.098,0.608)
 six=ROOT.TColor(2006,0.906,0.878,0.094)
 colors = [1,2001,2002,2003,2004,2005,2006,6,2,3,4,6,7,5,1,8,9,29,38,46,1,2001,2002,2003,2004,2005,2006]
 
-filename = "root://cmseos.fnal.gov//store/group/cmstestbeam/2021_CMSTiming_ETL/LecroyScope/RecoData/TimingDAQRECO/RecoWithTracks/v2/confInfo/run_scope34631_info.root"
-event_number = 5594
-chanlist =[1,2,3,4]
+# Indexed event display: the (i_evt -> entry) index of a run file is built
+# once from the i_evt branch alone and saved next to the local copy, then
+# each event is displayed from a single entry read of channel/time, instead
+# of one full-chain scan per channel. Remote files are cached locally by ROOT
+# (CACHEREAD), so later runs only read the local copy.
+#
+#     python eventDisplay.py -e 5594,6001,7123
+#     python eventDisplay.py -E events.txt -f run_scope34631_info.root
 
-chain = ROOT.TChain("pulse")
-chain.Add(filename)
+parser = optparse.OptionParser("usage: %prog [options]\n")
+parser.add_option('-f', dest='filename', default = "root://cmseos.fnal.gov//store/group/cmstestbeam/2021_CMSTiming_ETL/LecroyScope/RecoData/TimingDAQRECO/RecoWithTracks/v2/confInfo/run_scope34631_info.root", help="Run file (local path or xrootd url)")
+parser.add_option('-e', dest='events', default = "5594", help="Comma separated i_evt numbers to display")
+parser.add_option('-E', dest='eventFile', default = "", help="Text file with one i_evt number per line")
+parser.add_option('-c', dest='cacheDir', default = "eventDisplayCache", help="Directory for the local copy of remote files and the event index")
+parser.add_option('-o', dest='output', default = "display_%i.pdf", help="Output name pattern, with %i for the event number")
+options, args = parser.parse_args()
 
-canvas = ROOT.TCanvas("c1","",1000,600)
-canvas.SetGridy()
-canvas.SetGridx()
+# Channel index and legend label of each drawn waveform
+chanlist = [(0, "DC ring"), (1, "Top Right"), (2, "Top Left"), (3, "Bottom Left"), (4, "Bottom Right")]
 
-chain.SetLineWidth(2)
-leg = ROOT.TLegend(0.8,0.6,0.99,0.9)
+def openTree(filename, cacheDir):
+    os.makedirs(cacheDir, exist_ok=True)
+    ROOT.TFile.SetCacheFileDir(cacheDir)
+    infile = ROOT.TFile.Open(filename, "CACHEREAD")
+    if not infile or infile.IsZombie():
+        raise Exception("ERROR: cannot open file ", filename)
+    return infile, infile.Get("pulse")
 
+def maxLength(tree, leaves):
+    # Upper bound of the values per entry of array leaves (variable size ones included)
+    length = 1
+    for name in leaves:
+        leaf = tree.GetLeaf(name)
+        count = leaf.GetLeafCount()
+        length = max(length, leaf.GetLenStatic() * (count.GetMaximum() if count else 1))
+    return length
 
-waves = []
-dummy = ROOT.TH2F("dum","",100,-235,-185,100,-150,40)
-dummy.SetTitle("Event %i;Time [ns]; Amplitude [mV];"%event_number)
+def readColumns(tree, varexp, nentries=ROOT.TTree.kMaxEntries, first=0, rowsPerEntry=1):
+    # Columns of tree.Draw(varexp) as numpy arrays (at most 4 expressions).
+    # Array expressions give up to rowsPerEntry rows per entry, the Draw
+    # buffers must hold all of them
+    nvars = len(varexp.split(":"))
+    nrows = min(nentries, tree.GetEntries() - first) * rowsPerEntry
+    tree.SetEstimate(max(tree.GetEntries(), nrows) + 1)
+    n = tree.Draw(varexp, "", "goff", nentries, first)
+    columns = []
+    for getter in (tree.GetV1, tree.GetV2, tree.GetV3, tree.GetV4)[:nvars]:
+        buf = getter()
+        buf.reshape((n,))
+        columns.append(np.array(buf, dtype=np.float64, copy=True))
+    return columns
 
+def eventIndex(tree, infile, cacheDir):
+    # {i_evt: entry}, read from the i_evt branch only and saved for the next runs
+    indexPath = os.path.join(cacheDir, os.path.basename(infile.GetName()) + ".ievt.npz")
+    if os.path.exists(indexPath):
+        with np.load(indexPath) as data:
+            if int(data["entries"]) == tree.GetEntries() and int(data["size"]) == infile.GetSize():
+                return dict(zip(data["i_evt"].astype(np.int64).tolist(), range(len(data["i_evt"]))))
+    i_evt, = readColumns(tree, "i_evt")
+    np.savez(indexPath, i_evt=i_evt, entries=tree.GetEntries(), size=infile.GetSize())
+    return dict(zip(i_evt.astype(np.int64).tolist(), range(len(i_evt))))
 
-dummy.Draw()
+def readEvent(tree, entry):
+    # time and the waveform of every channel in chanlist, from one entry
+    exprs = ["1e9*time[0]"] + ["channel[%i]"%chan for chan, _ in chanlist]
+    rows = maxLength(tree, ["time", "channel"])
+    values = []
+    for i in range(0, len(exprs), 4):
+        values += readColumns(tree, ":".join(exprs[i:i+4]), 1, entry, rows)
+    return values[0], values[1:]
 
-chain.SetLineColor(colors[0])
-chain.Draw("channel[0]:1e9*time[0]>>hchan0","i_evt==%i"%event_number,"L same")
-leg.AddEntry(ROOT.hchan0,"DC ring","L")
-chain.SetLineColor(colors[1])
-chain.Draw("channel[1]:1e9*time[0]>>hchan1","i_evt==%i"%event_number,"L same")
-leg.AddEntry(ROOT.hchan1,"Top Right","L")
-chain.SetLineColor(colors[2])
-chain.Draw("channel[2]:1e9*time[0]>>hchan2","i_evt==%i"%event_number,"L same")
-leg.AddEntry(ROOT.hchan2,"Top Left","L")
-chain.SetLineColor(colors[3])
-chain.Draw("channel[3]:1e9*time[0]>>hchan3","i_evt==%i"%event_number,"L same")
-leg.AddEntry(ROOT.hchan3,"Bottom Left","L")
-chain.SetLineColor(colors[4])
-chain.Draw("channel[4]:1e9*time[0]>>hchan4","i_evt==%i"%event_number,"L same")
-leg.AddEntry(ROOT.hchan4,"Bottom Right","L")
+def display(event_number, time, waves, output):
+    canvas = ROOT.TCanvas("c%i"%event_number,"",1000,600)
+    canvas.SetGridy()
+    canvas.SetGridx()
+    leg = ROOT.TLegend(0.8,0.6,0.99,0.9)
 
-# for i,chan in enumerate(chanlist):
-# 	# waves.append(ROOT.TH2F("chan%i"%chan,"",100,-230,-180,100,-500,50))
-# 	# waves[i].SetLineColor(colors[chan])
-# 	# waves[i].SetLineWidth(2)
-# 	chain.SetLineColor(colors[chan])
-# 	chain.Draw("channel[%i]:1e9*time[0]>>hchan"%(chan),"i_evt==%i"%event_number,"L same")
-# 	# waves.append(ROOT.hchan)
-# 	leg.AddEntry(ROOT.hchan,"Channel %i"%chan,"L")
+    dummy = ROOT.TH2F("dum%i"%event_number,"",100,-235,-185,100,-150,40)
+    dummy.SetTitle("Event %i;Time [ns]; Amplitude [mV];"%event_number)
+    dummy.Draw()
 
-leg.Draw("same")
-canvas.Print("display_%i.pdf"%event_number)
+    graphs = []
+    for i, ((chan, label), wave) in enumerate(zip(chanlist, waves)):
+        graph = ROOT.TGraph(len(time), time, wave)
+        graph.SetLineColor(colors[i])
+        graph.SetLineWidth(2)
+        graph.Draw("L same")
+        leg.AddEntry(graph, label, "L")
+        graphs.append(graph)
+
+    leg.Draw("same")
+    canvas.Print(output%event_number)
+    canvas.Close()
+
+events = [int(e) for e in options.events.split(",") if e.strip()]
+if options.eventFile:
+    with open(options.eventFile) as f:
+        events = [int(line.split()[0]) for line in f if line.strip() and not line.startswith("#")]
+
+infile, tree = openTree(options.filename, options.cacheDir)
+index = eventIndex(tree, infile, options.cacheDir)
+for event_number in events:
+    if event_number not in index:
+        print("WARNING: i_evt %i not found in %s"%(event_number, options.filename))
+        continue
+    time, waves = readEvent(tree, index[event_number])
+    display(event_number, time, waves, options.output)
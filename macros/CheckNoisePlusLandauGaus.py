@@ -0,0 +1,82 @@
+from ROOT import TF1, TH1F, TMath
+import ROOT
+import time
+import optparse
+import numpy as np
+import EfficiencyUtils as eu
+
+# Toy check and timing of the NoisePlusLandauGaus fits of EfficiencyUtils.
+# Poisson toys of the model (25 bins from 0 to 50 mV, as Plot1DEfficiencyWithFit)
+# are fitted with the numpy FitNoisePlusLandauGaus, one at a time and as a
+# batch, and with ROOT using the compiled TF1 and the original python callback.
+#
+#     python CheckNoisePlusLandauGaus.py -s 0,1,2,3,4,5
+
+def OriginalNoisePlusLandauGaus(x, par):
+    # Python TF1 callback used before the compiled model, for the timing
+    p_noise = eu.noiseTemplateOutside
+    if (x[0] >= 0 and x[0] < 24):
+        p_noise = eu.noiseTemplate[int(x[0]/2)]
+    mpc = par[2] - (-0.22278298) * par[3]
+    xlow = x[0] - 5.0 * par[4]
+    xupp = x[0] + 5.0 * par[4]
+    step = (xupp-xlow) / 500.0
+    sum = 0.0
+    for i in range(1, 251):
+        xx = xlow + (i-.5) * step
+        sum += TMath.Landau(xx,mpc,par[3]) / par[3] * TMath.Gaus(x[0],xx,par[4])
+        xx = xupp - (i-.5) * step
+        sum += TMath.Landau(xx,mpc,par[3]) / par[3] * TMath.Gaus(x[0],xx,par[4])
+    p_landauGaus = step * sum * 0.3989422804014 / par[4]
+    return par[0]*( (1-par[1])*p_noise + par[1]*p_landauGaus)
+
+def MakeToys(seeds, truth, edges):
+    centers = 0.5*(edges[1:] + edges[:-1])
+    expected = eu.NoisePlusLandauGausArray(centers, np.array(truth, dtype=np.float64))
+    return np.array([np.random.RandomState(seed).poisson(expected) for seed in seeds], dtype=np.float64)
+
+def TimeRootFit(function, toy, edges, start):
+    hist = TH1F("toyHist", "", len(edges)-1, edges[0], edges[-1])
+    hist.SetDirectory(0)
+    for i, value in enumerate(toy):
+        hist.SetBinContent(i+1, value)
+    function.SetParameters(*start)
+    begin = time.time()
+    hist.Fit(function, "Q0")
+    return time.time() - begin, [function.GetParameter(i) for i in range(5)]
+
+parser = optparse.OptionParser("usage: %prog [options]\n")
+parser.add_option('-s', dest='seeds', default = "0,1,2,3,4,5", help="Comma separated seeds of the toys")
+parser.add_option('-R', dest='noROOT', action='store_true', default = False, help="Skip the ROOT fit timing")
+options, args = parser.parse_args()
+
+seeds = [int(s) for s in options.seeds.split(",")]
+truth = [1000, 0.9, 20, 2.5, 3.0]
+start = [10, 0.95, 20, 2.5, 3.0]
+edges = np.linspace(0, 50, 26)
+toys = MakeToys(seeds, truth, edges)
+
+begin = time.time()
+single = np.array([eu.FitNoisePlusLandauGaus(toy, edges, start)[0][0] for toy in toys])
+tSingle = time.time() - begin
+begin = time.time()
+params, errors, nll = eu.FitNoisePlusLandauGaus(toys, edges, start)
+tBatch = time.time() - begin
+
+print("seed        a      f    mpv  sigmaL  sigmaG")
+for seed, p in zip(seeds, params):
+    print("%4i %8.1f %6.3f %6.2f %7.3f %7.3f" % ((seed,) + tuple(p)))
+print("numpy: %i toys in %.3f s one by one, %.3f s as a batch" % (len(toys), tSingle, tBatch))
+
+failed = np.any(params[:,3:5] <= 0) or np.any(np.abs(params[:,2] - truth[2]) > 5) or not np.allclose(params, single, rtol=1e-3, atol=1e-3)
+
+if not options.noROOT:
+    compiled = eu.MakeNoisePlusLandauGausTF1("compiledFit", 0, 50)
+    original = TF1("originalFit", OriginalNoisePlusLandauGaus, 0, 50, 5)
+    tCompiled, pCompiled = TimeRootFit(compiled, toys[0], edges, start)
+    tOriginal, pOriginal = TimeRootFit(original, toys[0], edges, start)
+    print("ROOT fit of seed %i: %.3f s compiled, %.3f s python callback, %.0fx faster" % (seeds[0], tCompiled, tOriginal, tOriginal/tCompiled))
+    print("  compiled mpv %.2f, python callback mpv %.2f" % (pCompiled[2], pOriginal[2]))
+
+if failed:
+    raise Exception("ERROR: NoisePlusLandauGaus toy fits failed")
@@ -1,16 +1,117 @@
 from ROOT import TFile,TTree,TCanvas,TF1,TH1F,TH2F,TLatex,TMath,TEfficiency,TGraphAsymmErrors,gStyle
+import ROOT
 import array
+import numpy as np
 import myFunctions as mf
+import histArrays as ha
+import langaus
+try:
+    from scipy.special import betaincinv
+except ImportError:
+    betaincinv = None
+
+##########################
+#Efficiency engine
+##########################
+def BetaQuantile(p, a, b):
+    #Vectorized beta distribution quantiles
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    if betaincinv is not None:
+        return betaincinv(a, b, p)
+    #Without scipy, only the distinct (a, b) pairs are evaluated with ROOT
+    pairs, inverse = np.unique(np.stack([a.ravel(), b.ravel()], axis=1), axis=0, return_inverse=True)
+    values = np.array([ROOT.Math.beta_quantile(p, pa, pb) for pa, pb in pairs])
+    return values[np.ravel(inverse)].reshape(a.shape)
+
+def ClopperPearsonArrays(total, passed, level=0.68269, upper=True):
+    #Same as TEfficiency.ClopperPearson, for arrays of counts
+    total, passed = np.broadcast_arrays(np.asarray(total, dtype=np.float64), np.asarray(passed, dtype=np.float64))
+    alpha = (1.0 - level)/2.
+    bound = np.zeros(total.shape)
+    if upper:
+        sel = passed < total
+        bound[~sel] = 1.0
+        bound[sel] = BetaQuantile(1.0 - alpha, passed[sel] + 1, total[sel] - passed[sel])
+    else:
+        sel = passed > 0
+        bound[sel] = BetaQuantile(alpha, passed[sel], total[sel] - passed[sel] + 1)
+    return bound
+
+def EfficiencyArrays(num, den, level=0.68269):
+    #Ratio and asymmetric Clopper-Pearson errors for every bin at once.
+    #num and den are ROOT histograms (1D or 2D, under/overflow included in the
+    #output) or numpy arrays of any shape, e.g. a stack of channels
+    if hasattr(num, "GetNbinsX"):
+        num = ha.get_contents(num)
+    if hasattr(den, "GetNbinsX"):
+        den = ha.get_contents(den)
+    n2 = np.trunc(np.asarray(den, dtype=np.float64))
+    n1 = np.minimum(np.trunc(np.asarray(num, dtype=np.float64)), n2)
+    n1, n2 = np.broadcast_arrays(n1, n2)
+
+    ratio = np.zeros(n1.shape)
+    errLow = np.zeros(n1.shape)
+    errHigh = np.zeros(n1.shape)
+    sel = n2 > 0
+    ratio[sel] = np.minimum(n1[sel]/n2[sel], 1.0)
+    errLow[sel] = ratio[sel] - ClopperPearsonArrays(n2[sel], n1[sel], level, False)
+    errHigh[sel] = ClopperPearsonArrays(n2[sel], n1[sel], level, True) - ratio[sel]
+    return ratio, errLow, errHigh
+
+def MakeEfficiencyGraph(num, den, shift=0.0, first_bin=2, scale=1.0, axis=None):
+    #TGraphAsymmErrors from bins first_bin..nbins of num/den, built from buffers.
+    #num and den can be arrays indexed by bin number if the axis is given.
+    #The efficiency (not its errors) is multiplied by scale
+    ratio, errLow, errHigh = EfficiencyArrays(num, den)
+    if axis is None:
+        axis = num.GetXaxis()
+    nbins = axis.GetNbins()
+    edges = ha.get_bin_edges(axis)
+    centers = 0.5*(edges[1:] + edges[:-1])
+    sel = slice(first_bin, nbins+1)
+
+    x = np.ascontiguousarray(centers[first_bin-1:] - shift)
+    xErrLow = np.ascontiguousarray(centers[first_bin-1:] - edges[first_bin-1:-1])
+    xErrHigh = np.ascontiguousarray(edges[first_bin:] - centers[first_bin-1:])
+    y = np.ascontiguousarray(scale*ratio[sel])
+    yErrLow = np.ascontiguousarray(errLow[sel])
+    yErrHigh = np.ascontiguousarray(errHigh[sel])
+
+    return TGraphAsymmErrors(len(x), x, y, xErrLow, xErrHigh, yErrLow, yErrHigh)
+
+def Make2DEfficiencyHists(list_num, den, suffix="_ratio"):
+    #Ratio maps of several numerators (e.g. all channels) sharing the same
+    #denominator, computed as a single array operation. Same contents and
+    #errors as num.Clone().Divide(den): 0 where den is empty, uncorrelated errors
+    if len(list_num) == 0:
+        return []
+    n = np.array([ha.get_contents(num) for num in list_num])
+    n_w2 = np.array([ha.get_sumw2(num) for num in list_num])
+    d = ha.get_contents(den)[None]
+    d_w2 = ha.get_sumw2(den)[None]
+    safe_d = np.where(d != 0, d, 1.0)
+    ratio = np.where(d != 0, n/safe_d, 0.0)
+    err = np.where(d != 0, np.sqrt(n_w2*d**2 + d_w2*n**2)/safe_d**2, 0.0)
+
+    list_ratio = []
+    for i, num in enumerate(list_num):
+        hratio = num.Clone("%s%s"%(num.GetName(), suffix))
+        ha.set_array(hratio, ratio[i], err[i])
+        list_ratio.append(hratio)
+    return list_ratio
 
 ##########################
 #2D Efficiency 
 ##########################
-def Plot2DEfficiency( num, den, plotname, topTitle, xAxisTitle, xAxisRangeLow, xAxisRangeHigh, yAxisTitle, yAxisRangeLow, yAxisRangeHigh, effMin, effMax, savePDF=False ) :
+def Plot2DEfficiency( num, den, plotname, topTitle, xAxisTitle, xAxisRangeLow, xAxisRangeHigh, yAxisTitle, yAxisRangeLow, yAxisRangeHigh, effMin, effMax, savePDF=False, ratio=None ) :
 
     c = TCanvas("cv","cv",1000,800)    
 
-    ratio = num.Clone("ratio")
-    ratio.Divide(den)
+    #ratio can be given already computed (see Make2DEfficiencyHists)
+    if ratio is None:
+        ratio = num.Clone("ratio")
+        ratio.Divide(den)
 
     ratio.SetTitle(topTitle)
     ratio.SetTitleSize(0.05)
@@ -50,73 +151,111 @@ def Plot2DEfficiency( num, den, plotname, topTitle, xAxisTitle, xAxisRangeLow, x
 
 
 
-def NoisePlusLandauGaus(x, par) :
-
-    #p_noise comes from a template histogram and is normalized to 1.0
-    p_noise = 0
-    if (x[0] >= 0 and x[0] < 2):
-        p_noise = 0.0219891
-    elif (x[0] >= 2 and x[0] < 4):
-        p_noise = 0.120234
-    elif (x[0] >= 4 and x[0] < 6):
-        p_noise = 0.201533
-    elif (x[0] >= 6 and x[0] < 8):
-        p_noise = 0.208594
-    elif (x[0] >= 8 and x[0] < 10):
-        p_noise = 0.150293
-    elif (x[0] >= 10 and x[0] < 12):
-        p_noise = 0.103087
-    elif (x[0] >= 12 and x[0] < 14):
-        p_noise = 0.0691951
-    elif (x[0] >= 14 and x[0] < 16):
-        p_noise = 0.0490216
-    elif (x[0] >= 16 and x[0] < 18):
-        p_noise = 0.0344967
-    elif (x[0] >= 18 and x[0] < 20):
-        p_noise = 0.0217874
-    elif (x[0] >= 20 and x[0] < 22):
-        p_noise = 0.0117006
-    elif (x[0] >= 22and x[0] < 24):
-        p_noise = 0.00484164
-    else :
-        p_noise = 0.003228
-
-    
-    #p_landau = TMath.Landau(x[0],par[2],par[3],False)
-
-    invsq2pi = 0.3989422804014;   # (2 pi)^(-1/2)
-    mpshift  = -0.22278298;       # Landau maximum location    
-    np = 500.0;      # number of convolution steps
-    sc =   5.0;      # convolution extends to +-sc Gaussian sigmas
-
-
-    #integral result
-    sum = 0.0;
-
-    #MP shift correction
-    mpc = par[2] - mpshift * par[3];
+#p_noise comes from a template histogram and is normalized to 1.0
+#Template bins are 2 mV wide from 0 to 24 mV, any other amplitude gets the last value
+noiseTemplateEdges = np.arange(0.0, 26.0, 2.0)
+noiseTemplate = np.array([0.0219891, 0.120234, 0.201533, 0.208594, 0.150293, 0.103087,
+                          0.0691951, 0.0490216, 0.0344967, 0.0217874, 0.0117006, 0.00484164])
+noiseTemplateOutside = 0.003228
 
-    #Range of convolution integral
-    xlow = x[0] - sc * par[4];
-    xupp = x[0] + sc * par[4];
-    step = (xupp-xlow) / np;
+#Landau density table shared by all the evaluations
+landauTable = langaus.LandauTable()
 
-    #Convolution integral of Landau and Gaussian by sum
-    for i in range(1, int(np/2)+1):
-         xx = xlow + (i-.5) * step;
-         fland = TMath.Landau(xx,mpc,par[3]) / par[3];
-         sum += fland * TMath.Gaus(x[0],xx,par[4]);
+def NoiseTemplate(x):
+    x = np.asarray(x, dtype=np.float64)
+    idx = np.clip(((x - noiseTemplateEdges[0])/2.0).astype(int), 0, len(noiseTemplate)-1)
+    inside = (x >= noiseTemplateEdges[0]) & (x < noiseTemplateEdges[-1])
+    return np.where(inside, noiseTemplate[idx], noiseTemplateOutside)
 
-         xx = xupp - (i-.5) * step;
-         fland = TMath.Landau(xx,mpc,par[3]) / par[3];
-         sum += fland * TMath.Gaus(x[0],xx,par[4]);
+def NoisePlusLandauGausArray(x, par):
+    #Evaluate the model for arrays: x with shape (n, m) and par with shape (n, 5),
+    #or x with shape (m,) and a single set of 5 parameters
+    x = np.asarray(x, dtype=np.float64)
+    par = np.asarray(par, dtype=np.float64)
+    single = (par.ndim == 1)
+    x2 = np.atleast_2d(x)
+    par2 = np.atleast_2d(par)
 
-    p_landauGaus = step * sum * invsq2pi / par[4];
-
-
-    return par[0]*( (1-par[1])*p_noise + par[1]*p_landauGaus)
+    #Landau convoluted with a normalized gaussian, 500 steps within +-5 sigmas
+    lgpar = np.stack([par2[:,3], par2[:,2], np.ones(len(par2)), par2[:,4]], axis=1)
+    p_landauGaus = langaus.langaufun_batch(x2, lgpar, landauTable, nsteps=500)/np.abs(par2[:,4:5])
 
+    value = par2[:,0:1]*((1-par2[:,1:2])*NoiseTemplate(x2) + par2[:,1:2]*p_landauGaus)
+    return value[0] if single else value
 
+def NoisePlusLandauGaus(x, par) :
+    #TF1 callback (python), prefer MakeNoisePlusLandauGausTF1 for ROOT fits
+    return float(NoisePlusLandauGausArray([x[0]], [par[i] for i in range(5)])[0])
+
+noisePlusLandauGausCode = """
+#include "TMath.h"
+double NoisePlusLandauGausC(double *x, double *par) {
+    static const double noise[12] = {%s};
+    double p_noise = %s;
+    if (x[0] >= 0 && x[0] < 24) p_noise = noise[int(x[0]/2)];
+
+    const double invsq2pi = 0.3989422804014;
+    const double mpshift  = -0.22278298;
+    const int np = 500;
+    const double sc = 5.0;
+    double mpc = par[2] - mpshift * par[3];
+    double xlow = x[0] - sc * par[4];
+    double step = 2 * sc * par[4] / np;
+    double sum = 0.0;
+    for (int i = 0; i < np; i++) {
+        double xx = xlow + (i + 0.5) * step;
+        sum += TMath::Landau(xx, mpc, par[3]) / par[3] * TMath::Gaus(x[0], xx, par[4]);
+    }
+    double p_landauGaus = step * sum * invsq2pi / par[4];
+    return par[0]*((1-par[1])*p_noise + par[1]*p_landauGaus);
+}
+""" % (", ".join(["%g"%v for v in noiseTemplate]), "%g"%noiseTemplateOutside)
+
+def MakeNoisePlusLandauGausTF1(name="NoisePlusLandauGaus", xmin=0, xmax=50):
+    #Compiled (cling JIT) version of NoisePlusLandauGaus, declared only once
+    if not hasattr(ROOT, "NoisePlusLandauGausC"):
+        ROOT.gInterpreter.Declare(noisePlusLandauGausCode)
+    fitFunction = TF1(name, ROOT.NoisePlusLandauGausC, xmin, xmax, 5)
+    fitFunction.SetParNames("a", "f", "mpv", "sigmaLandau", "sigmaGaus")
+    return fitFunction
+
+#The fit runs on internal parameters that keep the model physical:
+#a, logit(f), mpv, log(sigmaLandau), log(sigmaGaus)
+def _NoisePlusLandauGausExternal(q):
+    p = np.array(q, dtype=np.float64)
+    p[:,1] = 1.0/(1.0 + np.exp(-q[:,1]))
+    p[:,3:5] = np.exp(q[:,3:5])
+    return p
+
+def _NoisePlusLandauGausInternal(p):
+    q = np.array(p, dtype=np.float64)
+    f = np.clip(p[:,1], 1e-6, 1-1e-6)
+    q[:,1] = np.log(f/(1-f))
+    q[:,3:5] = np.log(np.maximum(np.abs(p[:,3:5]), 1e-6))
+    return q
+
+def FitNoisePlusLandauGaus(contents, edges, startparams, fitrange=None):
+    #Pure numpy binned likelihood fit of NoisePlusLandauGaus.
+    #contents has shape (nbins,) or (n, nbins) and startparams (5,) or (n, 5).
+    #The widths are kept positive, f within [0, 1] and a is seeded from the
+    #histogram integral (the a of startparams is ignored)
+    contents = np.atleast_2d(np.asarray(contents, dtype=np.float64))
+    centers = 0.5*(np.asarray(edges[1:]) + np.asarray(edges[:-1]))
+    x = np.broadcast_to(centers, contents.shape)
+    mask = np.ones(contents.shape, dtype=bool)
+    if fitrange:
+        mask = (x >= fitrange[0]) & (x <= fitrange[1])
+    params = np.array(np.broadcast_to(np.asarray(startparams, dtype=np.float64), (contents.shape[0], 5)))
+    params[:,0] = 1.0
+    shape = np.sum(np.where(mask, NoisePlusLandauGausArray(x, params), 0.0), axis=1)
+    params[:,0] = np.sum(np.where(mask, contents, 0.0), axis=1)/np.where(shape > 0, shape, 1.0)
+
+    model = lambda xs, q: NoisePlusLandauGausArray(xs, _NoisePlusLandauGausExternal(q))
+    q, qerrors, nll = langaus.fit_poisson_batch(model, x, contents, mask, _NoisePlusLandauGausInternal(params))
+    params = _NoisePlusLandauGausExternal(q)
+    #Errors propagated to the external parameters
+    errors = qerrors*np.stack([np.ones(len(q)), params[:,1]*(1-params[:,1]), np.ones(len(q)), params[:,3], params[:,4]], axis=1)
+    return params, errors, nll
 
 
 
@@ -129,10 +268,9 @@ def Plot1DEfficiencyWithFit( tree, plotname, topTitle, xAxisTitle, xAxisRangeLow
     tree.Draw("amp[3]>>ampHist"," x_dut[2] > 19.6 && x_dut[2] < 19.7 && y_dut[2] > 23.5 && y_dut[2] < 24.0 && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16)")
     
 # create function for fitting
-    fitFunction = TF1("NoisePlusLandauGaus",NoisePlusLandauGaus,0,50,5)
+    fitFunction = MakeNoisePlusLandauGausTF1("NoisePlusLandauGaus",0,50)
 
     fitFunction.SetParameters(10, 0.95, 20.0, 2.5, 3.0)
-    fitFunction.SetParNames("a", "f", "mpv", "sigmaLandau", "sigmaGaus")
     #fitFunction.SetParLimits(0,   -1,   -4)
     #fitFunction.SetParLimits(1, 0.01,  0.2)
     #fitFunction.SetParLimits(2,    0,    2)
@@ -235,7 +373,79 @@ def Plot1DEfficiencyWithFit( tree, plotname, topTitle, xAxisTitle, xAxisRangeLow
 # Therefore we increase the measured efficiency by 1.1% to correct for the inefficiency of the time window ct
 ##############################################################################
 
-def Plot1DEfficiencyWithBkgSubtraction( tree, num, den, axis, pixel, plotname, topTitle, xAxisTitle, xAxisRangeLow, xAxisRangeHigh ) :
+#Noise templates: 
+#Pixel 5,3 : amp <= 6mV gives 0.4417 of the total and has 0 signal contamination
+#Pixel 5,4 : amp <= 10mV gives 0.0404 of the total and has 0 signal contamination
+#Pixel 5,10 : amp < gives 0. of the total and has 0 signal contamination
+#We will assume that bins 0+1+2 (0-6mV) do not contain ANY signal.
+#We count the number of events in those bins and divide by 0.4417 to get
+#the total number of noise events. We subtract those from the numerator.
+
+#Noise template is made from this data (outside of sensor region AND outside of time window):  
+#/eos/uscms/store/user/cmstestbeam/2019_04_April_CMSTiming/KeySightScope/RecoData/TimingDAQRECO/RecoWithTracks/v6_CACTUSSkim/Completed/Data_CACTUSAnalog_Pixel5_3_16216-16263.root
+#pulse->Draw("amp[3]>>ampHist(25,0,50)","!(x_dut[2] > 19.4 && x_dut[2] < 20.6 && y_dut[2] > 23.4 && y_dut[2] < 24.1) && !((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16)")
+
+#Noise control region (amp[3] <= noiseAmpMax) and position window of each pixel
+bkgSubtractionPixels = {
+    "5_3":  {"noiseAmpMax": 6,  "noiseCRFraction": 0.4417, "xRange": (19.5, 20.5), "yRange": (23.5, 24.0)},
+    "5_4":  {"noiseAmpMax": 14, "noiseCRFraction": 0.4053, "xRange": (18.5, 19.5), "yRange": (23.5, 24.0)},
+    "5_10": {"noiseAmpMax": 13, "noiseCRFraction": 0.3802, "xRange": (19.5, 20.5), "yRange": (23.0, 23.5)},
+}
+bkgSubtractionBaseSelection = "ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0"
+bkgSubtractionTimeWindow = (6, 16)
+
+def IterateTreeColumns(tree, varexp, selection="", chunk_size=1000000):
+    #Yield numpy arrays of (up to 4) expressions for the entries passing
+    #selection, reading the tree only once, chunk by chunk
+    nentries = tree.GetEntries()
+    estimate = tree.GetEstimate()
+    tree.SetEstimate(chunk_size + 1)
+    getters = [tree.GetV1, tree.GetV2, tree.GetV3, tree.GetV4][:len(varexp)]
+    try:
+        for first in range(0, nentries, chunk_size):
+            nrows = tree.Draw(":".join(varexp), selection, "goff", chunk_size, first)
+            if nrows <= 0:
+                continue
+            columns = []
+            for get in getters:
+                buf = get()
+                buf.reshape((nrows,))
+                columns.append(np.array(buf, dtype=np.float64, copy=True))
+            yield columns
+    finally:
+        #Also restored when the loop is left early or raises
+        tree.SetEstimate(estimate)
+
+def BkgSubtractionCounts(tree, xaxis, axis, pixel, chunk_size=1000000):
+    #Denominator, numerator and numerator noise control region counts of every
+    #bin of xaxis (index = bin number), from a single pass over the tree.
+    #Same selections as the per bin string cuts, strict inequalities included
+    info = bkgSubtractionPixels.get(pixel)
+    edges = ha.get_bin_edges(xaxis)
+    nbins = xaxis.GetNbins()
+    denominatorCounts = np.zeros(nbins+2)
+    totalCounts = np.zeros(nbins+2)
+    noiseCounts = np.zeros(nbins+2)
+
+    varexp = ["x_dut[2]", "y_dut[2]", "(t_peak[3] - t_peak[0])*1e9", "amp[3]"]
+    for x, y, dt, amp in IterateTreeColumns(tree, varexp, bkgSubtractionBaseSelection, chunk_size):
+        position, other = (x, y) if (axis == "x") else (y, x)
+        idx = np.searchsorted(edges, position, side="right") - 1
+        sel = (idx >= 0) & (idx < nbins)
+        sel[sel] &= position[sel] > edges[idx[sel]]
+        if info:
+            window = info["yRange"] if (axis == "x") else info["xRange"]
+            sel &= (other > window[0]) & (other < window[1])
+        inTime = sel & (dt > bkgSubtractionTimeWindow[0]) & (dt < bkgSubtractionTimeWindow[1])
+        inNoise = inTime & (amp <= info["noiseAmpMax"]) if info else inTime
+
+        denominatorCounts += np.bincount(idx[sel] + 1, minlength=nbins+2)
+        totalCounts += np.bincount(idx[inTime] + 1, minlength=nbins+2)
+        noiseCounts += np.bincount(idx[inNoise] + 1, minlength=nbins+2)
+
+    return denominatorCounts, totalCounts, noiseCounts
+
+def Plot1DEfficiencyWithBkgSubtraction( tree, num, den, axis, pixel, plotname, topTitle, xAxisTitle, xAxisRangeLow, xAxisRangeHigh, columnar=True ) :
 
     #make amp histogram
     c = TCanvas("c","c", 800,800)
@@ -254,117 +464,60 @@ def Plot1DEfficiencyWithBkgSubtraction( tree, num, den, axis, pixel, plotname, t
     #tree.Draw("amp[3]>>ampHist"," x_dut[2] > 19.6 && x_dut[2] < 19.7 && y_dut[2] > 23.5 && y_dut[2] < 24.0 && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16)")
     
     nbins = num.GetXaxis().GetNbins()
-    x = list()
-    y = list()
-    xErrLow = list()
-    xErrHigh = list()
-    yErrLow = list()
-    yErrHigh = list()
+    numeratorCounts = np.zeros(nbins+2)
+    denominatorCounts = np.zeros(nbins+2)
+
+    noiseSelection = ""
+    noiseSelectionCRFraction = 1
+    xPositionSelection = ""
+    yPositionSelection = ""
+    if pixel in bkgSubtractionPixels:
+        info = bkgSubtractionPixels[pixel]
+        noiseSelection = " && amp[3] <= %s"%(info["noiseAmpMax"])
+        noiseSelectionCRFraction = info["noiseCRFraction"]
+        xPositionSelection = " && x_dut[2] > %s && x_dut[2] < %s "%(info["xRange"])
+        yPositionSelection = " && y_dut[2] > %s && y_dut[2] < %s "%(info["yRange"])
+
+    #print ("noise selection = " + noiseSelection + " " + str(noiseSelectionCRFraction))
+
+    #Columnar mode: all bins are counted in one pass over the tree
+    if columnar:
+        denominatorCount, tmpNumeratorTotalCount, tmpNumeratorNoiseControlRegionCount = BkgSubtractionCounts(tree, num.GetXaxis(), axis, pixel)
+        tmpNumeratorSignalCount = tmpNumeratorTotalCount - tmpNumeratorNoiseControlRegionCount / noiseSelectionCRFraction
+        numeratorCounts[2:nbins+1] = np.trunc(tmpNumeratorSignalCount[2:nbins+1])
+        denominatorCounts[2:nbins+1] = denominatorCount[2:nbins+1]
 
-    for b in range(1,nbins):
+    else:
+        #Per bin mode: three string cuts (full tree scans) per bin
+        for b in range(1,nbins):
+            positionSelectionString = ""
+            if (axis == "x"):
+                positionSelectionString = " && x_dut[2] > "+str(num.GetXaxis().GetBinLowEdge(b+1))+ " && x_dut[2] < " + str(num.GetXaxis().GetBinUpEdge(b+1)) + yPositionSelection
+            if (axis == "y"):
+                positionSelectionString = xPositionSelection + " && y_dut[2] > "+str(num.GetXaxis().GetBinLowEdge(b+1))+ " && y_dut[2] < " + str(num.GetXaxis().GetBinUpEdge(b+1)) + " "
 
-        xtemp = num.GetXaxis().GetBinCenter(b+1)
-        xerrlow =  num.GetXaxis().GetBinCenter(b+1) - num.GetXaxis().GetBinLowEdge(b+1)  
-        xerrhigh = num.GetXaxis().GetBinUpEdge(b+1) - num.GetXaxis().GetBinCenter(b+1)  
 
-        #Noise templates: 
-        #Pixel 5,3 : amp <= 6mV gives 0.4417 of the total and has 0 signal contamination
-        #Pixel 5,4 : amp <= 10mV gives 0.0404 of the total and has 0 signal contamination
-        #Pixel 5,10 : amp < gives 0. of the total and has 0 signal contamination
-        #We will assume that bins 0+1+2 (0-6mV) do not contain ANY signal.
-        #We count the number of events in those bins and divide by 0.4417 to get
-        #the total number of noise events. We subtract those from the numerator.
-
-        #Noise template is made from this data (outside of sensor region AND outside of time window):  
-        #/eos/uscms/store/user/cmstestbeam/2019_04_April_CMSTiming/KeySightScope/RecoData/TimingDAQRECO/RecoWithTracks/v6_CACTUSSkim/Completed/Data_CACTUSAnalog_Pixel5_3_16216-16263.root
-        #pulse->Draw("amp[3]>>ampHist(25,0,50)","!(x_dut[2] > 19.4 && x_dut[2] < 20.6 && y_dut[2] > 23.4 && y_dut[2] < 24.1) && !((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16)")
-
-        noiseSelection = ""
-        noiseSelectionCRFraction = 1
-        xPositionSelection = ""
-        yPositionSelection = ""
-        if (pixel == "5_3"):
-            noiseSelection = " && amp[3] <= 6"
-            noiseSelectionCRFraction = 0.4417
-            xPositionSelection = " && x_dut[2] > 19.5 && x_dut[2] < 20.5 "
-            yPositionSelection = " && y_dut[2] > 23.5 && y_dut[2] < 24.0 "
-        if (pixel == "5_4"):
-            noiseSelection = " && amp[3] <= 14"
-            noiseSelectionCRFraction = 0.4053
-            xPositionSelection = " && x_dut[2] > 18.5 && x_dut[2] < 19.5 "
-            yPositionSelection = " && y_dut[2] > 23.5 && y_dut[2] < 24.0 "
-        if (pixel == "5_10"):
-            noiseSelection = " && amp[3] <= 13"
-            noiseSelectionCRFraction = 0.3802
-            xPositionSelection = " && x_dut[2] > 19.5 && x_dut[2] < 20.5 "
-            yPositionSelection = " && y_dut[2] > 23.0 && y_dut[2] < 23.5 "
-
-        #print ("noise selection = " + noiseSelection + " " + str(noiseSelectionCRFraction))
-
-        positionSelectionString = ""
-        if (axis == "x"):
-            positionSelectionString = " && x_dut[2] > "+str(num.GetXaxis().GetBinLowEdge(b+1))+ " && x_dut[2] < " + str(num.GetXaxis().GetBinUpEdge(b+1)) + yPositionSelection
-        if (axis == "y"):
-            positionSelectionString = xPositionSelection + " && y_dut[2] > "+str(num.GetXaxis().GetBinLowEdge(b+1))+ " && y_dut[2] < " + str(num.GetXaxis().GetBinUpEdge(b+1)) + " "
-
-
-        #print ("numerator: " + "ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16)")
-
-
-        ampHist = TH1F("ampHist"+"_"+str(b),";Amplitude [mV]; Number of Events", 25,0,50)
-        denominatorCount = tree.GetEntries("ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " ")
-        tmpNumeratorTotalCount = tree.GetEntries("ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16)")
-        tmpNumeratorNoiseControlRegionCount = tree.GetEntries("ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16) " + noiseSelection)
-        tmpNumeratorSignalCount = tmpNumeratorTotalCount - tmpNumeratorNoiseControlRegionCount / noiseSelectionCRFraction
+            #print ("numerator: " + "ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16)")
 
-        #print ("ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16) " + noiseSelection)
 
-        ratio = 0
-        errLow = 0
-        errHigh = 0
+            denominatorCount = tree.GetEntries("ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " ")
+            tmpNumeratorTotalCount = tree.GetEntries("ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16)")
+            tmpNumeratorNoiseControlRegionCount = tree.GetEntries("ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16) " + noiseSelection)
+            tmpNumeratorSignalCount = tmpNumeratorTotalCount - tmpNumeratorNoiseControlRegionCount / noiseSelectionCRFraction
 
-        n1 = int(tmpNumeratorSignalCount);
-        n2 = int(denominatorCount);
-        #print ("numerator: " + str(n1) + " and denominator: " + str(n2))
-        if (n1 > n2):
-            n1 = n2;
+            #print ("ntracks==1 && y_dut[0] > 0 && npix>0 && nback>0 " + positionSelectionString + " && ((t_peak[3] - t_peak[0])*1e9 > 6 && (t_peak[3] - t_peak[0])*1e9  < 16) " + noiseSelection)
 
-        if (n2>0) :
-          ratio = float(n1)/float(n2);
-          if (ratio > 1) :
-              ratio = 1;
-          errLow = ratio - TEfficiency.ClopperPearson(n2, n1, 0.68269, False);
-          errHigh = TEfficiency.ClopperPearson(n2, n1, 0.68269, True) - ratio;
-    
+            numeratorCounts[b+1] = int(tmpNumeratorSignalCount)
+            denominatorCounts[b+1] = int(denominatorCount)
 
-        #print (" done bin " + str(b) + " : " + str(num.GetXaxis().GetBinLowEdge(b+1)) + " - " + str(num.GetXaxis().GetBinUpEdge(b+1)))
-        #print (" num = " + str(n1)+" = " + str(tmpNumeratorTotalCount) + " - " + str(tmpNumeratorNoiseControlRegionCount) + " / " + str(noiseSelectionCRFraction) + " | den = " + str(n2) )
-        #print ("ratio = " + str(ratio) + " " + str(errLow) + " " + str(errHigh))
-        ytemp = ratio / timeWindowCutEfficiency #here we correct for the time window cut inefficiency
-        yerrlowtemp = errLow
-        yerrhightemp = errHigh
-      
-        #print ("x: " + str(xtemp) + " and y: " + str(ytemp))
+            #print (" done bin " + str(b) + " : " + str(num.GetXaxis().GetBinLowEdge(b+1)) + " - " + str(num.GetXaxis().GetBinUpEdge(b+1)))
+            #print (" num = " + str(n1)+" = " + str(tmpNumeratorTotalCount) + " - " + str(tmpNumeratorNoiseControlRegionCount) + " / " + str(noiseSelectionCRFraction) + " | den = " + str(n2) )
 
-        x.append(xtemp);  
-        y.append(ytemp); 
-        xErrLow.append(xerrlow);
-        xErrHigh.append(xerrhigh);
-        yErrLow.append(yerrlowtemp);
-        yErrHigh.append(yerrhightemp);
-    
     c = TCanvas("cv","cv",800,800)    
     c.SetLeftMargin(0.12)
 
-    #must convert list into array for TGraphAsymmErrors to work
-    xArr = array.array('f',x)
-    yArr = array.array('f',y)
-    xErrLowArr = array.array('f',xErrLow)
-    xErrHighArr = array.array('f',xErrHigh)
-    yErrLowArr = array.array('f',yErrLow)
-    yErrHighArr = array.array('f',yErrHigh)
-
-    effGraph = TGraphAsymmErrors(nbins, xArr, yArr, xErrLowArr, xErrHighArr, yErrLowArr,yErrHighArr );
+    #here we correct for the time window cut inefficiency
+    effGraph = MakeEfficiencyGraph(numeratorCounts, denominatorCounts, scale=1.0/timeWindowCutEfficiency, axis=num.GetXaxis())
     effGraph.Draw("APE")
     effGraph.SetTitle("")
     effGraph.GetXaxis().SetTitle(xAxisTitle)
@@ -392,65 +545,10 @@ def Plot1DEfficiencyWithBkgSubtraction( tree, num, den, axis, pixel, plotname, t
 ##########################
 def Plot1DEfficiency( num, den, plotname, topTitle, xAxisTitle, xAxisRangeLow, xAxisRangeHigh ) :
 
-    nbins = num.GetXaxis().GetNbins()
-    x = list()
-    y = list()
-    xErrLow = list()
-    xErrHigh = list()
-    yErrLow = list()
-    yErrHigh = list()
-
-
-    for b in range(1,nbins):
-
-        xtemp = num.GetXaxis().GetBinCenter(b+1)
-        xerrlow =  num.GetXaxis().GetBinCenter(b+1) - num.GetXaxis().GetBinLowEdge(b+1)  
-        xerrhigh = num.GetXaxis().GetBinUpEdge(b+1) - num.GetXaxis().GetBinCenter(b+1)  
-
-        ratio = 0
-        errLow = 0
-        errHigh = 0
-
-        n1 = int(num.GetBinContent(b+1));
-        n2 = int(den.GetBinContent(b+1));
-        #print ("numerator: " + str(n1) + " and denominator: " + str(n2))
-        if (n1 > n2):
-            n1 = n2;
-
-        if (n2>0) :
-          ratio = float(n1)/float(n2);
-          if (ratio > 1) :
-              ratio = 1;
-          errLow = ratio - TEfficiency.ClopperPearson(n2, n1, 0.68269, False);
-          errHigh = TEfficiency.ClopperPearson(n2, n1, 0.68269, True) - ratio;
-    
-
-        #print (" done bin " + str(b) + " " + str(xtemp) + " : " + str(n1) + "(" + str(num.GetBinContent(b+1)) + ")" + " / " + str(n2) + "(" + str(den.GetBinContent(b+1)) + ")" + " = " + str(ratio) + " " + str(errLow) + " " + str(errHigh))
-        ytemp = ratio
-        yerrlowtemp = errLow
-        yerrhightemp = errHigh
-      
-        #print ("x: " + str(xtemp) + " and y: " + str(ytemp))
-
-        x.append(xtemp);  
-        y.append(ytemp); 
-        xErrLow.append(xerrlow);
-        xErrHigh.append(xerrhigh);
-        yErrLow.append(yerrlowtemp);
-        yErrHigh.append(yerrhightemp);
-    
     c = TCanvas("cv","cv",800,800)    
     c.SetLeftMargin(0.12)
 
-    #must convert list into array for TGraphAsymmErrors to work
-    xArr = array.array('f',x)
-    yArr = array.array('f',y)
-    xErrLowArr = array.array('f',xErrLow)
-    xErrHighArr = array.array('f',xErrHigh)
-    yErrLowArr = array.array('f',yErrLow)
-    yErrHighArr = array.array('f',yErrHigh)
-
-    effGraph = TGraphAsymmErrors(nbins, xArr, yArr, xErrLowArr, xErrHighArr, yErrLowArr,yErrHighArr );
+    effGraph = MakeEfficiencyGraph(num, den)
     effGraph.Draw("APE")
     effGraph.SetTitle("")
     effGraph.GetXaxis().SetTitle(xAxisTitle)
@@ -472,65 +570,10 @@ def Plot1DEfficiency( num, den, plotname, topTitle, xAxisTitle, xAxisRangeLow, x
 
 def Make1DEfficiency( num, den, plotname, topTitle, xAxisTitle, xAxisRangeLow, xAxisRangeHigh, auto_titles=True, shift=0.0) :
 
-    nbins = num.GetXaxis().GetNbins()
-    x = list()
-    y = list()
-    xErrLow = list()
-    xErrHigh = list()
-    yErrLow = list()
-    yErrHigh = list()
-
-
-    for b in range(1,nbins):
-
-        xtemp = num.GetXaxis().GetBinCenter(b+1) - shift
-        xerrlow =  num.GetXaxis().GetBinCenter(b+1) - num.GetXaxis().GetBinLowEdge(b+1)  
-        xerrhigh = num.GetXaxis().GetBinUpEdge(b+1) - num.GetXaxis().GetBinCenter(b+1)  
-
-        ratio = 0
-        errLow = 0
-        errHigh = 0
-
-        n1 = int(num.GetBinContent(b+1))
-        n2 = int(den.GetBinContent(b+1))
-        #print ("numerator: " + str(n1) + " and denominator: " + str(n2))
-        if (n1 > n2):
-            n1 = n2
-
-        if (n2>0) :
-          ratio = float(n1)/float(n2);
-          if (ratio > 1) :
-              ratio = 1
-          errLow = ratio - TEfficiency.ClopperPearson(n2, n1, 0.68269, False)
-          errHigh = TEfficiency.ClopperPearson(n2, n1, 0.68269, True) - ratio
-    
-
-        #print (" done bin " + str(b) + " " + str(xtemp) + " : " + str(n1) + "(" + str(num.GetBinContent(b+1)) + ")" + " / " + str(n2) + "(" + str(den.GetBinContent(b+1)) + ")" + " = " + str(ratio) + " " + str(errLow) + " " + str(errHigh))
-        ytemp = ratio
-        yerrlowtemp = errLow
-        yerrhightemp = errHigh
-      
-        #print ("x: " + str(xtemp) + " and y: " + str(ytemp))
-
-        x.append(xtemp);  
-        y.append(ytemp); 
-        xErrLow.append(xerrlow);
-        xErrHigh.append(xerrhigh);
-        yErrLow.append(yerrlowtemp);
-        yErrHigh.append(yerrhightemp);
-    
     c = TCanvas("cv","cv",800,800)    
     c.SetLeftMargin(0.12)
 
-    #must convert list into array for TGraphAsymmErrors to work
-    xArr = array.array('f',x)
-    yArr = array.array('f',y)
-    xErrLowArr = array.array('f',xErrLow)
-    xErrHighArr = array.array('f',xErrHigh)
-    yErrLowArr = array.array('f',yErrLow)
-    yErrHighArr = array.array('f',yErrHigh)
-
-    effGraph = TGraphAsymmErrors(nbins-1, xArr, yArr, xErrLowArr, xErrHighArr, yErrLowArr,yErrHighArr );
+    effGraph = MakeEfficiencyGraph(num, den, shift=shift)
     effGraph.Draw("APE")
     if auto_titles:
         effGraph.SetTitle("")
@@ -555,28 +598,14 @@ def Make1DEfficiencyHist(num, den, plotname, topTitle="", xAxisTitle="", xAxisRa
     xmin, xmax = mf.get_shifted_limits(num, center)
     this_hist = TH1F("h%s"%plotname, topTitle, nbins, xmin, xmax)
 
-    for b in range(1,nbins+1):
-        xtemp = num.GetXaxis().GetBinCenter(b)
-        ratio = 0
+    n1 = ha.get_contents(num)[1:nbins+1].astype(int)
+    n2 = ha.get_contents(den)[1:nbins+1].astype(int)
+    # Define warning if bin gets numerator > denominator
+    for b in np.flatnonzero(n1 > n2) + 1:
+        warn_msg = "WARNING! Bin got numerator higher than denominator"
+        print("%s (bin %i)"%(warn_msg, b))
 
-        n1 = int(num.GetBinContent(b))
-        n2 = int(den.GetBinContent(b))
-        #print ("numerator: " + str(n1) + " and denominator: " + str(n2))
-        if (n1 > n2):
-            n1 = n2
-            # Define warning if bin gets numerator > denominator
-            warn_msg = "WARNING! Bin got numerator higher than denominator"
-            print("%s (bin %i)"%(warn_msg, b))
-
-        if (n2>0):
-            ratio = float(n1)/float(n2)
-            if (ratio > 1):
-                ratio = 1
-                # Define warning if bin gets efficicency higher than 1
-                warn_msg = "WARNING! Bin got efficiency higher than unit"
-                print("%s (bin %i)"%(warn_msg, b))
-        this_bin = num.GetXaxis().FindBin(xtemp)
-
-        this_hist.SetBinContent(this_bin, ratio)
+    ratio, _, _ = EfficiencyArrays(n1, n2)
+    ha.set_contents(this_hist, ratio)
 
     return this_hist
@@ -2,6 +2,9 @@ from ROOT import TFile,TTree,TCanvas,TH1F,TH2F,TLatex,TMath,TEfficiency,TGraphAs
 import os
 import EfficiencyUtils
 import langaus
+import numpy as np
+import histArrays
+import sliceFitter
 import optparse
 import time
 #from stripBox import getStripBox
@@ -18,51 +21,38 @@ marg = myStyle.GetMargin()
 
 
 def fill_th1_amp_vs_axis(h1_fill, hist2d, ffit):
-# Fill h1_fill histogram bin by bin from hist2d (which is amp vs axis)
+# Fill h1_fill histogram from hist2d (which is amp vs axis), fitting all bins at once
     last_bin = int(h1_fill.GetXaxis().GetNbins())
-    for i in range(1, last_bin + 1):
-
-        tmpHist = hist2d.ProjectionY("py",i,i)
-        myMean = tmpHist.GetMean()
-        myRMS = tmpHist.GetRMS()
-
-        value = myMean
-        nEvents = tmpHist.GetEntries()
-
-        # Make fit to obtain a better max amplitude value
-        if(nEvents > 50):
-            #use coarser bins when the signal is bigger
-            if (myMean > 50):
-                tmpHist.Rebin(5)
-            else:
-                tmpHist.Rebin(10)
-            
-            myLanGausFunction = ffit.fit(tmpHist, fitrange=(myMean-1*myRMS,myMean+3*myRMS))
-            myMPV = myLanGausFunction.GetParameter(1)
-            value = myMPV
-
-            # For Debugging
-            if (debugMode):
+
+    # Make fit to obtain a better max amplitude value; use coarser bins when
+    # the signal is bigger. Low populated bins are sent to zero (unwanted points)
+    slices = sliceFitter.Slices(hist2d)
+    values = np.zeros(last_bin)
+    for rebin, use_bins in [(5, slices.mean > 50), (10, slices.mean <= 50)]:
+        result = ffit.fit_slices(hist2d, nsigma=(1.0, 3.0), rebin_y=rebin, min_entries=50, columns=use_bins)
+        values[result.fitted[:last_bin]] = result.mpv[:last_bin][result.fitted[:last_bin]]
+
+        # For Debugging
+        if (debugMode):
+            for i in np.flatnonzero(result.fitted[:last_bin]) + 1:
+                i = int(i)
                 cv = TCanvas("cv_debug","cv",1000,800)
 
+                tmpHist = hist2d.ProjectionY("py",i,i)
+                tmpHist.Rebin(rebin)
+                myLanGausFunction = ffit.get_tf1(result, i-1)
                 tmpHist.Draw("hist")
                 myLanGausFunction.Draw("same")
                 this_var = h1_fill.GetName().replace("amplitude_vs_", "")
                 cv.SaveAs("%sq_PadCenter%s_%i.gif"%(outdir_q, this_var, i))
-                msg_info = "Bin: %i (MPV = %.3f)"%(i, myMPV)
+                msg_info = "Bin: %i (MPV = %.3f)"%(i, result.mpv[i-1])
                 print(msg_info)
                 cv.Close()
 
-        # Send to zero low populated bins (unwanted points)
-        else:
-            value = 0.0
-
-        # Avoid negative values (just in case)
-        if (value < 0.0):
-            value = 0.0
-
-        h1_fill.SetBinContent(i, value)
+    # Avoid negative values (just in case)
+    values[values < 0.0] = 0.0
 
+    histArrays.set_contents(h1_fill, values)
 
     return h1_fill
 
@@ -118,7 +108,7 @@ pitch  = sensor_Geometry['pitch']
 indices = mf.get_existing_indices(inputfile, "amplitude_vs_xy_channel")
 
 print("Setting up Langaus")
-fit = langaus.LanGausFit()
+fit = langaus.LanGausBatchFit()
 print("Setup Langaus")
 
 th1_amp_proj_vs = {"x": [], "y": []}
@@ -2,6 +2,9 @@ from ROOT import TFile,TTree,TCanvas,TH1F,TH2F,TLatex,TMath,TEfficiency,TGraphAs
 import os
 import EfficiencyUtils
 import langaus
+import numpy as np
+import histArrays
+import sliceFitter
 import optparse
 import time
 #from stripBox import getStripBox
@@ -80,7 +83,7 @@ for i in range(nStrips):
 # # list_amplitude_vs_x.append(amplitude_vs_x_channelall)
 
 print("Setting up Langaus")
-fit = langaus.LanGausFit()
+batch_fit = langaus.LanGausBatchFit()
 print("Setup Langaus")
 canvas = TCanvas("cv","cv",1000,800)
 
@@ -90,48 +93,23 @@ n_channels = 0
 #loop over X,Y bins
 for channel in range(nStrips):
     # print("Channel : " + str(channel))
-    maxAmp = 0
-    maxLoc=-999
-    for i in range(1, list_amplitude_vs_x[channel].GetXaxis().GetNbins()):
-        #print ("Bin " + str(i))
-
-        ##For Debugging
-        #if not (i==46 and j==5):
-        #    continue
-
-        tmpHist = list_th2_amplitude_vs_x[channel].ProjectionY("py",i,i)
-        myTotalEvents=tmpHist.Integral()
-        myMean = tmpHist.GetMean()
-        myRMS = tmpHist.GetRMS()
-        value = myMean            
-        nEvents = tmpHist.GetEntries()
-
-        if(nEvents > 50):
-            #use coarser bins when the signal is bigger
-            if (myMean > 50) :
-                tmpHist.Rebin(5)
-            else :
-                tmpHist.Rebin(10)
-            
-            myLanGausFunction = fit.fit(tmpHist, fitrange=(myMean-1*myRMS,myMean+3*myRMS))
-            myMPV = myLanGausFunction.GetParameter(1)
-            value = myMPV
-
-            ##For Debugging
-            #tmpHist.Draw("hist")
-            #myLanGausFunction.Draw("same")
-            #canvas.SaveAs(outdir+"q_"+str(i)+"_"+str(channel)+".gif")
-        else:
-            value = 0.0
-
-        value = value if(value>0.0) else 0.0
-
-        if value > maxAmp:
-            maxAmp = value
-            maxLoc = list_amplitude_vs_x[channel].GetXaxis().GetBinCenter(i)
-
-
-        list_amplitude_vs_x[channel].SetBinContent(i,value)
+    nbins = list_amplitude_vs_x[channel].GetXaxis().GetNbins()
+    th2 = list_th2_amplitude_vs_x[channel]
+
+    # Fit all X bins at once, using coarser bins when the signal is bigger
+    slices = sliceFitter.Slices(th2)
+    values = np.zeros(nbins)
+    for rebin, use_bins in [(5, slices.mean > 50), (10, slices.mean <= 50)]:
+        result = batch_fit.fit_slices(th2, nsigma=(1.0, 3.0), rebin_y=rebin, min_entries=50, columns=use_bins)
+        values[result.fitted[:nbins]] = result.mpv[:nbins][result.fitted[:nbins]]
+    # Last bin is not used
+    values[nbins-1:] = 0.0
+    values[values < 0.0] = 0.0
+
+    maxAmp = values.max()
+    maxLoc = list_amplitude_vs_x[channel].GetXaxis().GetBinCenter(int(np.argmax(values)) + 1) if maxAmp > 0 else -999
+
+    histArrays.set_contents(list_amplitude_vs_x[channel], values, mask=np.arange(nbins) < nbins-1)
     print("Channel : %i; Max Amplitude = %0.2f mV; x-val of max: %0.4f mm" %(channel,maxAmp,maxLoc))
     maxAmpChannels.append(maxAmp)
     if channel!=(len(list_amplitude_vs_x)-1):
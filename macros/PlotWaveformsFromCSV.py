@@ -3,7 +3,8 @@ import ROOT
 import optparse
 import os
 import myStyle
-import pandas as pd 
+import numpy as np
+import waveformStore as ws
 import matplotlib.pyplot as plt
 
 gROOT.SetBatch( True )
@@ -15,6 +16,8 @@ myStyle.ForceStyle()
 # Construct the argument parser
 parser = optparse.OptionParser("usage: %prog [options]\n")
 parser.add_option('-D', dest='Dataset', default = "", help="Dataset, which determines filepath")
+parser.add_option('-j', dest='workers', type='int', default = 0, help="Threads used to convert the CSV files (default: all cores)")
+parser.add_option('-r', dest='rebuild', action='store_true', default = False, help="Rebuild the binary waveform store from the CSV files")
 
 options, args = parser.parse_args()
 
@@ -28,13 +31,14 @@ max_save = 10
 FileSave = ['Strip-center'] # Although the region name is called near-strip in geometry and waveform names, the region is actually on the strip center, so the save name was changed
 
 for region_iter in range(len(regions)):
-    for waveform_iter in range(max_save):    
-        filename = outdir+"/waveforms_gabriele/waveform_"+regions[region_iter]+"_"+str(waveform_iter)+".csv"
-        df=pd.read_csv(filename, header=0)
-        last_three_columns = df.iloc[:, -7:]
-        min_row, min_column = last_three_columns.unstack().idxmin()
-        print(min_row, min_column)
-        plt.plot(df['Time[ns]'], df[min_row],label=str(waveform_iter+1))
+    time, waveforms, channels = ws.load(outdir+"/waveforms_gabriele", regions[region_iter], workers=options.workers, rebuild=options.rebuild)
+    n_plot = min(max_save, len(waveforms))
+    lead = ws.leadingChannel(waveforms[:n_plot])
+    for waveform_iter in range(n_plot):
+        print(channels[lead[waveform_iter]], int(np.argmin(waveforms[waveform_iter, lead[waveform_iter]])))
+    lines = plt.plot(time[:n_plot].T, waveforms[np.arange(n_plot), lead].T)
+    for waveform_iter, line in enumerate(lines):
+        line.set_label(str(waveform_iter+1))
     plt.title(str(max_save)+" leading channel waveforms from "+FileSave[region_iter])
     plt.xlabel("Time [ns]")
     plt.ylabel("Amplitude [mV]")
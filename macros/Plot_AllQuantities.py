@@ -24,7 +24,7 @@ gPad.SetBottomMargin(0.12)
 gPad.SetTicks(1,1)
 
 run = 0
-fit = langaus.LanGausFit()
+fit = langaus.LanGausBatchFit()
 
 # datasets = ["HPK_W2_3_2_50T_1P0_500P_50M_E240_180V", "HPK_W4_17_2_50T_1P0_500P_50M_C240_204V", "HPK_W5_17_2_50T_1P0_500P_50M_E600_190V", "HPK_W8_17_2_50T_1P0_500P_50M_C600_200V", "HPK_W8_18_2_50T_1P0_500P_100M_C600_208V", "HPK_W9_14_2_20T_1P0_500P_100M_E600_112V", "HPK_W9_15_2_20T_1P0_500P_50M_E600_114V", "HPK_W9_15_4_20T_0P5_500P_50M_E600_110V", "HPK_KOJI_50T_1P0_80P_60M_E240_190V", "HPK_KOJI_20T_1P0_80P_60M_E240_112V", "HPK_W5_1_1_50T_500x500_150M_E600_185V", "HPK_W9_22_3_20T_500x500_150M_E600_112V", "HPK_W9_23_3_20T_500x500_300M_E600_112V"]
 datasets = ["HPK_W11_22_3_20T_500x500_150M_C600_116V", "HPK_W9_22_3_20T_500x500_150M_E600_112V", "HPK_W8_1_1_50T_500x500_150M_C600_200V", "HPK_W5_1_1_50T_500x500_150M_E600_185V", "HPK_W9_23_3_20T_500x500_300M_E600_112V"]
@@ -36,18 +36,29 @@ qty = ["ampMax_MidGap", "risetime_MidGap", "charge_MidGap", "baselineRMS_MidGap"
 fit_var = [3,1,3,2,3,2] # 1 - stat mean, 2 - gauss fit, 3 - langauss fit
 
 for var in range(len(qty)):
+    # Get the quantity from all datasets (keep files open while using the histograms)
+    inputfiles, hists = [], []
+    for dataset in datasets:
+        inputfile = TFile("%s%s_Analyze.root"%(myStyle.getOutputDir(dataset),dataset))
+        inputfiles.append(inputfile)
+        hists.append(inputfile.Get(qty[var]))
+
+    # LanGauss fit of all datasets at once
+    if(fit_var[var]==3):
+        fitranges = [(h.GetMean()-1.5*h.GetRMS(), h.GetMean()+3*h.GetRMS()) for h in hists]
+        langaus_result = fit.fit_histograms(hists, fitranges)
+
     for iter in range(len(datasets)):
         dataset = datasets[iter]
         outdir=""
         outdir = myStyle.getOutputDir(dataset)
-        inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
 
         colors = myStyle.GetColors(True)
         sensor_Geometry = myStyle.GetGeometry(dataset)
         sensor = sensor_Geometry['sensor']
         pitch  = sensor_Geometry['pitch']
 
-        hist = inputfile.Get(qty[var])
+        hist = hists[iter]
         myMean = hist.GetMean()
         myRMS = hist.GetRMS()
         value = myMean
@@ -55,8 +66,8 @@ for var in range(len(qty)):
         hist.Draw("hist")
 
         if(fit_var[var]==3): # LanGauss fit
-            myLanGausFunction = fit.fit(hist, fitrange=(myMean-1.5*myRMS,myMean+3*myRMS))
-            myMPV = myLanGausFunction.GetParameter(1)
+            myLanGausFunction = fit.get_tf1(langaus_result, iter)
+            myMPV = langaus_result.mpv[iter]
             value = myMPV
             myLanGausFunction.Draw("same")
         elif(fit_var[var]==2): # Gaussian fit
@@ -9,6 +9,7 @@ import time
 import myStyle
 # from matplotlib import pyplot as plt
 import mySensorInfo as msi
+import resultsDB
 import math
 
 gROOT.SetBatch( True )
@@ -78,6 +79,17 @@ names = [("weighted2_timeDiff_tracker", 2), ("weighted2_jitter", 3),
          ("ampMax", 3), ("risetime", 1), ("baselineRMS", 2),
          ("charge", 3)]
 
+# Name of each quantity in the results database
+db_names = {"weighted2_timeDiff_tracker": "time_resolution", "weighted2_jitter": "jitter",
+            "ampMax": "amp_max", "risetime": "rise_time", "baselineRMS": "baseline_rms",
+            "charge": "charge"}
+# Construct the argument parser
+parser = optparse.OptionParser("usage: %prog [options]\n")
+parser.add_option('-n', dest='noDB', action='store_true', default = False, help="Do not write the values to the results database")
+options, args = parser.parse_args()
+
+db = None if options.noDB else resultsDB.ResultsDB()
+
 # Remove SaveAs output message
 ROOT.gErrorIgnoreLevel = ROOT.kWarning
 
@@ -92,6 +104,7 @@ for reg in regions:
 
         print("  Sensor: %s"%dataset)
         mySensorInfo_txt+= "\"%s\": ["%dataset
+        db_values = {}
         for var, ifit in names:
             hname = "%s_%s"%(var, reg)
             hist = inputfile.Get(hname)
@@ -128,6 +141,7 @@ for reg in regions:
                 gaussian.Draw("same")
 
             mySensorInfo_txt+= "%.2f, "%(value)
+            db_values[db_names[var]] = value
             hist.GetXaxis().SetTitle("Counts")
             hist.GetXaxis().SetTitle("Qty")
             canvas.SetRightMargin(0.18)
@@ -135,7 +149,12 @@ for reg in regions:
             canvas.SaveAs("%s%s_%s.gif"%(outdir, reg, var))
         mySensorInfo_txt = mySensorInfo_txt[:-2]
         mySensorInfo_txt+= "],\n"
+        if db:
+            db.record(dataset, db_values, reg, "default", inputs=[inputfile.GetName()])
     print("-"*45)
     print("Region: %s"%reg)
     print(mySensorInfo_txt)
     print("-"*45)
+if db:
+    print("Values saved in %s"%db.path)
+    db.close()
@@ -3,6 +3,7 @@ from ROOT import TFile,TTree,TCanvas,TH1F,TH2F,TH1D,TH2D,TLatex,TMath,\
 import os
 import optparse
 import myStyle
+import histCache as hc
 import langaus
 import myFunctions as mf
 
@@ -35,7 +36,7 @@ class HistoInfo:
         self.th2 = self.getTH2(outHistoName)
 
     def getTH3(self, f, name, sensor):
-        th3 = f.Get(name)
+        th3 = hc.get_shared(f, name)
 
         # # Rebin low statistics sensors
         # if sensor=="BNL2020":
@@ -49,7 +50,7 @@ class HistoInfo:
 
     def getTH2(self, hname):
         htitle = ";%s;%s;%s"%(self.xlabel, self.ylabel, self.zlabel)
-        th2 = self.th3.Project3D("yx").Clone(hname)
+        th2 = hc.project3d(self.f, self.inHistoName, "yx", new_name=hname)
         th2.SetTitle(htitle)
 
         th2.SetStats(0)
@@ -81,7 +82,7 @@ options, args = parser.parse_args()
 
 dataset = options.Dataset
 outdir = myStyle.getOutputDir(dataset)
-inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 
 sensor_Geometry = myStyle.GetGeometry(dataset)
 
@@ -4,6 +4,7 @@ import os
 from stripBox import getStripBox
 import optparse
 import myStyle
+import histCache as hc
 
 gROOT.SetBatch( True )
 gStyle.SetOptFit(1011)
@@ -26,7 +27,7 @@ class HistoInfo:
         self.th1 = self.getTH1(self.th2, outHistoName, self.shift())
 
     def getTH2(self, f, name):
-        th2 = f.Get(name)
+        th2 = hc.get(f, name)
         return th2
 
     def getTH1(self, th2, name, centerShift):
@@ -48,7 +49,7 @@ dataset = options.Dataset
 outdir=""
 if organized_mode: 
     outdir = myStyle.getOutputDir(dataset)
-    inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+    inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 else: 
     inputfile = TFile("../test/myoutputfile.root")
 
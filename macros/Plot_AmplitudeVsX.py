@@ -4,8 +4,11 @@ import os
 from stripBox import getStripBox
 import optparse
 import myStyle
+import histCache as hc
 import langaus
 import myFunctions as mf
+import numpy as np
+import histArrays as ha
 
 gROOT.SetBatch( True )
 gStyle.SetOptFit(1011)
@@ -31,8 +34,7 @@ class HistoInfo:
         self.th1 = self.getTH1(outHistoName)
 
     def getTH2(self, f, name, sensor, axis='zx'):
-        th3 = f.Get(name)
-        th2 = th3.Project3D(axis)
+        th2 = hc.project3d(f, name, axis)
 
         # # Rebin low statistics sensors
         # if sensor=="BNL2020":
@@ -75,7 +77,7 @@ options, args = parser.parse_args()
 
 dataset = options.Dataset
 outdir = myStyle.getOutputDir(dataset)
-inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 
 sensor_Geometry = myStyle.GetGeometry(dataset)
 
@@ -141,7 +143,7 @@ all_histoInfos = histoInfo_overall + histoInfo_channel
 nbins = all_histoInfos[0].th2.GetXaxis().GetNbins()
 
 midgap_bins = [all_histoInfos[0].th1.GetXaxis().FindBin(-0.25)]
-amplitude_distrib = TFile("%sMidGapAmp_distribution.root"%(outdir),"RECREATE")
+amplitude_distrib = TFile("%sMidGapAmp_distribution%s.root"%(outdir, "_tight" if is_tight else ""),"RECREATE")
 
 plot_xlimit = abs(inputfile.Get("stripBoxInfo00").GetMean(1) - position_center)
 if ("pad" not in dataset) and ("500x500" not in dataset):
@@ -149,70 +151,59 @@ if ("pad" not in dataset) and ("500x500" not in dataset):
 
 print("Setting up Langaus")
 fit = langaus.LanGausFit()
+batch_fit = langaus.LanGausBatchFit()
 print("Setup Langaus")
 
-# Loop over X bins
-for i in range(1, nbins+1):
-    for info_entry in all_histoInfos:
-        totalEvents = info_entry.th2.GetEntries()
-        tmpHist = info_entry.th2.ProjectionY("py",i,i)
-        myRMS = tmpHist.GetRMS()
-        myMean = tmpHist.GetMean()
-        nEvents = tmpHist.GetEntries()
-        value = myMean
-
-        # Define minimum of bin's entries to be fitted
-        minEvtsCut = 0.5*totalEvents/nbins
-        if("20T" in dataset):
-            minEvtsCut = 0.3*totalEvents/nbins
-        if(is_tight):
-            minEvtsCut = 0
-        if (i == 1):
-            msg_nentries = "%s: nEvents > %.2f "%(info_entry.inHistoName, minEvtsCut)
-            msg_nentries+= "(Total events: %i)"%(totalEvents)
-            print(msg_nentries)
-
-        #Do fit
-        if(nEvents > minEvtsCut):
+# Fit all X bins of each histogram at once
+for info_entry in all_histoInfos:
+    totalEvents = info_entry.th2.GetEntries()
+
+    # Define minimum of bin's entries to be fitted
+    minEvtsCut = 0.5*totalEvents/nbins
+    if("20T" in dataset):
+        minEvtsCut = 0.3*totalEvents/nbins
+    if(is_tight):
+        minEvtsCut = 0
+    msg_nentries = "%s: nEvents > %.2f "%(info_entry.inHistoName, minEvtsCut)
+    msg_nentries+= "(Total events: %i)"%(totalEvents)
+    print(msg_nentries)
+
+    result = batch_fit.fit_slices(info_entry.th2, nsigma=(1.5, 3.0), rebin_y=2, min_entries=minEvtsCut)
+    values = np.where(result.fitted, result.mpv, 0.0)
+    values[values < 0.0] = 0.0
+
+    for i in np.flatnonzero(result.fitted) + 1:
+        i = int(i)
+        # For Debugging
+        if (debugMode):
+            tmpHist = info_entry.th2.ProjectionY("py",i,i)
             tmpHist.Rebin(2)
-            # if (myMean > 50):
-            #     tmpHist.Rebin(5)
-            # else:
-            #     tmpHist.Rebin(10)
-
-            myLanGausFunction = fit.fit(tmpHist, fitrange=(myMean-1.5*myRMS, myMean+3*myRMS))
-            myMPV = myLanGausFunction.GetParameter(1)
-            value = myMPV
-
-            # For Debugging
-            if (debugMode):
-                tmpHist.Draw("hist")
-                myLanGausFunction.Draw("same")
-                canvas.SaveAs("%sq_%s%i.gif"%(outdir_q, info_entry.outHistoName, i))
-                bin_center = info_entry.th1.GetXaxis().GetBinCenter(i)
-                msg_amp = "Bin: %i (x center = %.3f)"%(i, bin_center)
-                # msg_amp+= " -> Amplitude: %.3f mV"%(value)
-                msg_amp+= " -> Entries: %.3f"%(tmpHist.GetEntries())
-                print(msg_amp)
-            if(i in midgap_bins and info_entry.outHistoName == "Amplitude_ch04"):
-                max_bin = tmpHist.GetMaximumBin()
-                max_count = tmpHist.GetBinContent(max_bin)
-                tmpHist.Scale(1.0 / max_count)
-                # tmpHist.Scale(1/tmpHist.Integral())
-                tmpHist.GetXaxis().SetRangeUser(0,200)
-                myLanGausFunction2 = fit.fit(tmpHist, fitrange=(myMean-1.5*myRMS, myMean+3*myRMS))
-                tmpHist.Write()
-                myLanGausFunction2.Write()
-        else:
-            value = 0.0
-
-        value = value if (value>0.0) else 0.0
-
-        # Fill only when inside limits
-        if not mf.is_inside_limits(i, info_entry.th1, xmax=plot_xlimit):
-            continue
-
-        info_entry.th1.SetBinContent(i, value)
+            myLanGausFunction = batch_fit.get_tf1(result, i-1)
+            tmpHist.Draw("hist")
+            myLanGausFunction.Draw("same")
+            canvas.SaveAs("%sq_%s%i.gif"%(outdir_q, info_entry.outHistoName, i))
+            bin_center = info_entry.th1.GetXaxis().GetBinCenter(i)
+            msg_amp = "Bin: %i (x center = %.3f)"%(i, bin_center)
+            # msg_amp+= " -> Amplitude: %.3f mV"%(value)
+            msg_amp+= " -> Entries: %.3f"%(tmpHist.GetEntries())
+            print(msg_amp)
+        if(i in midgap_bins and info_entry.outHistoName == "Amplitude_ch04"):
+            tmpHist = info_entry.th2.ProjectionY("py",i,i)
+            myMean = tmpHist.GetMean()
+            myRMS = tmpHist.GetRMS()
+            tmpHist.Rebin(2)
+            max_bin = tmpHist.GetMaximumBin()
+            max_count = tmpHist.GetBinContent(max_bin)
+            tmpHist.Scale(1.0 / max_count)
+            # tmpHist.Scale(1/tmpHist.Integral())
+            tmpHist.GetXaxis().SetRangeUser(0,200)
+            myLanGausFunction2 = fit.fit(tmpHist, fitrange=(myMean-1.5*myRMS, myMean+3*myRMS))
+            tmpHist.Write()
+            myLanGausFunction2.Write()
+
+    # Fill only when inside limits
+    inside = [mf.is_inside_limits(i, info_entry.th1, xmax=plot_xlimit) for i in range(1, nbins+1)]
+    ha.set_contents(info_entry.th1, values, mask=inside)
 
 amplitude_distrib.Close()
 # Define output file
@@ -7,6 +7,7 @@ import math
 from array import array
 import myFunctions as mf
 import mySensorInfo as msi
+import resultsDB
 
 gROOT.SetBatch( True )
 gStyle.SetOptFit(1011)
@@ -47,6 +48,10 @@ sensors = [
     "HPK_50um_500x500um_2x2pad_E600_FNAL_190V",
 ]
 
+parser = optparse.OptionParser("usage: %prog [options]\n")
+parser.add_option('-d', '--db', dest='useDB', action='store_true', default = False, help="Take the values from the results database instead of mySensorInfo.py")
+options, args = parser.parse_args()
+
 variables = ["time_resolution", "jitter", "amp_max", "risetime", "baseline"]
 y_label = ["Time resolution [ps]", "Jitter [ps]", "Amplitude peak [mV]",
            "Risetime [ps] (10 to 90%)", "Baseline RMS [mV]"]
@@ -59,6 +64,8 @@ outdir = myStyle.GetPlotsDir((myStyle.getOutputDir("Compare")), "")
 outdir = myStyle.GetPlotsDir(outdir, "Bias_scan_orig/")
 
 geometry_all = msi.sensorsGeom2023_biasScan
+if options.useDB:
+    db_table = resultsDB.ResultsDB().table(["time_resolution", "jitter", "amp_max", "rise_time", "baseline_rms", "charge"], "Overall", "default")
 
 
 canvas = TCanvas("cv","cv",1000,800)
@@ -85,7 +92,13 @@ for i, var in enumerate(variables):
     ymax = 0.0
     for dataset in datasets:
         sensor_geometry = geometry_all[dataset]
-        sensor_info = msi.variableInfo2023_biasScan[dataset]
+        db_values = db_table.get(resultsDB.datasetName(*resultsDB.splitDataset(dataset))) if options.useDB else None
+        if db_values:
+            sensor_info = resultsDB.withAliases(db_values)
+        else:
+            if options.useDB:
+                print(" > %s not in the results database, using mySensorInfo.py values"%dataset)
+            sensor_info = msi.variableInfo2023_biasScan[dataset]
         for j, thickness in enumerate(subsets):
             if thickness in dataset:
                 idx = j
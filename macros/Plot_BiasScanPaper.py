@@ -3,6 +3,7 @@ import ROOT
 import optparse
 from stripBox import getStripBox
 import myStyle
+import histCache as hc
 import math
 import time
 import langaus
@@ -45,7 +46,7 @@ class HistoInfo:
 
     def getTH2(self, f, name):
         #print(name)
-        th2 = f.Get(name)
+        th2 = hc.get(f, name)
         if self.rebin: th2.RebinX(int(self.rebin))
         return th2
 
@@ -4,6 +4,7 @@ import os
 from stripBox import getStripBox
 import optparse
 import myStyle
+import histCache as hc
 import langaus
 import myFunctions as mf
 
@@ -31,8 +32,7 @@ class HistoInfo:
         self.th1 = self.getTH1(outHistoName)
 
     def getTH2(self, f, name, sensor, axis='zx'):
-        th3 = f.Get(name)
-        th2 = th3.Project3D(axis)
+        th2 = hc.project3d(f, name, axis)
 
         # # Rebin low statistics sensors
         # if sensor=="BNL2020":
@@ -75,7 +75,7 @@ options, args = parser.parse_args()
 
 dataset = options.Dataset
 outdir = myStyle.getOutputDir(dataset)
-inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 
 sensor_Geometry = myStyle.GetGeometry(dataset)
 
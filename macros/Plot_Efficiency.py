@@ -88,6 +88,7 @@ for hname, outname in list_hnames2d:
     if not indices:
         indices = mf.get_existing_indices(inputfile, "efficiency_vs_xy_numerator_channel")
 
+    list_th2_channel, list_outpath_ch, list_htitle_ch = [], [], []
     for idx in indices:
         hname_ch = "%s_channel%s"%(hname, idx)
         outpath_ch = "%s-Ch%s"%(outpath, idx)
@@ -96,8 +97,15 @@ for hname, outname in list_hnames2d:
         th2_efficiency = inputfile.Get(hname_ch)
         if not th2_efficiency:
             continue
+        list_th2_channel.append(th2_efficiency)
+        list_outpath_ch.append(outpath_ch)
+        list_htitle_ch.append(htitle_ch)
+
+    # Efficiency maps of all channels at once
+    list_ratio_ch = EfficiencyUtils.Make2DEfficiencyHists(list_th2_channel, th2_efficiency_denominator)
+    for th2_efficiency, ratio, outpath_ch, htitle_ch in zip(list_th2_channel, list_ratio_ch, list_outpath_ch, list_htitle_ch):
         EfficiencyUtils.Plot2DEfficiency(th2_efficiency, th2_efficiency_denominator, outpath_ch, htitle_ch,
-                                         "X [mm]", xmin, xmax, "Y [mm]", -20, 20, 0.0, 1.0)
+                                         "X [mm]", xmin, xmax, "Y [mm]", -20, 20, 0.0, 1.0, ratio=ratio)
         list_th2_efficiency_channel.append(th2_efficiency)
 
 # Define output file
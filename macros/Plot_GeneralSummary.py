@@ -2,6 +2,8 @@ from ROOT import TFile, TTree, TCanvas, TH1F, TH2F, TProfile, TLatex, TMath, TEf
 import ROOT
 import numpy as np
 import myStyle
+import mySensorInfo as msi
+import resultsDB
 import optparse
 import os
 
@@ -38,24 +40,11 @@ def shiftOverlappingPoints(x_values, x_offset):
 def GetSensorList(sensorDic, conditions):
 
     returnList = []
-    for sensor, geometry in sensorDic.items():
-
-        counter = 0
-        if sensor[-1] == "V":  # remove same sensors with different BV
+    # Indexed query on the sensor registry, restricted to the sensors of sensorDic
+    for sensor in msi.registry.query(**conditions):
+        if sensor not in sensorDic or sensor[-1] == "V":  # remove same sensors with different BV
             continue
-
-        for condition, value in conditions.items():
-
-            if condition == "manufacturer":
-                if value in sensor:
-                    counter += 1
-                continue
-
-            if geometry[condition] == value:
-                counter += 1
-
-        if counter == len(conditions):
-            returnList.append(sensor + "_" + str(geometry["BV"]) + "V")
+        returnList.append(sensor + "_" + str(sensorDic[sensor]["BV"]) + "V")
 
     if len(returnList) == 0:
         print("The list is empty, there is no sensor with that geometry")
@@ -154,6 +143,8 @@ parser.add_option('-e', "--variableError", dest='variableError',
                   default="", help="variable of the y axes")
 parser.add_option('-g', "--gvariable", dest='gvariable',
                   default="", help="geometical variable(x axis)")
+parser.add_option('-d', "--db", dest='useDB', action='store_true', default=False,
+                  help="Take the values from the results database instead of mySensorInfo.py")
 options, args = parser.parse_args()
 
 conditions = {"length": 10.0, "manufacturer": "HPK", "pitch": 500}
@@ -166,7 +157,7 @@ y_variable_error_name = options.variableError
 # y_variable_name = "efficiency_twoStrip"
 # y_variable_error_name = "efficiency_twoStrip_error"
 
-# list_of_sensors = GetSensorList(myStyle.sensorsGeom2023, conditions)
+# list_of_sensors = GetSensorList(msi.sensorsGeom2023, conditions)
 list_of_sensors = [
     "HPK_50um_500x500um_2x2pad_E600_FNAL_190V",
     "HPK_30um_500x500um_2x2pad_E600_FNAL_140V",
@@ -185,9 +176,16 @@ positionres_weighted_StdDev = []
 positionres_weighteduncert = [0.5]*len(list_of_sensors)
 
 
+# All sensors in one query to the results database
+db_resolutions = resultsDB.ResultsDB().all_resolutions() if options.useDB else {}
+
 for name in list_of_sensors:
     geometry_variable.append(myStyle.GetGeometry(name)[geometry_variable_name])
-    sensor_info = myStyle.GetResolutions(name)
+    sensor_info = db_resolutions.get(resultsDB.datasetName(*resultsDB.splitDataset(name))) if options.useDB else None
+    if not sensor_info:
+        if options.useDB:
+            print(" > %s not in the results database, using mySensorInfo.py values"%name)
+        sensor_info = myStyle.GetResolutions(name)
 
     y_variable = sensor_info[y_variable_name]
     y_variable_metal = sensor_info[y_variable_name + "_m"]
@@ -2,6 +2,7 @@ from ROOT import TFile,TTree,TCanvas,TH1F,TH2F,TLatex,TMath,TEfficiency,TGraphAs
 import os
 import optparse
 import myStyle
+import histCache as hc
 
 gROOT.SetBatch( True )
 gStyle.SetOptFit(1011)
@@ -13,15 +14,15 @@ class HistoInfo:
         self.f = f
         self.outHistoName = outHistoName
         self.th3 = self.getTH3(f, inHistoName)
-        self.th2 = self.getTH2(self.th3, outHistoName)
+        self.th2 = self.getTH2(outHistoName)
         self.zmin = zmin
         self.zmax = zmax
 
     def getTH3(self, f, name):
-        return f.Get(name)        
+        return hc.get_shared(f, name)        
 
-    def getTH2(self, th3, name):
-        return th3.Project3D("yx").Clone(name)
+    def getTH2(self, name):
+        return hc.project3d(self.f, self.inHistoName, "yx", new_name=name)
 
 parser = optparse.OptionParser("usage: %prog [options]\n")
 parser.add_option('-D', dest='Dataset', default = "", help="Dataset, which determines filepath")
@@ -36,7 +37,7 @@ zmax = float(options.zmax)
 outdir=""
 if organized_mode: 
     outdir = myStyle.getOutputDir(dataset)
-    inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+    inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 else: 
     inputfile = TFile("../test/myoutputfile.root")
 
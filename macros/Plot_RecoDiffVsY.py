@@ -4,6 +4,7 @@ import os
 from stripBox import getStripBox
 import optparse
 import myStyle
+import histCache as hc
 import math
 
 gROOT.SetBatch( True )
@@ -29,7 +30,7 @@ class HistoInfo:
         # self.sensor = sensor
 
     def getTH2(self, f, name, sensor):
-        th2 = f.Get(name)
+        th2 = hc.get(f, name)
         return th2
 
     def getTH1(self, th2, name, centerShift, fine_value):
@@ -57,7 +58,7 @@ dataset = options.Dataset
 outdir=""
 if organized_mode: 
     outdir = myStyle.getOutputDir(dataset)
-    inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+    inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 else: 
     inputfile = TFile("../test/myoutputfile.root")
 
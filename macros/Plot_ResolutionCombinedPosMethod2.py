@@ -4,6 +4,7 @@ import os
 from stripBox import getStripBox
 import optparse
 import myStyle
+import histCache as hc
 import math
 from array import array
 import myFunctions as mf
@@ -42,7 +43,7 @@ class HistoInfo:
         self.th1 = self.getTH1(outHistoName)
 
     def getTH2(self, f, name, sensor):
-        th2 = f.Get(name)
+        th2 = hc.get(f, name)
 
         return th2
 
@@ -75,7 +76,7 @@ options, args = parser.parse_args()
 dataset = options.Dataset
 outdir = myStyle.getOutputDir(dataset)
 outdirtemp=outdir
-inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 
 sensor_Geometry = myStyle.GetGeometry(dataset)
 
@@ -3,8 +3,12 @@ import os
 import optparse
 from stripBox import getStripBox
 import myStyle
+import histCache as hc
 import math
 import myFunctions as mf
+import numpy as np
+import histArrays as ha
+import sliceFitter as sf
 
 gROOT.SetBatch( True )
 gStyle.SetOptFit(1011)
@@ -36,8 +40,7 @@ class HistoInfo:
 
     def getTH2(self, f, name, sensor):
         axis = "zx" if (self.direction == "x") else "zy"
-        th3 = f.Get(name)
-        th2 = th3.Project3D(axis)
+        th2 = hc.project3d(f, name, axis)
 
         # Rebin low statistics sensors
         if sensor=="BNL2020":
@@ -78,12 +81,13 @@ parser.add_option('-g', '--hot', dest='hotspot', action='store_true', default =
 parser.add_option('-t', dest='useTight', action='store_true', default = False, help="Use tight cut for pass")
 parser.add_option('-n', dest='useNoSum', action='store_true', default = False, help="Use no sum column")
 parser.add_option('-a', dest='plotAll', action='store_true', default = False, help="Plot no delay correction and LGAD correction too")
+parser.add_option('-c', '--compareFit', dest='compareFit', action='store_true', default = False, help="Compare batch fit with per-bin TF1 fits")
 
 options, args = parser.parse_args()
 dataset = options.Dataset
 
 outdir = myStyle.getOutputDir(dataset)
-inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 
 sensor_Geometry = myStyle.GetGeometry(dataset)
 
@@ -103,6 +107,7 @@ debugMode = options.debugMode
 is_tight = options.useTight
 noSum = options.useNoSum
 show_all = options.plotAll
+compareFit = options.compareFit
 is_hotspot = options.hotspot
 
 use_center_y = options.centerAlongY
@@ -163,86 +168,60 @@ if ("pad" not in dataset) and ("500x500" not in dataset):
     plot_xlimit-= pitch/2.
 if ("500x500" in dataset):
     plot_xlimit+= strip_width/2.
-# Loop over X bins
-for i in range(1, nbins+1):
-    for info_entry in all_histoInfos:
-        totalEvents = info_entry.th2.GetEntries()
-        # TODO: Add support for px projection in case of use of use_center_y option
-        tmpHist = info_entry.th2.ProjectionY("py",i,i)
-        myRMS = tmpHist.GetRMS()
-        myMean = tmpHist.GetMean()
-        nEvents = tmpHist.GetEntries()
-        fitlow = myMean - 1.5*myRMS
-        fithigh = myMean + 1.5*myRMS
-        value = myRMS
-        error = 0.0
-        valueMean = myMean
-        errorMean = 0.0
-
-        # Define minimum of bin's entries to be fitted
-        minEvtsCut = totalEvents/nbins
-        if ("HPK_50um" in dataset):
-            minEvtsCut = 0.7*minEvtsCut
-        if("20T" in dataset):
-            minEvtsCut = 0.3*totalEvents/nbins
-        if(sensor == "HPK_W8_1_1_50T_500x500_150M_C600"):
-            minEvtsCut = 400
-        # if(is_tight):
-        #     minEvtsCut = 0
-
-        if (i == 1):
-            msg_nentries = "%s: nEvents > %.2f "%(info_entry.inHistoName, minEvtsCut)
-            msg_nentries+= "(Total events: %i)"%(totalEvents)
-            print(msg_nentries)
-
-        #Do fit 
-        if(nEvents > minEvtsCut):
+# Fit all X bins of each histogram at once
+for info_entry in all_histoInfos:
+    totalEvents = info_entry.th2.GetEntries()
+
+    # Define minimum of bin's entries to be fitted
+    minEvtsCut = totalEvents/nbins
+    if ("HPK_50um" in dataset):
+        minEvtsCut = 0.7*minEvtsCut
+    if("20T" in dataset):
+        minEvtsCut = 0.3*totalEvents/nbins
+    if(sensor == "HPK_W8_1_1_50T_500x500_150M_C600"):
+        minEvtsCut = 400
+    # if(is_tight):
+    #     minEvtsCut = 0
+
+    msg_nentries = "%s: nEvents > %.2f "%(info_entry.inHistoName, minEvtsCut)
+    msg_nentries+= "(Total events: %i)"%(totalEvents)
+    print(msg_nentries)
+
+    # TODO: Add support for px projection in case of use of use_center_y option
+    fit = sf.fit_gaus_slices(info_entry.th2, nsigma=1.5, rebin_y=2, min_entries=minEvtsCut)
+    if compareFit:
+        sf.compare_with_tf1(info_entry.th2, fit, rebin_y=2, name=info_entry.inHistoName)
+
+    valueRaw = 1000.0*fit.sigma
+    errorRaw = 1000.0*fit.sigma_error
+    value = valueRaw.copy()
+    error = errorRaw.copy()
+
+    # Removing telescope contribution
+    if rm_tracker:
+        has_value = value > 0.0
+        value[has_value] = np.sqrt(np.clip(value[has_value]**2 - res_photek**2, 0.0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            error = np.where(value > 0.0, errorRaw*(valueRaw/value), 0.0)
+
+    # For Debugging
+    if (debugMode):
+        for i in np.flatnonzero(fit.fitted) + 1:
+            tmpHist = info_entry.th2.ProjectionY("py",int(i),int(i))
             tmpHist.Rebin(2)
-
-            fit = TF1('fit','gaus',fitlow,fithigh)
-            tmpHist.Fit(fit,"Q", "", fitlow, fithigh)
-            myFitMean = fit.GetParameter(1)
-            myFitMeanError = fit.GetParError(1)
-            valueMean = abs(1000.0*myFitMean)
-            errorMean = 1000.0*myFitMeanError
-
-            mySigma = fit.GetParameter(2)
-            mySigmaError = fit.GetParError(2)
-            valueRaw = 1000.0*mySigma
-            errorRaw = 1000.0*mySigmaError
-
-            value = valueRaw
-            error  = errorRaw
-
-            # For Debugging
-            if (debugMode):
-                tmpHist.Draw("hist")
-                fit.Draw("same")
-                canvas.SaveAs("%sq_%s%i.gif"%(outdir_q, info_entry.outHistoName, i))
-                bin_center = info_entry.th1.GetXaxis().GetBinCenter(i)
-                msg_binres = "Bin: %i (x center = %.3f)"%(i, bin_center)
-                # msg_binres+= " -> Resolution: %.3f +/- %.3f"%(value, error)
-                msg_binres+= " -> Entries: %.3f"%(tmpHist.GetEntries())
-                print(msg_binres)
-        else:
-            valueMean = 0.0
-            value = 0.0
-            valueRaw = 0.0
-
-        # Removing telescope contribution
-        if rm_tracker and (value > 0.0):
-            value = math.sqrt((value*value) - (res_photek*res_photek))
-            error  = errorRaw*(valueRaw/value)
-
-        # Fill only when inside limits
-        if not mf.is_inside_limits(i, info_entry.th1, xmax=plot_xlimit):
-            continue
-
-        info_entry.th1.SetBinContent(i, value)
-        info_entry.th1.SetBinError(i, error)
-
-        # info_entry.th1Mean.SetBinContent(i,valueMean)
-        # info_entry.th1Mean.SetBinError(i,errorMean)
+            tmpFit = sf.get_tf1(fit, i)
+            tmpHist.Draw("hist")
+            tmpFit.Draw("same")
+            canvas.SaveAs("%sq_%s%i.gif"%(outdir_q, info_entry.outHistoName, i))
+            bin_center = info_entry.th1.GetXaxis().GetBinCenter(int(i))
+            msg_binres = "Bin: %i (x center = %.3f)"%(i, bin_center)
+            # msg_binres+= " -> Resolution: %.3f +/- %.3f"%(value, error)
+            msg_binres+= " -> Entries: %.3f"%(tmpHist.GetEntries())
+            print(msg_binres)
+
+    # Fill only when inside limits
+    inside = [mf.is_inside_limits(i, info_entry.th1, xmax=plot_xlimit) for i in range(1, nbins+1)]
+    ha.set_contents(info_entry.th1, value, error, mask=inside)
 
 # Define output file
 output_path = "%sTimeDiffVs%s"%(outdir, direction.upper())
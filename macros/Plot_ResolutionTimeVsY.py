@@ -3,6 +3,7 @@ import os
 import optparse
 from stripBox import getStripBox
 import myStyle
+import histCache as hc
 import math
 import myFunctions as mf
 
@@ -30,8 +31,7 @@ class HistoInfo:
         self.th1 = self.getTH1(outHistoName)
 
     def getTH2(self, f, name, sensor, axis='zy'):
-        th3 = f.Get(name)
-        th2 = th3.Project3D(axis)
+        th2 = hc.project3d(f, name, axis)
 
         # Rebin low statistics sensors
         if sensor=="BNL2020":
@@ -77,7 +77,7 @@ use_center_y = options.centerAlongY
 dataset = options.Dataset
 
 outdir = myStyle.getOutputDir(dataset)
-inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 
 sensor_Geometry = myStyle.GetGeometry(dataset)
 
@@ -4,6 +4,7 @@ import os
 from stripBox import getStripBox
 import optparse
 import myStyle
+import histCache as hc
 import math
 from array import array
 import myFunctions as mf
@@ -46,7 +47,7 @@ class HistoInfo:
         self.th1 = self.getTH1(outHistoName)
 
     def getTH2(self, f, name, sensor):
-        th2 = f.Get(name)
+        th2 = hc.get(f, name)
 
         return th2
 
@@ -79,7 +80,7 @@ options, args = parser.parse_args()
 
 dataset = options.Dataset
 outdir = myStyle.getOutputDir(dataset)
-inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 
 sensor_Geometry = myStyle.GetGeometry(dataset)
 
@@ -3,6 +3,7 @@ import langaus
 from stripBox import getStripBox
 import optparse
 import myStyle
+import histCache as hc
 import myFunctions as mf
 import os
 import numpy as np
@@ -36,8 +37,7 @@ class HistoInfo:
         self.th1 = self.getTH1(outHistoName)
 
     def getTH2(self, f, name, sensor, axis='zx'):
-        th3 = f.Get(name)
-        th2 = th3.Project3D(axis)
+        th2 = hc.project3d(f, name, axis)
 
         return th2
 
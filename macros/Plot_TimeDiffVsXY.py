@@ -2,6 +2,7 @@ from ROOT import TFile,TCutG,TTree,TCanvas,TH1F,TH2F,TLatex,TMath,TEfficiency,TG
 import os
 import optparse
 import myStyle
+import histCache as hc
 import math
 
 gROOT.SetBatch( True )
@@ -18,13 +19,13 @@ class HistoInfo:
         self.f = f
         self.outHistoName = outHistoName
         self.th3 = self.getTH3(f, inHistoName)
-        self.th2 = self.getTH2(self.th3, outHistoName)
+        self.th2 = self.getTH2(outHistoName)
 
     def getTH3(self, f, name):
-        return f.Get(name)        
+        return hc.get_shared(f, name)        
 
-    def getTH2(self, th3, name):
-        return th3.Project3D("yx").Clone(name)
+    def getTH2(self, name):
+        return hc.project3d(self.f, self.inHistoName, "yx", new_name=name)
 
 
 parser = optparse.OptionParser("usage: %prog [options]\n")
@@ -42,7 +43,7 @@ debugMode = options.debugMode
 outdir=""
 if organized_mode: 
     outdir = myStyle.getOutputDir(dataset)
-    inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+    inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 else: 
     inputfile = TFile("../test/myoutputfile.root")
 
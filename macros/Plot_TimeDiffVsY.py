@@ -2,6 +2,7 @@ from ROOT import TFile,TTree,TCanvas,TH1D,TH1F,TH2F,TLatex,TMath,TColor,TLegend,
 import os
 import optparse
 import myStyle
+import histCache as hc
 
 gROOT.SetBatch( True )
 gStyle.SetOptFit(1011)
@@ -22,8 +23,7 @@ class HistoInfo:
         # self.th1Mean = self.getTH1(self.th2, outHistoName)
 
     def getTH2(self, f, name, axis='zy'):
-        th3 = f.Get(name)
-        th2 = th3.Project3D(axis)
+        th2 = hc.project3d(f, name, axis)
         #if sensor=="BNL2020": th2.RebinX(5)
         #elif sensor=="BNL2021": th2.RebinX(10)
         return th2
@@ -45,7 +45,7 @@ dataset = options.Dataset
 outdir=""
 if organized_mode: 
     outdir = myStyle.getOutputDir(dataset)
-    inputfile = TFile("%s%s_Analyze.root"%(outdir,dataset))
+    inputfile = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
 else:
     inputfile = TFile("../test/myoutputfile.root")
 
@@ -3,6 +3,7 @@ import ROOT
 import os
 from stripBox import getStripBox,getStripBoxY
 import optparse
+import histCache as hc
 ROOT.gROOT.SetBatch(True)
 
 
@@ -20,7 +21,7 @@ class HistoInfo:
         self.th1 = self.getTH1(self.th2, outHistoName)
 
     def getTH2(self, f, name):
-        th2 = f.Get(name)
+        th2 = hc.get(f, name)
         return th2
 
     def getTH1(self, th2, name):
@@ -3,6 +3,7 @@ import optparse
 import myStyle
 import math
 import myFunctions as mf
+import resultsDB
 
 ROOT.gROOT.SetBatch(True)
 
@@ -48,6 +49,7 @@ def same_onestrip_info(name_dataset, new_info):
 parser = optparse.OptionParser("usage: %prog [options]\n")
 parser.add_option('-D', dest='Dataset', default = "", help="Dataset, which determines filepath")
 parser.add_option('-A', dest='AllRegions', action='store_true', default = False, help="Get results for all regions")
+parser.add_option('-n', dest='noDB', action='store_true', default = False, help="Do not write the values to the results database")
 options, args = parser.parse_args()
 
 dataset = options.Dataset
@@ -77,6 +79,11 @@ inputfile_res1d_tight = ROOT.TFile("%sResolutionValues_tight.root"%(outdir_res1d
 outdir_efficiency = "%s/Cutflow/"%(outdir)
 inputfile_eff = ROOT.TFile("%sPlot_cutflow.root"%(outdir_efficiency), "READ")
 
+# Results database
+# ----------------
+db = None if options.noDB else resultsDB.ResultsDB()
+db_inputs = [inputfile_res1d.GetName(), inputfile_res1d_tight.GetName(), inputfile_eff.GetName()]
+
 # Order: <one strip reco RMS [um]>, <two strip reco fit [um]>, <time [ps]>,
 # <efficiency one strip>, <efficiency two strip>
 
@@ -114,6 +121,8 @@ for reg in regions:
         if msg:
             info_str+= " --> (!!) Differences: %s (!!)"%msg
         print(info_str)
+        if db:
+            db.record_channels(dataset, "res_one_strip", info_channels, "Overall", "default", db_inputs)
 
     info = {}
     print(" > %s region:"%(reg))
@@ -164,6 +173,14 @@ for reg in regions:
         info_str+= " (!!) Update mySensorInfo.py --> %s (!!)"%(info_to_update)
     print(info_str)
 
+    # Stored with the tracker contribution, as in mySensorInfo.py. Position
+    # resolutions of every region come from the tight histograms
+    if db:
+        db_region = "Overall" if (reg == "Overall_tight") else reg
+        db_names = {"one_res": "res_one_strip", "two_res": "res_two_strip", "time_res": "time_resolution",
+                    "one_eff": "efficiency_one_strip", "two_eff": "efficiency_two_strip"}
+        db.record(dataset, dict((db_names[k], v) for k, v in info.items()), db_region, "tight", inputs=db_inputs)
+
     # # Output line for Excel (Check only two strip reco and time resolutions)
     # info_str = "    - Excel format: ["
     # for key in ["two_res", "time_res"]:
@@ -188,3 +205,6 @@ for reg in regions:
 inputfile_res1d.Close()
 inputfile_res1d_tight.Close()
 inputfile_eff.Close()
+if db:
+    print(" > Values saved in %s"%db.path)
+    db.close()
@@ -0,0 +1,196 @@
+import os
+import optparse
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Columnar export of the MyAnalysis output files (_Analyze.root,
+# _InitialAnalyzer.root, _RecoAnalyzer.root) to Arrow, and a reader that
+# gives back memory-mapped numpy views, without ROOT.
+#
+# Every histogram is one row of the table, with its class, title, entries,
+# bin edges of each axis and contents/sumw2 of all bins (under/overflow
+# included, ROOT global bin ordering). The file is written once in the Arrow
+# IPC format, which is memory-mapped by the reader: opening a file only reads
+# the name index, and the arrays of a histogram are views into the map.
+#
+# TProfile and TProfile2D rows hold sum(w*y) in contents and sum(w*y^2) in
+# sumw2, plus the per bin sum of weights (binentries) and of squared weights
+# (binsumw2), which are empty for the other histograms. The profile means
+# are contents/binentries.
+#
+#     python analyzeExport.py -D HPK_W9_15_2_20T_1P0_500P_50M_E600_114V
+#
+#     import analyzeExport
+#     store = analyzeExport.HistStore("../output/<dataset>/<dataset>_Analyze.arrow")
+#     h = store["amplitude_vs_xy_channel00"]
+#     h.contents.shape, h.edges[0], h.entries
+
+schema_fields = [
+    ("name", "string"), ("path", "string"), ("class", "string"), ("title", "string"),
+    ("dim", "int8"), ("entries", "float64"),
+    ("xedges", "float64[]"), ("yedges", "float64[]"), ("zedges", "float64[]"),
+    ("contents", "float64[]"), ("sumw2", "float64[]"),
+    ("binentries", "float64[]"), ("binsumw2", "float64[]"),
+]
+
+def _schema():
+    types = {"string": pa.string(), "int8": pa.int8(), "float64": pa.float64(),
+             "float64[]": pa.list_(pa.float64())}
+    return pa.schema([(name, types[t]) for name, t in schema_fields])
+
+def _require_arrow():
+    if pa is None:
+        raise Exception("ERROR: pyarrow is needed to read or write the columnar histogram files")
+
+def _walk(directory, prefix=""):
+    # (path, object) of every histogram in a ROOT directory, recursively
+    for key in directory.GetListOfKeys():
+        obj = key.ReadObj()
+        path = prefix + key.GetName()
+        if obj.InheritsFrom("TDirectory"):
+            for item in _walk(obj, path + "/"):
+                yield item
+        elif obj.InheritsFrom("TH1"):
+            yield path, obj
+
+def _global_order(values):
+    # [x, y, z] array back to the flat ROOT global bin ordering
+    return np.ascontiguousarray(values.transpose()).reshape(-1)
+
+def export(root_path, output_path=None, parquet=False):
+    """Write all histograms of root_path to <root_path without .root>.arrow."""
+    _require_arrow()
+    import ROOT
+    import histArrays as ha
+
+    output_path = output_path if output_path else os.path.splitext(root_path)[0] + ".arrow"
+    infile = ROOT.TFile.Open(root_path, "READ")
+    if not infile or infile.IsZombie():
+        raise Exception("ERROR: cannot open file ", root_path)
+
+    columns = dict((name, []) for name, _ in schema_fields)
+    for path, hist in _walk(infile):
+        dim = hist.GetDimension()
+        axes = [hist.GetXaxis(), hist.GetYaxis(), hist.GetZaxis()]
+        columns["name"].append(hist.GetName())
+        columns["path"].append(path)
+        columns["class"].append(hist.ClassName())
+        columns["title"].append(hist.GetTitle())
+        columns["dim"].append(dim)
+        columns["entries"].append(hist.GetEntries())
+        for i, axis_name in enumerate(["xedges", "yedges", "zedges"]):
+            columns[axis_name].append(ha.get_bin_edges(axes[i]) if i < dim else np.zeros(0))
+        columns["contents"].append(_global_order(ha.get_contents(hist)))
+        columns["sumw2"].append(_global_order(ha.get_sumw2(hist)))
+        profile = hist.InheritsFrom("TProfile") or hist.InheritsFrom("TProfile2D")
+        columns["binentries"].append(_global_order(ha.get_bin_entries(hist)) if profile else np.zeros(0))
+        columns["binsumw2"].append(_global_order(ha.get_bin_sumw2(hist)) if profile else np.zeros(0))
+    infile.Close()
+
+    table = pa.table(columns, schema=_schema())
+    tmp = output_path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, output_path)
+    if parquet:
+        pq.write_table(table, os.path.splitext(output_path)[0] + ".parquet", compression="zstd")
+    return output_path
+
+class HistArrays:
+    # Numpy views of one histogram. contents/sumw2 have one entry per bin,
+    # under/overflow included, indexed as [x, y, z] like histArrays.get_contents.
+    # binentries/binsumw2 are None except for profiles
+    def __init__(self, name, cls, title, dim, entries, edges, contents, sumw2, binentries=None, binsumw2=None):
+        self.name = name
+        self.cls = cls
+        self.title = title
+        self.dim = dim
+        self.entries = entries
+        self.edges = edges
+        self.contents = contents
+        self.sumw2 = sumw2
+        self.binentries = binentries
+        self.binsumw2 = binsumw2
+
+    def centers(self, axis=0):
+        return 0.5*(self.edges[axis][1:] + self.edges[axis][:-1])
+
+def _list_view(column, row):
+    # Zero-copy numpy view of one row of a list<float64> column
+    start, stop = column.offsets[row].as_py(), column.offsets[row+1].as_py()
+    return column.values.slice(start, stop - start).to_numpy(zero_copy_only=True)
+
+def _reshape(values, edges):
+    shape = [len(e) + 1 for e in edges]
+    if len(shape) == 1:
+        return values
+    # ROOT global bin = binx + nx*(biny + ny*binz): reverse the axes order
+    return values.reshape(shape[::-1]).transpose()
+
+class HistStore:
+    """Memory-mapped reader of a file written by export()."""
+    def __init__(self, path):
+        _require_arrow()
+        self.path = path
+        self._source = pa.memory_map(path, "r")
+        reader = pa.ipc.open_file(self._source)
+        self._batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+        # Name index: histograms are found by full path or by name
+        self.index = {}
+        self._paths = []
+        for b, batch in enumerate(self._batches):
+            for column in ("name", "path"):
+                for row, name in enumerate(batch.column(column).to_pylist()):
+                    self.index.setdefault(name, (b, row))
+            self._paths+= batch.column("path").to_pylist()
+        self._cache = {}
+
+    def names(self):
+        return list(self._paths)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            b, row = self.index[name]
+            column = lambda c: self._batches[b].column(c)
+            value = lambda c: column(c)[row].as_py()
+            dim = value("dim")
+            edges = [_list_view(column(a), row) for a in ["xedges", "yedges", "zedges"][:dim]]
+            arrays = [_reshape(_list_view(column("contents"), row), edges), _reshape(_list_view(column("sumw2"), row), edges)]
+            # Profile columns, absent in files written before they were added
+            for c in ["binentries", "binsumw2"]:
+                has_values = c in self._batches[b].schema.names and len(column(c)[row]) > 0
+                arrays.append(_reshape(_list_view(column(c), row), edges) if has_values else None)
+            self._cache[name] = HistArrays(value("name"), value("class"), value("title"), dim, value("entries"), edges, *arrays)
+        return self._cache[name]
+
+    def get(self, name, default=None):
+        return self[name] if name in self.index else default
+
+def open_dataset(dataset, analyzer="Analyze", outdir=None):
+    # HistStore of the exported output of a dataset, e.g. open_dataset(dataset)["ampMax_Overall"]
+    outdir = outdir if outdir else "../output/%s/"%dataset
+    return HistStore("%s%s_%s.arrow"%(outdir, dataset, analyzer))
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser("usage: %prog [options] [files]\n")
+    parser.add_option('-D', dest='Dataset', default = "", help="Dataset, which determines filepath")
+    parser.add_option('-A', dest='analyzers', default = "Analyze", help="Comma separated analyzers to export (Analyze,InitialAnalyzer,RecoAnalyzer)")
+    parser.add_option('-p', dest='parquet', action='store_true', default = False, help="Also write a Parquet copy")
+    options, args = parser.parse_args()
+
+    files = list(args)
+    if options.Dataset:
+        import myStyle
+        outdir = myStyle.getOutputDir(options.Dataset)
+        files+= ["%s%s_%s.root"%(outdir, options.Dataset, a) for a in options.analyzers.split(",")]
+    for f in files:
+        print(" > %s -> %s"%(f, export(f, parquet=options.parquet)))
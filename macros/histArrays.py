@@ -0,0 +1,97 @@
+import numpy as np
+
+# Helpers to move ROOT histogram contents in and out of numpy arrays.
+# Contents are always returned with under/overflow bins included, so the
+# numpy index matches the ROOT bin number (index 0 is the underflow).
+
+def _buffer_to_array(buf, size):
+    # PyROOT hands back a low level view without length information
+    buf.reshape((size,))
+    return np.array(buf, dtype=np.float64, copy=True)
+
+def get_n_cells(hist):
+    # Number of bins per axis, including under/overflow
+    nx = hist.GetNbinsX() + 2
+    ny = hist.GetNbinsY() + 2 if hist.GetDimension() > 1 else 1
+    nz = hist.GetNbinsZ() + 2 if hist.GetDimension() > 2 else 1
+    return nx, ny, nz
+
+def _reshape(values, hist):
+    # ROOT global bin = binx + nx*(biny + ny*binz), so reverse the axes order
+    nx, ny, nz = get_n_cells(hist)
+    dim = hist.GetDimension()
+    if dim == 1:
+        return values
+    elif dim == 2:
+        return values.reshape((ny, nx)).T
+    return values.reshape((nz, ny, nx)).transpose(2, 1, 0)
+
+def get_contents(hist):
+    nx, ny, nz = get_n_cells(hist)
+    values = _buffer_to_array(hist.GetArray(), nx*ny*nz)
+    return _reshape(values, hist)
+
+def get_sumw2(hist):
+    # Fall back to poisson errors when the histogram does not store Sumw2
+    if hist.GetSumw2N() == 0:
+        return np.abs(get_contents(hist))
+    nx, ny, nz = get_n_cells(hist)
+    values = _buffer_to_array(hist.GetSumw2().GetArray(), nx*ny*nz)
+    return _reshape(values, hist)
+
+def get_bin_entries(hist):
+    # Sum of weights of each bin of a TProfile/TProfile2D (fBinEntries)
+    nx, ny, nz = get_n_cells(hist)
+    values = np.array([hist.GetBinEntries(i) for i in range(nx*ny*nz)])
+    return _reshape(values, hist)
+
+def get_bin_sumw2(hist):
+    # Sum of squared weights of each profile bin, the bin entries when not stored
+    if hist.GetBinSumw2().GetSize() == 0:
+        return get_bin_entries(hist)
+    nx, ny, nz = get_n_cells(hist)
+    values = _buffer_to_array(hist.GetBinSumw2().GetArray(), nx*ny*nz)
+    return _reshape(values, hist)
+
+def get_bin_edges(axis):
+    nbins = axis.GetNbins()
+    return np.array([axis.GetBinLowEdge(i) for i in range(1, nbins + 2)])
+
+def get_bin_centers(axis):
+    edges = get_bin_edges(axis)
+    return 0.5*(edges[1:] + edges[:-1])
+
+def set_contents(hist, values, errors=None, mask=None):
+    # Write numpy arrays of in-range bins (index 0 is ROOT bin 1) into a TH1
+    # with a single SetContent/SetError call. Bins outside mask are untouched.
+    nbins = hist.GetNbinsX()
+    if mask is None:
+        mask = np.ones(nbins, dtype=bool)
+    mask = np.asarray(mask, dtype=bool)[:nbins]
+
+    contents = get_contents(hist)
+    contents[1:nbins+1][mask] = np.asarray(values, dtype=np.float64)[:nbins][mask]
+    hist.SetContent(contents)
+
+    if errors is not None:
+        bin_errors = np.sqrt(get_sumw2(hist))
+        bin_errors[1:nbins+1][mask] = np.asarray(errors, dtype=np.float64)[:nbins][mask]
+        hist.SetError(bin_errors)
+    return hist
+
+def _flatten(values, hist):
+    # Inverse of _reshape: back to the ROOT global bin ordering
+    dim = hist.GetDimension()
+    if dim == 1:
+        return np.ascontiguousarray(values, dtype=np.float64)
+    elif dim == 2:
+        return np.ascontiguousarray(np.asarray(values, dtype=np.float64).T).reshape(-1)
+    return np.ascontiguousarray(np.asarray(values, dtype=np.float64).transpose(2, 1, 0)).reshape(-1)
+
+def set_array(hist, values, errors=None):
+    # Write full arrays (under/overflow included, same layout as get_contents)
+    # into a histogram of any dimension
+    hist.SetContent(_flatten(values, hist))
+    if errors is not None:
+        hist.SetError(_flatten(errors, hist))
+    return hist
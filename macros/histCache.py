@@ -0,0 +1,200 @@
+import os
+import hashlib
+import numpy as np
+import ROOT
+import histArrays as ha
+
+# Shared access to the histograms of the _Analyze.root files.
+# Input files are opened once per process and the results of Get and
+# Project3D are cached, keyed by (file, histogram, axis, rebin, range), so a
+# multi-plot run reads each histogram and projects each TH3 only once per
+# axis. The cache holds one detached master per key (the object read from the
+# file itself, not a copy) and callers always get a detached clone of it,
+# free to rebin, scale or rename.
+#
+#     import histCache as hc
+#     f = hc.open_file("%s%s_Analyze.root"%(outdir,dataset))
+#     th2 = hc.project3d(f, "amplitude_vs_xy_channel00", "zx")
+#
+# Projections are also kept on disk, as compressed numpy files in a
+# .projection_cache directory next to the input file, so later runs skip the
+# TH3 read entirely. Entries are keyed by the input path, size and mtime plus
+# the projection spec (a rewritten file never hits), and the directory is
+# bounded in size by evicting the least recently used entries.
+
+_files = {}
+_cache = {}
+
+disk_cache = True
+disk_cache_dirname = ".projection_cache"
+disk_cache_max_bytes = 500*1024*1024
+_disk_cache_version = 1
+
+def _file_key(f):
+    name = f if isinstance(f, str) else f.GetName()
+    return os.path.realpath(name)
+
+def open_file(path):
+    # Return the TFile of path, opening it only the first time
+    key = _file_key(path)
+    f = _files.get(key)
+    if f is None or not f.IsOpen():
+        f = ROOT.TFile.Open(path, "READ")
+        if not f or f.IsZombie():
+            raise Exception("ERROR: cannot open file ", path)
+        _files[key] = f
+    return f
+
+def _as_file(f):
+    # Accept a path or an already opened TFile (which is then shared)
+    if isinstance(f, str):
+        return open_file(f)
+    _files.setdefault(_file_key(f), f)
+    return f
+
+def _detach(hist, name=None):
+    clone = hist.Clone(name if name else hist.GetName())
+    clone.SetDirectory(0)
+    return clone
+
+def _rebin(hist, rebin_x):
+    if rebin_x > 1:
+        if hist.GetDimension() == 1:
+            hist.Rebin(rebin_x)
+        else:
+            hist.RebinX(rebin_x)
+    return hist
+
+def _master(f, name, rebin_x=1):
+    f = _as_file(f)
+    key = (_file_key(f), name, None, rebin_x, None)
+    if key not in _cache:
+        hist = f.Get(name)
+        if not hist:
+            raise Exception("ERROR: histogram not found ", name, f.GetName())
+        # Taken out of the file directory, so the master is the only copy kept
+        hist.SetDirectory(0)
+        _cache[key] = _rebin(hist, rebin_x)
+    return _cache[key]
+
+def get(f, name, rebin_x=1, new_name=None):
+    """Detached clone of histogram name of file f (path or TFile)."""
+    return _detach(_master(f, name, rebin_x), new_name)
+
+def get_shared(f, name):
+    """Cached master of histogram name of file f, shared by all callers.
+
+    No clone is made: use it read-only (ProjectionZ, GetBinContent, ...).
+    """
+    return _master(f, name)
+
+def _disk_cache_path(f, spec):
+    path = _file_key(f)
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    key = repr((_disk_cache_version, path, stat.st_size, stat.st_mtime_ns, spec))
+    cache_dir = os.path.join(os.path.dirname(path), disk_cache_dirname)
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+def _save_projection(path, hist):
+    dim = hist.GetDimension()
+    arrays = {"contents": ha.get_contents(hist), "sumw2": ha.get_sumw2(hist),
+              "entries": np.array(hist.GetEntries()),
+              "names": np.array([hist.GetName(), hist.GetTitle()]),
+              "titles": np.array([hist.GetXaxis().GetTitle(), hist.GetYaxis().GetTitle()]),
+              "xedges": ha.get_bin_edges(hist.GetXaxis())}
+    if dim == 2:
+        arrays["yedges"] = ha.get_bin_edges(hist.GetYaxis())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so concurrent runs never read half a file
+        tmp = "%s.%d.tmp"%(path, os.getpid())
+        with open(tmp, "wb") as out:
+            np.savez_compressed(out, **arrays)
+        os.replace(tmp, path)
+        _evict(os.path.dirname(path))
+    except OSError as e:
+        print("WARNING: could not write projection cache %s: %s"%(path, e))
+
+def _load_projection(path):
+    with np.load(path) as data:
+        name, title = [str(n) for n in data["names"]]
+        xtitle, ytitle = [str(t) for t in data["titles"]]
+        xedges = data["xedges"]
+        if "yedges" in data.files:
+            yedges = data["yedges"]
+            hist = ROOT.TH2D(name, title, len(xedges)-1, xedges, len(yedges)-1, yedges)
+        else:
+            hist = ROOT.TH1D(name, title, len(xedges)-1, xedges)
+        hist.SetDirectory(0)
+        hist.Sumw2()
+        ha.set_array(hist, data["contents"], np.sqrt(data["sumw2"]))
+        hist.SetEntries(float(data["entries"]))
+    hist.GetXaxis().SetTitle(xtitle)
+    hist.GetYaxis().SetTitle(ytitle)
+    # Mark as recently used for the LRU eviction
+    os.utime(path)
+    return hist
+
+def _evict(cache_dir):
+    # Drop least recently used entries until the directory fits disk_cache_max_bytes
+    entries = []
+    for fname in os.listdir(cache_dir):
+        if fname.endswith(".npz"):
+            stat = os.stat(os.path.join(cache_dir, fname))
+            entries.append((stat.st_mtime, stat.st_size, fname))
+    total = sum(e[1] for e in entries)
+    for _, size, fname in sorted(entries):
+        if total <= disk_cache_max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, fname))
+        except OSError:
+            pass
+        total -= size
+
+def project3d(f, name, axis="zx", rebin_x=1, ranges=None, new_name=None):
+    """Detached clone of th3.Project3D(axis) of histogram name of file f.
+
+    ranges is an optional sequence of (axis, first_bin, last_bin), e.g.
+    (("y", 10, 20),), applied to the TH3 axes before projecting.
+    rebin_x is applied to the x axis of the projection.
+    """
+    f = _as_file(f)
+    ranges = tuple(tuple(r) for r in ranges) if ranges else None
+    key = (_file_key(f), name, axis, rebin_x, ranges)
+    if key not in _cache:
+        cache_path = _disk_cache_path(f, key[1:]) if disk_cache else None
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                _cache[key] = _load_projection(cache_path)
+                return _detach(_cache[key], new_name)
+            except Exception as e:
+                print("WARNING: ignoring unreadable projection cache %s: %s"%(cache_path, e))
+
+        th3 = f.Get(name)
+        if not th3:
+            raise Exception("ERROR: histogram not found ", name, f.GetName())
+        th3_axes = {"x": th3.GetXaxis(), "y": th3.GetYaxis(), "z": th3.GetZaxis()}
+        for a, first, last in ranges or ():
+            th3_axes[a].SetRange(first, last)
+        projection = th3.Project3D(axis)
+        for a, first, last in ranges or ():
+            th3_axes[a].SetRange()
+        projection.SetDirectory(0)
+        _cache[key] = _rebin(projection, rebin_x)
+        if cache_path:
+            _save_projection(cache_path, _cache[key])
+    return _detach(_cache[key], new_name)
+
+def clear():
+    # Drop the cached histograms (file handles are kept)
+    _cache.clear()
+
+def close_files():
+    clear()
+    for f in _files.values():
+        if f.IsOpen():
+            f.Close()
+    _files.clear()
@@ -1,8 +1,93 @@
 import argparse
+import hashlib
 import math
 import os
+import shutil
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
-import ROOT
+try:
+    import ROOT
+except ImportError:
+    # The numpy evaluator and fitter (langaufun, LanGausBatchFit.fit) work without ROOT
+    ROOT = None
+import numpy as np
+
+import histArrays as ha
+import sliceFitter as sf
+
+# langaus.C is compiled once per (source, ROOT version, compiler setup) into a
+# user cache directory, and later processes load the prebuilt library instead
+# of going through ACLiC again. The build is done under a file lock so
+# concurrent macros never race on the same artifacts; set LANGAUS_CACHE_DIR to
+# move the cache.
+_langaus_decl = "Double_t langaufun(Double_t *x, Double_t *par);"
+
+def _cache_dir():
+    if os.environ.get("LANGAUS_CACHE_DIR"):
+        return os.environ["LANGAUS_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "langaus")
+
+def _build_key(source):
+    h = hashlib.sha1()
+    with open(source, "rb") as f:
+        h.update(f.read())
+    h.update(("%s|%s|%s"%(ROOT.gROOT.GetVersion(), ROOT.gROOT.GetVersionCode(), ROOT.gSystem.GetMakeSharedLib())).encode())
+    return h.hexdigest()[:16]
+
+def _load_built(build_dir):
+    # Load the prebuilt library; the declaration lets cling resolve langaufun from it
+    lib = os.path.join(build_dir, "langaus_C." + ROOT.gSystem.GetSoExt())
+    if not os.path.exists(os.path.join(build_dir, "done")) or ROOT.gSystem.Load(lib) < 0:
+        return False
+    if not hasattr(ROOT, "langaufun"):
+        ROOT.gInterpreter.Declare(_langaus_decl)
+    return True
+
+def _build(source, build_dir):
+    os.makedirs(build_dir, exist_ok=True)
+    lock = open(os.path.join(build_dir, "lock"), "w")
+    try:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        # Built by another process while waiting for the lock
+        if _load_built(build_dir):
+            return
+        copy = os.path.join(build_dir, "langaus.C")
+        shutil.copyfile(source, copy)
+        if not ROOT.gSystem.CompileMacro(copy, "kO", "", build_dir):
+            raise Exception("ERROR: could not compile ", source)
+        with open(os.path.join(build_dir, "done"), "w") as f:
+            f.write(source + "\n")
+    finally:
+        lock.close()
+
+def _loadlib():
+    if ROOT is None:
+        raise Exception("ERROR: ROOT is needed for langaus.C, use langaufun/LanGausBatchFit.fit without ROOT")
+    try:
+        #try to load the function
+        ROOT.langaufun
+    except AttributeError:
+        pkgdir = os.path.dirname(__file__)
+        if len(pkgdir) == 0:
+            pkgdir = "."
+        path = os.sep.join((pkgdir, "langaus.C"))
+        path = os.path.abspath(path)
+        if not os.path.exists(path):
+            raise Exception("ERROR: file does not exist ", path)
+        build_dir = os.path.join(_cache_dir(), _build_key(path))
+        try:
+            if not _load_built(build_dir):
+                _build(path, build_dir)
+        except OSError as e:
+            # Cache not writable: compile next to the source as before
+            print("WARNING: langaus build cache unusable (%s), using ACLiC in place"%e)
+            ROOT.gROOT.ProcessLine(".L " + path +"+")
+    return
 
 ################################################################################
 
@@ -42,19 +127,7 @@ class LanGausFit:
         return tf1
 
     def _loadlib(self):
-        try:
-            #try to load the function
-            ROOT.langaufun
-        except AttributeError:
-            #try to compile the function
-            pkgdir = os.path.dirname(__file__)
-            if len(pkgdir) == 0:
-                pkgdir = "."
-            path = os.sep.join((pkgdir, "langaus.C"))
-            path = os.path.abspath(path)
-            if not os.path.exists(path):
-                raise Exception("ERROR: file does not exist ", path)
-            ROOT.gROOT.ProcessLine(".L " + path +"+")
+        _loadlib()
         return
 
     def _getstartingparameters(self, hist, startwidth, startmpv, startnorm, startsigma):
@@ -71,7 +144,7 @@ class LanGausFit:
         return startwidth, startmpv, startnorm, startsigma
 
     def _findlevel(self, l, hist):
-        for ii in xrange(hist.GetNbinsX()):
+        for ii in range(hist.GetNbinsX()):
             if hist.GetBinContent(ii + 1) >= l:
                 break
         return hist.GetXaxis().GetBinCenter(ii + 1)
@@ -87,11 +160,340 @@ class LanGausFit:
 
 ################################################################################
 
+# Landau density, CERNLIB DENLAN approximation (same as TMath::Landau)
+_P1 = (0.4259894875, -0.1249762550, 0.03984243700, -0.006298287635, 0.001511162253)
+_Q1 = (1.0, -0.3388260629, 0.09594393323, -0.01608042283, 0.003778942063)
+_P2 = (0.1788541609, 0.1173957403, 0.01488850518, -0.001394989411, 0.0001283617211)
+_Q2 = (1.0, 0.7428795082, 0.3153932961, 0.06694219548, 0.008790609714)
+_P3 = (0.1788544503, 0.09359161662, 0.006325387654, 0.00006611667319, -0.000002031049101)
+_Q3 = (1.0, 0.6097809921, 0.2560616665, 0.04746722384, 0.006957301675)
+_P4 = (0.9874054407, 118.6723273, 849.2794360, -743.7792444, 427.0262186)
+_Q4 = (1.0, 106.8615961, 337.6496214, 2016.712389, 1597.063511)
+_P5 = (1.003675074, 167.5702434, 4789.711289, 21217.86767, -22324.94910)
+_Q5 = (1.0, 156.9424537, 3745.310488, 9834.698876, 66924.28357)
+_P6 = (1.000827619, 664.9143136, 62972.92665, 475554.6998, -5743609.109)
+_Q6 = (1.0, 651.4101098, 56974.73333, 165917.4725, -2815759.939)
+_A1 = (0.04166666667, -0.01996527778, 0.02709538966)
+_A2 = (-1.845568670, -4.284640743)
+
+def _ratio(p, q, v):
+    num = p[0] + (p[1] + (p[2] + (p[3] + p[4]*v)*v)*v)*v
+    den = q[0] + (q[1] + (q[2] + (q[3] + q[4]*v)*v)*v)*v
+    return num/den
+
+def landau_pdf(v):
+    """Normalized Landau density at v = (x - location)/width, for numpy arrays."""
+    v = np.asarray(v, dtype=np.float64)
+    out = np.zeros_like(v)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        sel = v < -5.5
+        u = np.exp(v[sel] + 1.0)
+        val = 0.3989422803*(np.exp(-1.0/u)/np.sqrt(u))*(1 + (_A1[0] + (_A1[1] + _A1[2]*u)*u)*u)
+        out[sel] = np.where(u < 1e-10, 0.0, val)
+
+        sel = (v >= -5.5) & (v < -1)
+        u = np.exp(-v[sel] - 1)
+        out[sel] = np.exp(-u)*np.sqrt(u)*_ratio(_P1, _Q1, v[sel])
+
+        sel = (v >= -1) & (v < 1)
+        out[sel] = _ratio(_P2, _Q2, v[sel])
+
+        sel = (v >= 1) & (v < 5)
+        out[sel] = _ratio(_P3, _Q3, v[sel])
+
+        for low, high, p, q in ((5, 12, _P4, _Q4), (12, 50, _P5, _Q5), (50, 300, _P6, _Q6)):
+            sel = (v >= low) & (v < high)
+            u = 1.0/v[sel]
+            out[sel] = u*u*_ratio(p, q, u)
+
+        sel = v >= 300
+        u = 1.0/(v[sel] - v[sel]*np.log(v[sel])/(v[sel] + 1))
+        out[sel] = u*u*(1 + (_A2[0] + _A2[1]*u)*u)
+    return out
+
+class LandauTable:
+    """Landau density tabulated once on a fine grid and linearly interpolated.
+
+    Values beyond the upper edge of the table are computed exactly.
+    """
+    def __init__(self, vmin=-8.0, vmax=200.0, step=0.002):
+        self.vmin = vmin
+        self.vmax = vmax
+        self.step = step
+        self.grid = np.arange(vmin, vmax + 2*step, step)
+        self.values = landau_pdf(self.grid)
+
+    def __call__(self, v):
+        # Uniform grid, so the lookup is a direct index computation
+        pos = np.clip((v - self.vmin)/self.step, 0.0, len(self.grid) - 2)
+        idx = pos.astype(np.intp)
+        frac = pos - idx
+        out = self.values[idx]*(1.0 - frac) + self.values[idx + 1]*frac
+        out[v < self.vmin] = 0.0
+        tail = v > self.vmax
+        if tail.any():
+            out[tail] = landau_pdf(v[tail])
+        return out
+
+# Convolution used in langaus.C: 100 points within +-5 gaussian sigmas
+_MPSHIFT = -0.22278298
+_INVSQ2PI = 0.3989422804014
+_NSIGMA = 5.0
+_CONV_KERNELS = {}
+
+def _conv_kernel(nsteps):
+    # Positions (in gaussian sigmas) and gaussian weights of the convolution sum
+    if nsteps not in _CONV_KERNELS:
+        t = -_NSIGMA + (np.arange(1, nsteps + 1) - 0.5)*(2*_NSIGMA/nsteps)
+        _CONV_KERNELS[nsteps] = (t, np.exp(-0.5*t**2))
+    return _CONV_KERNELS[nsteps]
+
+def langaufun_batch(x, par, table, nsteps=100):
+    """Evaluate langaufun (langaus.C) for a stack of parameter sets.
+
+    x has shape (n, m) and par shape (n, 4) with the usual parameter order
+    (LandauWidth, LandauMPV, Normalisation, GaussianSigma). Returns (n, m).
+    """
+    conv_t, conv_g = _conv_kernel(nsteps)
+    width = np.abs(par[:, 0])[:, None, None]
+    mpc = par[:, 1][:, None, None] - _MPSHIFT*width
+    norm = par[:, 2][:, None]
+    sigma = np.abs(par[:, 3])[:, None, None]
+    xx = x[:, :, None] + sigma*conv_t[None, None, :]
+    fland = table((xx - mpc)/width)/width
+    total = np.sum(fland*conv_g, axis=2)
+    step = (2*_NSIGMA/nsteps)*sigma[:, :, 0]
+    return norm*step*total*_INVSQ2PI
+
+_default_table = None
+
+def default_table():
+    # LandauTable shared by all the numpy evaluations and fits of the process
+    global _default_table
+    if _default_table is None:
+        _default_table = LandauTable()
+    return _default_table
+
+def langaufun(x, par, table=None, nsteps=100):
+    """Numpy version of langaufun (langaus.C) on an array of x values.
+
+    par is one parameter set (4,), giving an array shaped like x, or n sets
+    (n, 4), giving an array of shape (n,) + x.shape.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    par = np.asarray(par, dtype=np.float64)
+    sets = np.atleast_2d(par)
+    xs = np.broadcast_to(x.reshape(1, -1), (sets.shape[0], x.size))
+    out = langaufun_batch(xs, sets, table if table is not None else default_table(), nsteps)
+    return out.reshape(x.shape) if par.ndim == 1 else out.reshape((sets.shape[0],) + x.shape)
+
+def _poisson_nll(model, x, y, mask, params):
+    f = model(x, params)
+    f = np.where(f > 1e-300, f, 1e-300)
+    # Poisson binned likelihood, Baker-Cousins form
+    terms = f - y + np.where(y > 0, y*np.log(np.where(y > 0, y, 1.0)/f), 0.0)
+    return np.sum(np.where(mask, terms, 0.0), axis=1), f
+
+def _numeric_jacobian(model, x, params, f):
+    # Forward differences, all parameters of all histograms in one evaluation
+    n, npar = params.shape
+    h = 1e-5*np.maximum(np.abs(params), 1e-3*np.abs(params).max(axis=1, keepdims=True) + 1e-8)
+    shifted = np.repeat(params[:, None, :], npar, axis=1) + h[:, None, :]*np.eye(npar)[None, :, :]
+    xs = np.repeat(x[:, None, :], npar, axis=1).reshape(n*npar, -1)
+    fs = model(xs, shifted.reshape(n*npar, npar)).reshape(n, npar, -1)
+    return (fs - f[:, None, :])/h[:, :, None]
+
+def fit_poisson_batch(model, x, y, mask, params, active=None, max_iter=100, tolerance=1e-7):
+    """Binned likelihood fit of model(x, params) to every row of y at once.
+
+    x, y and mask have shape (n, m) and params (n, npar); model must return
+    the expected counts with shape (n, m). Only bins with mask are used.
+    Minimizes with a vectorized Levenberg-Marquardt on the Fisher scoring of
+    the likelihood, only evaluating the rows that did not converge yet.
+    Returns the parameters, their parabolic errors and the -log(likelihood).
+    """
+    n, npar = params.shape
+    params = np.array(params, dtype=np.float64)
+    if active is None:
+        active = np.ones(n, dtype=bool)
+    lam = np.full(n, 1e-3)
+    nll, f = _poisson_nll(model, x, y, mask, params)
+    converged = ~active
+    eye = np.eye(npar)[None, :, :]
+    for _ in range(max_iter):
+        todo = np.flatnonzero(~converged)
+        if len(todo) == 0:
+            break
+        xt, yt, mt, pt, ft = x[todo], y[todo], mask[todo], params[todo], f[todo]
+        jac = _numeric_jacobian(model, xt, pt, ft)
+        w = np.where(mt, 1.0/ft, 0.0)
+        info = np.einsum('cin,cn,cjn->cij', jac, w, jac)
+        grad = np.einsum('cin,cn->ci', jac, np.where(mt, 1.0 - yt/ft, 0.0))
+
+        diag = np.einsum('cii->ci', info)
+        hessian = info + lam[todo, None, None]*(diag[:, :, None]*eye + 1e-12*eye)
+        step = -np.linalg.solve(hessian, grad[:, :, None])[:, :, 0]
+
+        trial = pt + step
+        trial_nll, trial_f = _poisson_nll(model, xt, yt, mt, trial)
+        better = (trial_nll <= nll[todo]) & np.isfinite(trial_nll)
+        small = np.abs(nll[todo] - trial_nll) <= tolerance*np.maximum(np.abs(nll[todo]), 1.0)
+
+        accepted = todo[better]
+        params[accepted] = trial[better]
+        f[accepted] = trial_f[better]
+        nll[accepted] = trial_nll[better]
+        converged[todo[better & small]] = True
+        lam[todo] = np.where(better, lam[todo]/10., lam[todo]*10.)
+        converged|= lam > 1e10
+
+    # Parabolic errors from the inverse information matrix
+    jac = _numeric_jacobian(model, x, params, f)
+    info = np.einsum('cin,cn,cjn->cij', jac, np.where(mask, 1.0/f, 0.0), jac)
+    info[~active] = eye[0]
+    errors = np.sqrt(np.abs(np.einsum('cii->ci', np.linalg.pinv(info))))
+    return params, errors, nll
+
+class LanGausBatchResult:
+    # Arrays have one element per fitted histogram
+    def __init__(self, n):
+        self.params = np.zeros((n, 4))
+        self.errors = np.zeros((n, 4))
+        self.fitlow = np.zeros(n)
+        self.fithigh = np.zeros(n)
+        self.nll = np.zeros(n)
+        self.fitted = np.zeros(n, dtype=bool)
+
+    @property
+    def width(self):
+        return self.params[:, 0]
+
+    @property
+    def mpv(self):
+        return self.params[:, 1]
+
+    @property
+    def norm(self):
+        return self.params[:, 2]
+
+    @property
+    def sigma(self):
+        return self.params[:, 3]
+
+class LanGausBatchFit:
+    """LanGausBatchFit fits Landau convoluted with Gaussian to many histograms at once.
+
+    All histograms share the same binning and are fitted together with a
+    vectorized binned likelihood minimization (as the "L" option of TH1::Fit),
+    using a Landau density table that is computed only once.
+
+    A simple example:
+    fitter = LanGausBatchFit()
+    result = fitter.fit_slices(th2, nsigma=(1.5, 3.0), rebin_y=2)
+    mpv = result.mpv
+    """
+    def __init__(self, table=None):
+        self._table = table if table is not None else default_table()
+
+    def fit(self, contents, edges, fitranges=None, startparams=None, active=None, max_iter=100, tolerance=1e-7):
+        """Fit every row of contents (shape (n, nbins)) within fitranges (shape (n, 2)).
+
+        Works on plain numpy arrays, ROOT is not needed. fitranges and
+        startparams (shape (n, 4)) are computed as in LanGausFit when not given.
+        """
+        contents = np.atleast_2d(np.asarray(contents, dtype=np.float64))
+        n = contents.shape[0]
+        edges = np.asarray(edges, dtype=np.float64)
+        centers = 0.5*(edges[1:] + edges[:-1])
+        if fitranges is None:
+            fitranges = self._autofitrange(contents, centers)
+        fitranges = np.asarray(fitranges, dtype=np.float64).reshape(n, 2)
+        if startparams is None:
+            startparams = self._getstartingparameters(contents, centers)
+        if active is None:
+            active = np.ones(n, dtype=bool)
+
+        in_range = (centers[None, :] >= fitranges[:, 0:1]) & (centers[None, :] <= fitranges[:, 1:2])
+        nbins_in_range = np.count_nonzero(in_range, axis=1)
+        active = active & (nbins_in_range > 4)
+
+        # Keep only the bins inside each fit range, left aligned and padded
+        width = max(int(nbins_in_range.max()), 1)
+        first = np.argmax(in_range, axis=1)
+        idx = np.minimum(first[:, None] + np.arange(width)[None, :], len(centers) - 1)
+        mask = np.arange(width)[None, :] < nbins_in_range[:, None]
+        x = centers[idx]
+        y = np.take_along_axis(contents, idx, axis=1)
+
+        result = LanGausBatchResult(n)
+        result.fitlow = fitranges[:, 0]
+        result.fithigh = fitranges[:, 1]
+        params = np.array(startparams, dtype=np.float64)
+        model = lambda xs, ps: langaufun_batch(xs, ps, self._table)
+        params, errors, nll = fit_poisson_batch(model, x, y, mask, params, active, max_iter, tolerance)
+        params[:, 0] = np.abs(params[:, 0])
+        params[:, 3] = np.abs(params[:, 3])
+        result.params = np.where(active[:, None], params, 0.0)
+        result.errors = np.where(active[:, None], errors, 0.0)
+        result.nll = np.where(active, nll, 0.0)
+        result.fitted = active
+        return result
+
+    def fit_histograms(self, histograms, fitranges):
+        """Fit a list of TH1 with the same binning, one fit range per histogram."""
+        contents = np.array([ha.get_contents(h)[1:-1] for h in histograms])
+        edges = ha.get_bin_edges(histograms[0].GetXaxis())
+        return self.fit(contents, edges, fitranges)
+
+    def fit_slices(self, th2, nsigma=(1.5, 3.0), rebin_y=2, min_entries=0.0, columns=None):
+        """Fit every ProjectionY of th2 (index 0 is ROOT bin 1).
+
+        The fit range is (mean - nsigma[0]*RMS, mean + nsigma[1]*RMS) of the
+        non-rebinned projection, and the slice is rebinned by rebin_y.
+        Only slices with entries > min_entries (and selected in columns) are fitted.
+        """
+        slices = sf.Slices(th2, rebin_y)
+        fitranges = np.stack([slices.mean - nsigma[0]*slices.rms, slices.mean + nsigma[1]*slices.rms], axis=1)
+        active = (slices.entries > min_entries) & (slices.rms > 0)
+        if columns is not None:
+            active&= np.asarray(columns, dtype=bool)
+        return self.fit(slices.contents, slices.edges, fitranges, active=active)
+
+    def get_tf1(self, result, i, name="landaugausfunction"):
+        # TF1 with the batch parameters of element i, e.g. for drawing
+        _loadlib()
+        tf1 = ROOT.TF1(name, ROOT.langaufun, result.fitlow[i], result.fithigh[i], 4)
+        tf1.SetParNames("LandauWidth","LandauMPV","Normalisation","GaussianSigma")
+        tf1.SetParameters(*[float(p) for p in result.params[i]])
+        for j in range(4):
+            tf1.SetParError(j, float(result.errors[i, j]))
+        return tf1
+
+    def _autofitrange(self, contents, centers, lowpercentile=0.05, highpercentile=0.9):
+        # Same as LanGausFit._autofitrange: centers of the first bins where the
+        # normalized cumulative sum reaches each percentile
+        cum = np.cumsum(contents, axis=1)
+        cum/= np.where(cum[:, -1:] > 0, cum[:, -1:], 1.0)
+        low = centers[np.argmax(cum >= lowpercentile, axis=1)]
+        high = centers[np.argmax(cum >= highpercentile, axis=1)]
+        return np.stack([low, high], axis=1)
+
+    def _getstartingparameters(self, contents, centers):
+        # Same recipe as LanGausFit._getstartingparameters, for every row
+        sumw = contents.sum(axis=1)
+        safe_sumw = np.where(sumw > 0, sumw, 1.0)
+        mean = (contents*centers).sum(axis=1)/safe_sumw
+        rms = np.sqrt(np.clip((contents*centers**2).sum(axis=1)/safe_sumw - mean**2, 0.0, None))
+        peakpos = centers[np.argmax(contents, axis=1)]
+        return np.stack([rms/5.0, peakpos, sumw, rms/10.0], axis=1)
+
+################################################################################
+
 def _generate(mpv, gaussigma, landauwidth, nevents, xlow, xhigh, seed=20313):
     hist = ROOT.TH1D("data", "data;x;num events", 100, xlow, xhigh)
     #fill histogram with random events
     rand = ROOT.TRandom3(seed)
-    for _ in xrange(nevents):
+    for _ in range(nevents):
         expected = rand.Landau(mpv, landauwidth)
         smeared = rand.Gaus(expected, gaussigma)
         hist.Fill(smeared)
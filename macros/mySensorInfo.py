@@ -55,31 +55,33 @@ geometry2023_default = {
     "HPK_W9_15_4_20T_0P5_500P_50M_E600": ["HPK_W9_15_4_20T_0P5_500P_50M_E600", 500, 50, 5.0, 110, 20, "E", 600, "Null", 0.006],
 }
 
-sensorsGeom2023 = {}
-for key, info in geometry2023_default.items():
-    info_dict = {}
-    info_dict["sensor"] = info[0]
-    info_dict["pitch"] = info[1]
-    info_dict["stripCenterXPosition"] = info[9]
-    info_dict["stripWidth"], info_dict["width"] = info[2], info[2]
-    info_dict["length"] = info[3]
-    info_dict["BV"], info_dict["voltage"] = info[4], info[4]
-    info_dict["thickness"] = info[5]
-    info_dict["resistivity"] = info[6]
-    info_dict["resistivityNumber"] = 0
-    if info[6] == "E":
-        info_dict["resistivityNumber"] = 1600
-    elif info[6] == "C":
-        info_dict["resistivityNumber"] = 400
-    elif info[6] == "G":
-        info_dict["resistivityNumber"] = 1400
-    info_dict["capacitance"] = info[7]
-    if info[8] == "Null":
-        info_dict["tag"] = info[0]
-    else:
-        info_dict["tag"] = info[8]
+def _build_sensorsGeom2023():
+    sensorsGeom2023 = {}
+    for key, info in geometry2023_default.items():
+        info_dict = {}
+        info_dict["sensor"] = info[0]
+        info_dict["pitch"] = info[1]
+        info_dict["stripCenterXPosition"] = info[9]
+        info_dict["stripWidth"], info_dict["width"] = info[2], info[2]
+        info_dict["length"] = info[3]
+        info_dict["BV"], info_dict["voltage"] = info[4], info[4]
+        info_dict["thickness"] = info[5]
+        info_dict["resistivity"] = info[6]
+        info_dict["resistivityNumber"] = 0
+        if info[6] == "E":
+            info_dict["resistivityNumber"] = 1600
+        elif info[6] == "C":
+            info_dict["resistivityNumber"] = 400
+        elif info[6] == "G":
+            info_dict["resistivityNumber"] = 1400
+        info_dict["capacitance"] = info[7]
+        if info[8] == "Null":
+            info_dict["tag"] = info[0]
+        else:
+            info_dict["tag"] = info[8]
 
-    sensorsGeom2023[key] = info_dict
+        sensorsGeom2023[key] = info_dict
+    return sensorsGeom2023
 
 #########################  Resolutions and efficiency  #########################
 # NOTE: Resolution values do NOT have tracker component removed
@@ -362,41 +364,43 @@ characteristics2023_Gap = {
 
 # [Overall (default), Overall, Metal, Gap]
 region = ["", "_o", "_m", "_g"]
-resolutions2023 = {}
-for sensor in resolutions2023_Overall:
-    info_dict = {}
-    list_res = [resolutions2023_Overall[sensor], resolutions2023_Overall[sensor],
-                resolutions2023_Metal[sensor], resolutions2023_Gap[sensor]]
-    list_char = [characteristics2023_Overall[sensor], characteristics2023_Overall[sensor],
-                 characteristics2023_Metal[sensor], characteristics2023_Gap[sensor]]
-    for i, reg in enumerate(region):
-        res = list_res[i]
-        if not res:
-            # print(" (!) Sensor %s resolution is empty (!)"%sensor)
-            continue
-        info_dict["position_oneStrip%s"%reg] = res[0]
-        info_dict["position_oneStripRMS%s"%reg] = res[0]
-        info_dict["res_one_strip%s"%reg] = res[0]
-        info_dict["position_twoStrip%s"%reg] = res[1]
-        info_dict["res_two_strip%s"%reg] = res[1]
-        info_dict["time_resolution%s"%reg] = res[2]
-        info_dict["res_time%s"%reg] = res[2]
-        info_dict["efficiency_oneStrip%s"%reg] = res[3]
-        info_dict["efficiency_one_strip%s"%reg] = res[3]
-        info_dict["efficiency_twoStrip%s"%reg] = res[4]
-        info_dict["efficiency_two_strip%s"%reg] = res[4]
-
-        char = list_char[i]
-        if not char:
-            # print(" (!) Sensor %s characteristic is empty (!)"%sensor)
-            continue
-        info_dict["jitter%s"%reg] = char[0]
-        info_dict["amp_max%s"%reg] = char[1]
-        info_dict["rise_time%s"%reg] = char[2]
-        info_dict["baseline_rms%s"%reg] = char[3]
-        info_dict["charge%s"%reg] = char[4]
-
-    resolutions2023[sensor] = info_dict
+def _build_resolutions2023():
+    resolutions2023 = {}
+    for sensor in resolutions2023_Overall:
+        info_dict = {}
+        list_res = [resolutions2023_Overall[sensor], resolutions2023_Overall[sensor],
+                    resolutions2023_Metal[sensor], resolutions2023_Gap[sensor]]
+        list_char = [characteristics2023_Overall[sensor], characteristics2023_Overall[sensor],
+                     characteristics2023_Metal[sensor], characteristics2023_Gap[sensor]]
+        for i, reg in enumerate(region):
+            res = list_res[i]
+            if not res:
+                # print(" (!) Sensor %s resolution is empty (!)"%sensor)
+                continue
+            info_dict["position_oneStrip%s"%reg] = res[0]
+            info_dict["position_oneStripRMS%s"%reg] = res[0]
+            info_dict["res_one_strip%s"%reg] = res[0]
+            info_dict["position_twoStrip%s"%reg] = res[1]
+            info_dict["res_two_strip%s"%reg] = res[1]
+            info_dict["time_resolution%s"%reg] = res[2]
+            info_dict["res_time%s"%reg] = res[2]
+            info_dict["efficiency_oneStrip%s"%reg] = res[3]
+            info_dict["efficiency_one_strip%s"%reg] = res[3]
+            info_dict["efficiency_twoStrip%s"%reg] = res[4]
+            info_dict["efficiency_two_strip%s"%reg] = res[4]
+
+            char = list_char[i]
+            if not char:
+                # print(" (!) Sensor %s characteristic is empty (!)"%sensor)
+                continue
+            info_dict["jitter%s"%reg] = char[0]
+            info_dict["amp_max%s"%reg] = char[1]
+            info_dict["rise_time%s"%reg] = char[2]
+            info_dict["baseline_rms%s"%reg] = char[3]
+            info_dict["charge%s"%reg] = char[4]
+
+        resolutions2023[sensor] = info_dict
+    return resolutions2023
 
 ######################  One strip resolution per channel  ######################
 # NOTE: Resolution values do NOT have tracker component removed
@@ -440,15 +444,17 @@ resolutions2023_onestrip = {
     "HPK_KOJI_20T_1P0_80P_60M_E240": [[14.2, 15.0, 14.3, 14.4, 14.6, 14.6, 14.5]],
 }
 
-resolutions2023OneStripChannel = {}
-for key, res_list in resolutions2023_onestrip.items():
-    info_dict = {}
-    # if not res_list:
-    #     print(" (!) Sensor %s per channel resolution is empty (!)"%sensor)
-    info_dict["resOneStrip"], info_dict["resolution_onestrip"] = res_list, res_list
-    info_dict["errOneStrip"] = [-1.0] * len(res_list)
+def _build_resolutions2023OneStripChannel():
+    resolutions2023OneStripChannel = {}
+    for key, res_list in resolutions2023_onestrip.items():
+        info_dict = {}
+        # if not res_list:
+        #     print(" (!) Sensor %s per channel resolution is empty (!)"%sensor)
+        info_dict["resOneStrip"], info_dict["resolution_onestrip"] = res_list, res_list
+        info_dict["errOneStrip"] = [-1.0] * len(res_list)
 
-    resolutions2023OneStripChannel[key] = info_dict
+        resolutions2023OneStripChannel[key] = info_dict
+    return resolutions2023OneStripChannel
 
 
 ################################################################################
@@ -463,28 +469,30 @@ geometry2023_biasscan = {
     "HPK_50um_500x500um_2x2pad_E600_FNAL": [190, 185, 180, 170, 160],
 }
 
-sensorsGeom2023_biasScan = {}
-for key, voltages in geometry2023_biasscan.items():
-    info = geometry2023_default[key]
-    for volt in voltages:
-        info_dict = {}
-        info_dict["sensor"] = "%s_%iV"%(info[0], volt)
-        info_dict["pitch"] = info[1]
-        info_dict["stripWidth"], info_dict["width"] = info[2], info[2]
-        info_dict["length"] = info[3]
-        info_dict["BV"], info_dict["voltage"] = volt, volt
-        info_dict["thickness"] = info[5]
-        info_dict["resistivity"] = info[6]
-        info_dict["resistivityNumber"] = 0
-        if info[6] == "E":
-            info_dict["resistivityNumber"] = 1600
-        elif info[6] == "C":
-            info_dict["resistivityNumber"] = 400
-        info_dict["capacitance"] = info[7]
-        info_dict["tag"] = info[8]
-
-        new_key = "%s_%iV"%(key, volt)
-        sensorsGeom2023_biasScan[new_key] = info_dict
+def _build_sensorsGeom2023_biasScan():
+    sensorsGeom2023_biasScan = {}
+    for key, voltages in geometry2023_biasscan.items():
+        info = geometry2023_default[key]
+        for volt in voltages:
+            info_dict = {}
+            info_dict["sensor"] = "%s_%iV"%(info[0], volt)
+            info_dict["pitch"] = info[1]
+            info_dict["stripWidth"], info_dict["width"] = info[2], info[2]
+            info_dict["length"] = info[3]
+            info_dict["BV"], info_dict["voltage"] = volt, volt
+            info_dict["thickness"] = info[5]
+            info_dict["resistivity"] = info[6]
+            info_dict["resistivityNumber"] = 0
+            if info[6] == "E":
+                info_dict["resistivityNumber"] = 1600
+            elif info[6] == "C":
+                info_dict["resistivityNumber"] = 400
+            info_dict["capacitance"] = info[7]
+            info_dict["tag"] = info[8]
+
+            new_key = "%s_%iV"%(key, volt)
+            sensorsGeom2023_biasScan[new_key] = info_dict
+    return sensorsGeom2023_biasScan
 
 ##########################  Characterization overall  ##########################
 # <time res [ps]>, <jitter [ps]>, <amp max [mV]>, <risetime [ps]>, <baseline_rms [mV]>, <charge [fC]>
@@ -557,17 +565,19 @@ characteristics2023_biasscan_Overall = {
 }
 
 
-variableInfo2023_biasScan = {}
-for key, values in characteristics2023_biasscan_Overall.items():
-    info_dict = {}
-    info_dict["time_resolution"] = values[0]
-    info_dict["jitter"] = values[1]
-    info_dict["amp_max"] = values[2]
-    info_dict["risetime"] = values[3]
-    info_dict["baseline"], info_dict["baseline_RMS"] = values[4], values[4]
-    info_dict["charge"] = values[5]
+def _build_variableInfo2023_biasScan():
+    variableInfo2023_biasScan = {}
+    for key, values in characteristics2023_biasscan_Overall.items():
+        info_dict = {}
+        info_dict["time_resolution"] = values[0]
+        info_dict["jitter"] = values[1]
+        info_dict["amp_max"] = values[2]
+        info_dict["risetime"] = values[3]
+        info_dict["baseline"], info_dict["baseline_RMS"] = values[4], values[4]
+        info_dict["charge"] = values[5]
 
-    variableInfo2023_biasScan[key] = info_dict
+        variableInfo2023_biasScan[key] = info_dict
+    return variableInfo2023_biasScan
 
 # TODO: Add dictionary with Metal and Gap values when they are implemented in pads
 
@@ -596,25 +606,27 @@ geometry2022_default = {
     "IHEP_W1_I_150up_80uw": ["IHEP_1cm_150up_80uw", 150, 80, 0.0, 185, 0.0, "Null", "Null"],
 }
 
-sensorsGeom2022 = {}
-for key, info in geometry2022_default.items():
-    info_dict = {}
-    info_dict["sensor"] = info[0]
-    info_dict["pitch"] = info[1]
-    info_dict["stripWidth"], info_dict["width"] = info[2], info[2]
-    info_dict["length"] = info[3]
-    info_dict["BV"], info_dict["voltage"] = info[4], info[4]
-    info_dict["thickness"] = info[5]
-    info_dict["resistivity"] = info[6]
-    info_dict["resistivityNumber"] = 0
-    if info[6] == "E":
-        info_dict["resistivityNumber"] = 1600
-    elif info[6] == "C":
-        info_dict["resistivityNumber"] = 400
-    info_dict["capacitance"] = info[7] if info[7] != "Null" else 0
-    info_dict["tag"] = info[0]
-
-    sensorsGeom2022[key] = info_dict
+def _build_sensorsGeom2022():
+    sensorsGeom2022 = {}
+    for key, info in geometry2022_default.items():
+        info_dict = {}
+        info_dict["sensor"] = info[0]
+        info_dict["pitch"] = info[1]
+        info_dict["stripWidth"], info_dict["width"] = info[2], info[2]
+        info_dict["length"] = info[3]
+        info_dict["BV"], info_dict["voltage"] = info[4], info[4]
+        info_dict["thickness"] = info[5]
+        info_dict["resistivity"] = info[6]
+        info_dict["resistivityNumber"] = 0
+        if info[6] == "E":
+            info_dict["resistivityNumber"] = 1600
+        elif info[6] == "C":
+            info_dict["resistivityNumber"] = 400
+        info_dict["capacitance"] = info[7] if info[7] != "Null" else 0
+        info_dict["tag"] = info[0]
+
+        sensorsGeom2022[key] = info_dict
+    return sensorsGeom2022
 
 #########################  Resolutions and efficiency  #########################
 # NOTE: Resolution values do NOT have tracker component removed
@@ -630,18 +642,21 @@ resolutions2022_Overall = {
     "BNL2021_22_medium_150up_80uw": [22.35, 8.01, 0.0, 0.50, 0.50],
 }
 
-resolutions2022 = {}
-for sensor in resolutions2022_Overall:
-    info_dict = {}
+def _build_resolutions2022():
+    resolutions2022 = {}
+    for sensor in resolutions2022_Overall:
+        info_dict = {}
+        res = resolutions2022_Overall[sensor]
 
-    info_dict["position_oneStrip"], info_dict["position_oneStripRMS"] = res[0], res[0]
-    info_dict["res_one_strip"] = res[0]
-    info_dict["position_twoStrip"], info_dict["res_two_strip"] = res[1], res[1]
-    info_dict["time_resolution"], info_dict["res_time"] = res[2], res[2]
-    info_dict["efficiency_oneStrip"], info_dict["efficiency_one_strip"] = res[3], res[3]
-    info_dict["efficiency_twoStrip"], info_dict["efficiency_two_strip"] = res[4], res[4]
+        info_dict["position_oneStrip"], info_dict["position_oneStripRMS"] = res[0], res[0]
+        info_dict["res_one_strip"] = res[0]
+        info_dict["position_twoStrip"], info_dict["res_two_strip"] = res[1], res[1]
+        info_dict["time_resolution"], info_dict["res_time"] = res[2], res[2]
+        info_dict["efficiency_oneStrip"], info_dict["efficiency_one_strip"] = res[3], res[3]
+        info_dict["efficiency_twoStrip"], info_dict["efficiency_two_strip"] = res[4], res[4]
 
-    resolutions2022[sensor] = info_dict
+        resolutions2022[sensor] = info_dict
+    return resolutions2022
 
 ######################  One strip resolution per channel  ######################
 # NOTE: Resolution values do NOT have tracker component removed
@@ -655,12 +670,130 @@ resolutions2022_onestrip = {
     "BNL2021_22_medium_150up_80uw": [],
 }
 
-resolutions2022OneStripChannel = {}
-for key, res_list in resolutions2022_onestrip.items():
-    info_dict = {}
-    # if not res_list:
-    #    print(" (!) Sensor %s per channel resolution is empty (!)"%sensor)
-    info_dict["resOneStrip"], info_dict["resolution_onestrip"] = res_list, res_list
-    info_dict["errOneStrip"] = [1.0] * len(res_list)
+def _build_resolutions2022OneStripChannel():
+    resolutions2022OneStripChannel = {}
+    for key, res_list in resolutions2022_onestrip.items():
+        info_dict = {}
+        # if not res_list:
+        #    print(" (!) Sensor %s per channel resolution is empty (!)"%sensor)
+        info_dict["resOneStrip"], info_dict["resolution_onestrip"] = res_list, res_list
+        info_dict["errOneStrip"] = [1.0] * len(res_list)
+
+        resolutions2022OneStripChannel[key] = info_dict
+    return resolutions2022OneStripChannel
+
+
+################################################################################
+# -------------------------  Lazy tables and registry  ------------------------- #
+################################################################################
+# The derived dictionaries above (sensorsGeom2023, resolutions2023, ...) are
+# only built the first time they are used, so importing this module is cheap
+# for macros that only need one sensor.
+_derived = {
+    "sensorsGeom2023": _build_sensorsGeom2023,
+    "resolutions2023": _build_resolutions2023,
+    "resolutions2023OneStripChannel": _build_resolutions2023OneStripChannel,
+    "sensorsGeom2023_biasScan": _build_sensorsGeom2023_biasScan,
+    "variableInfo2023_biasScan": _build_variableInfo2023_biasScan,
+    "sensorsGeom2022": _build_sensorsGeom2022,
+    "resolutions2022": _build_resolutions2022,
+    "resolutions2022OneStripChannel": _build_resolutions2022OneStripChannel,
+}
 
-    resolutions2022OneStripChannel[key] = info_dict
+def __getattr__(name):
+    if name in _derived:
+        value = _derived[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r"%(__name__, name))
+
+def _table(name):
+    return globals()[name] if name in globals() else __getattr__(name)
+
+def RemoveBV(name):
+    last_element = name.split('_')[-1]
+    if (last_element[-1] == "V"):
+        name = name.replace("_%s"%last_element, "")
+
+    return name
+
+class SensorRegistry:
+    """Indexed access to the sensor tables.
+
+    Sensors are looked up by dataset name (with or without bias voltage) and
+    can be selected with compound queries on the indexed fields, e.g.
+        registry.query(pitch=500, thickness=20, manufacturer="HPK")
+    manufacturer matches any part of the sensor name, so "BNL" also selects
+    the BNL2021_* sensors, as GetSensorList always did.
+    Tables and indexes are built on first use; a query costs O(result).
+    """
+    indexedFields = ["pitch", "width", "thickness", "length", "resistivity", "tag"]
+    # Lookup order, as in myStyle.GetGeometry / GetResolutions
+    geometryTables = ["sensorsGeom2022", "sensorsGeom2023"]
+    resolutionTables = ["resolutions2022", "resolutions2023"]
+    channelResolutionTables = ["resolutions2022OneStripChannel", "resolutions2023OneStripChannel"]
+
+    def __init__(self):
+        self._sensors = None
+        self._indexes = None
+        self._order = None
+        self._names = {}
+
+    def sensors(self):
+        # {sensor key: geometry dict} of all years
+        if self._sensors is None:
+            self._sensors = {}
+            for table in self.geometryTables:
+                for key, info in _table(table).items():
+                    self._sensors.setdefault(key, info)
+        return self._sensors
+
+    def key(self, name):
+        if name not in self._names:
+            self._names[name] = RemoveBV(name)
+        return self._names[name]
+
+    def get(self, name, default=None):
+        # Geometry dict of a dataset name, e.g. HPK_KOJI_20T_1P0_80P_60M_E240_112V
+        return self.sensors().get(self.key(name), default)
+
+    def __contains__(self, name):
+        return self.key(name) in self.sensors()
+
+    def resolutions(self, name, per_channel=False, default=None):
+        key = self.key(name)
+        for table in (self.channelResolutionTables if per_channel else self.resolutionTables):
+            values = _table(table)
+            if key in values:
+                return values[key]
+        return default
+
+    def _build_indexes(self):
+        self._order = dict((key, i) for i, key in enumerate(self.sensors()))
+        self._indexes = dict((field, {}) for field in self.indexedFields)
+        for key, info in self.sensors().items():
+            for field in self.indexedFields:
+                self._indexes[field].setdefault(info.get(field), []).append(key)
+
+    def _matches(self, key, field, value):
+        if field == "manufacturer":
+            return value in key
+        return self.sensors()[key].get(field) == value
+
+    def query(self, **conditions):
+        """Sensor keys (in table order) matching all field=value conditions."""
+        if self._indexes is None:
+            self._build_indexes()
+        sensors = self.sensors()
+        indexed = [self._indexes[f].get(v, []) for f, v in conditions.items() if f in self._indexes]
+        others = [(f, v) for f, v in conditions.items() if f not in self._indexes]
+        if not indexed:
+            indexed = [list(sensors)]
+        indexed.sort(key=len)
+        candidates = indexed[0]
+        rest = [set(keys) for keys in indexed[1:]]
+        return [key for key in candidates
+                if all(key in keys for keys in rest)
+                and all(self._matches(key, f, v) for f, v in others)]
+
+registry = SensorRegistry()
@@ -49,7 +49,9 @@ def enum_folder(mypath):
 def GetPlotsDir(outdir, macro_title):
     outdir_tmp = os.path.join(outdir, macro_title)
     if not (os.path.exists(outdir_tmp)):
-        outdir_tmp = CreateFolder(outdir, macro_title, True)
+        # exist_ok: macros running in parallel (pipeline.py) share folders
+        os.makedirs(outdir_tmp, exist_ok=True)
+        print(outdir_tmp,"created.")
 
     return outdir_tmp
 
@@ -188,24 +190,14 @@ def GetColorsCompare(n_sensors):
 
 ### Names and strings
 def GetGeometry(name):
-    key_name = RemoveBV(name)
-
-    sensor_dict = {}
-    if (key_name in msi.sensorsGeom2022):
-        sensor_dict = msi.sensorsGeom2022[key_name]
-    elif (key_name in msi.sensorsGeom2023):
-        sensor_dict = msi.sensorsGeom2023[key_name]
-    else:
+    sensor_dict = msi.registry.get(name, {})
+    if not sensor_dict:
         print("(!!!) Sensor not found in any dictionary :(")
 
     return sensor_dict
 
 def RemoveBV(name):
-    last_element = name.split('_')[-1]
-    if (last_element[-1] == "V"):
-        name = name.replace("_%s"%last_element, "")
-
-    return name
+    return msi.RemoveBV(name)
 
 def GetBV(name):
     last_element = name.split('_')[-1]
@@ -219,17 +211,8 @@ def GetBV(name):
     return biasvolt
 
 def GetResolutions(name, per_channel=False):
-    key_name = RemoveBV(name)
-
-    reference_dict2022 = msi.resolutions2022 if not per_channel else msi.resolutions2022OneStripChannel
-    reference_dict2023 = msi.resolutions2023 if not per_channel else msi.resolutions2023OneStripChannel
-
-    sensor_dict = {}
-    if (key_name in reference_dict2022):
-        sensor_dict = reference_dict2022[key_name]
-    elif (key_name in reference_dict2023):
-        sensor_dict = reference_dict2023[key_name]
-    else:
+    sensor_dict = msi.registry.resolutions(name, per_channel)
+    if sensor_dict is None:
         print("(!!!) Sensor not found in any dictionary :(")
         exit()
 
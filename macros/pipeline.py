@@ -0,0 +1,324 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import optparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from run import plots
+from mySensorInfo import RemoveBV
+
+# Parallel replacement of test/sh/runEverything*.sh.
+# Every step of a campaign is a task with its dependencies:
+#     InitialAnalyzer -> FindDelayCorrections -> FindInputHistos4YReco -> Analyze
+#     Analyze -> plot macros, DoPositionRecoFit
+#     plots -> Print_Resolution, Plot_Summary_XRes_Time
+# Tasks whose dependencies are done run concurrently, different sensors and
+# independent plots included, within a core budget. Each task writes its own
+# log, and the tasks downstream of a failure are skipped and reported.
+#
+# Runs are incremental: each task is fingerprinted from its command line,
+# its input files (macro source and local modules, binaries, outputs of the
+# tasks it depends on), the dataset's entries in mySensorInfo.py and
+# interface/Geometry*.h, and the fingerprints of its dependencies. A task
+# whose fingerprint matches the last successful run and whose outputs exist
+# is skipped, so only the stages downstream of a change are re-run.
+#
+#     python pipeline.py -C 2023_MayStrips -j 32
+#     python pipeline.py -C 2023_MayStrips -D HPK_KOJI_20T_1P0_80P_60M_E240_112V -j 8
+
+macroDir = os.path.dirname(os.path.abspath(__file__))
+testDir = os.path.abspath(os.path.join(macroDir, "..", "test"))
+interfaceDir = os.path.abspath(os.path.join(macroDir, "..", "interface"))
+
+class Task:
+    def __init__(self, name, cmd, cwd, deps=(), inputs=(), outputs=(), extra=""):
+        self.name = name
+        self.cmd = cmd
+        self.cwd = cwd
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.extra = extra
+        self.fingerprint = ""
+        self.status = "pending"
+        self.duration = 0.0
+        self.log = ""
+
+################################################################################
+# Input fingerprints
+
+# Source-like files are hashed by content, data files (ROOT, binaries) by size and mtime
+contentSuffixes = (".py", ".h", ".C", ".cc", ".cfg", ".txt")
+
+def fileDigest(path):
+    if not os.path.exists(path):
+        return "missing"
+    if path.endswith(contentSuffixes):
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    stat = os.stat(path)
+    return "%i:%i"%(stat.st_size, stat.st_mtime_ns)
+
+# mySensorInfo only enters through the dataset's own entries, see sensorInfoEntries
+untrackedModules = ["mySensorInfo"]
+
+def localModules(macro, found=None):
+    # The macro and the macros/ modules it imports, recursively
+    found = set() if found is None else found
+    path = os.path.join(macroDir, macro)
+    if path in found or not os.path.exists(path):
+        return found
+    found.add(path)
+    with open(path) as f:
+        source = f.read()
+    for m in re.findall(r"^\s*(?:import|from)\s+(\w+)", source, re.M):
+        if m not in untrackedModules:
+            localModules(m + ".py", found)
+    return found
+
+def sensorInfoEntries(dataset):
+    # Lines of mySensorInfo.py that describe this sensor
+    key = '"%s"'%RemoveBV(dataset)
+    with open(os.path.join(macroDir, "mySensorInfo.py")) as f:
+        return "".join(line for line in f if key in line)
+
+def sampleEntries(dataset):
+    # Lines of the test/*.cfg sample lists that mention this dataset
+    entries = ""
+    for cfg in ("sampleCollections.cfg", "sampleSets.cfg"):
+        with open(os.path.join(testDir, cfg)) as f:
+            entries += "".join(line for line in f if dataset in line)
+    return entries
+
+def geometryEntries(dataset):
+    # Geometry class of this sensor in interface/Geometry*.h (whole headers if not found)
+    key = "class %s_"%RemoveBV(dataset)
+    headers = sorted(os.path.join(interfaceDir, h) for h in os.listdir(interfaceDir) if h.startswith("Geometry"))
+    entries = ""
+    for header in headers:
+        with open(header) as f:
+            lines = f.readlines()
+        for i, line in enumerate(lines):
+            if line.startswith(key):
+                end = next((j for j in range(i, len(lines)) if lines[j].startswith("};")), len(lines) - 1)
+                entries += "".join(lines[i:end+1])
+    if not entries:
+        entries = "".join(fileDigest(h) for h in headers)
+    return entries
+
+def computeFingerprint(task, tasks):
+    h = hashlib.sha1()
+    h.update(repr((task.cmd, os.path.relpath(task.cwd, macroDir))).encode())
+    for path in sorted(task.inputs):
+        h.update(("%s=%s\n"%(os.path.relpath(path, macroDir), fileDigest(path))).encode())
+    h.update(task.extra.encode())
+    for d in sorted(task.deps):
+        h.update(tasks[d].fingerprint.encode())
+    return h.hexdigest()
+
+def sensorCampaign(name, x, posFit, summary, args={}):
+    # x: -x of the VsX plots, posFit: (--xmax, --fitOrder) of DoPositionRecoFit,
+    # summary: (-x, -y) of Plot_Summary_XRes_Time, args: per plot extra options
+    return {"name": name, "x": x, "posFit": posFit, "summary": summary, "args": args}
+
+hpk500PArgs = {}
+hpk80PArgs = {"xres": ["-y", "50"], "combpos": ["-y", "50"]}
+
+campaigns = {
+    "2023_MayStrips": [
+        sensorCampaign("HPK_W9_15_2_20T_1P0_500P_50M_E600_114V",  "1.9", ("0.85", "5"), ("1.5", "80"), hpk500PArgs),
+        sensorCampaign("HPK_W4_17_2_50T_1P0_500P_50M_C240_204V",  "1.9", ("0.69", "5"), ("1.5", "80"), hpk500PArgs),
+        sensorCampaign("HPK_W8_17_2_50T_1P0_500P_50M_C600_200V",  "1.9", ("0.71", "5"), ("1.5", "80"), hpk500PArgs),
+        sensorCampaign("HPK_W2_3_2_50T_1P0_500P_50M_E240_180V",   "1.9", ("0.84", "5"), ("1.5", "80"), hpk500PArgs),
+        sensorCampaign("HPK_W5_17_2_50T_1P0_500P_50M_E600_190V",  "1.9", ("0.85", "5"), ("1.5", "80"), hpk500PArgs),
+        sensorCampaign("HPK_W9_14_2_20T_1P0_500P_100M_E600_112V", "1.9", ("0.85", "5"), ("1.5", "80"), hpk500PArgs),
+        sensorCampaign("HPK_W8_18_2_50T_1P0_500P_100M_C600_208V", "1.9", ("0.71", "5"), ("1.5", "80"), hpk500PArgs),
+        sensorCampaign("HPK_KOJI_20T_1P0_80P_60M_E240_112V",      "0.6", ("0.62", "5"), ("0.3", "60"), hpk80PArgs),
+        sensorCampaign("HPK_KOJI_50T_1P0_80P_60M_E240_190V",      "0.6", ("0.62", "5"), ("0.3", "60"), hpk80PArgs),
+    ],
+}
+
+# Plots run with default cuts, with tight cuts (-t), and their extra options per mode
+defaultPlots = ["maps", "charge", "cutflow", "risetime", "jitter", "amp", "ampxy", "res1d", "eff", "xres", "timeres"]
+tightPlots = ["risetime", "jitter", "amp", "ampxy", "res1d", "eff", "xres", "combpos", "timeres"]
+defaultOnlyArgs = {"res1d": ["-c"]}
+# Plots reading the output of another plot of the same mode
+plotDeps = {"combpos": ["eff"]}
+
+def python(macro, *args):
+    return [sys.executable, macro] + list(args)
+
+def getSensorTasks(sensor):
+    name = sensor["name"]
+    t = lambda step: "%s/%s"%(name, step)
+    outdir = os.path.abspath(os.path.join(macroDir, "..", "output", name))
+    out = lambda f: os.path.join(outdir, f)
+    binary = os.path.join(testDir, "MyAnalysis")
+    sensorInfo = sensorInfoEntries(name)
+    geometry = geometryEntries(name) + sampleEntries(name) + sensorInfo
+    macroTask = lambda step, macro, args, deps, inputs=(), outputs=(): \
+        Task(t(step), python(macro, *args), macroDir, deps, sorted(localModules(macro)) + list(inputs), outputs, sensorInfo)
+
+    tasks = [
+        Task(t("InitialAnalyzer"), ["./MyAnalysis", "-A", "InitialAnalyzer", "-D", name], testDir, [],
+             [binary], [out("%s_InitialAnalyzer.root"%name)], geometry),
+        macroTask("FindDelayCorrections", "FindDelayCorrections.py", ["-D", name], [t("InitialAnalyzer")],
+                  [out("%s_InitialAnalyzer.root"%name)], [out("delayCorrections.root")]),
+        macroTask("FindInputHistos4YReco", "FindInputHistos4YReco.py", ["-D", name, "-I"], [t("FindDelayCorrections")],
+                  [out("%s_InitialAnalyzer.root"%name)], [out("yRecoHistos.root")]),
+        Task(t("Analyze"), ["./MyAnalysis", "-A", "Analyze", "-D", name], testDir, [t("FindInputHistos4YReco")],
+             [binary, out("delayCorrections.root"), out("yRecoHistos.root")], [out("%s_Analyze.root"%name)], geometry),
+        macroTask("DoPositionRecoFit", "DoPositionRecoFit.py", ["-D", name, "--xmax", sensor["posFit"][0], "--fitOrder", sensor["posFit"][1]],
+                  [t("Analyze")], [out("%s_Analyze.root"%name)], [out("positionRecoFit.root")]),
+    ]
+
+    for tight, plotNames in ((False, defaultPlots), (True, tightPlots)):
+        for plot in plotNames:
+            macro, defaults, acceptsX, _ = plots[plot]
+            args = ["-D", name] + sensor["args"].get(plot, defaults)
+            if acceptsX:
+                args += ["-x", sensor["x"]]
+            if tight:
+                args.append("-t")
+            else:
+                args += defaultOnlyArgs.get(plot, [])
+            suffix = "_tight" if tight else ""
+            deps = [t("Analyze")] + [t(d + suffix) for d in plotDeps.get(plot, [])]
+            tasks.append(macroTask(plot + suffix, macro, args, deps, [out("%s_Analyze.root"%name)]))
+
+    tasks += [
+        macroTask("Print_Resolution", "Print_Resolution.py", ["-D", name], [t("res1d"), t("res1d_tight"), t("cutflow")]),
+        macroTask("Plot_Summary_XRes_Time", "Plot_Summary_XRes_Time.py", ["-D", name, "-x", sensor["summary"][0], "-y", sensor["summary"][1]],
+                  [t("combpos_tight"), t("timeres_tight")], [out("%s_Analyze.root"%name)]),
+    ]
+    return tasks
+
+class Scheduler:
+    def __init__(self, tasks, cores, logdir, statefile=None, force=False):
+        self.tasks = dict((task.name, task) for task in tasks)
+        self.cores = cores
+        self.logdir = logdir
+        self.lock = threading.Lock()
+        self.statefile = statefile
+        self.state = {}
+        if statefile and os.path.exists(statefile) and not force:
+            with open(statefile) as f:
+                self.state = json.load(f)
+
+    def upToDate(self, task):
+        if not task.fingerprint:
+            task.fingerprint = computeFingerprint(task, self.tasks)
+        return self.state.get(task.name) == task.fingerprint and all(os.path.exists(o) for o in task.outputs)
+
+    def saveState(self, task):
+        if not self.statefile:
+            return
+        with self.lock:
+            self.state[task.name] = task.fingerprint
+            os.makedirs(os.path.dirname(self.statefile), exist_ok=True)
+            tmp = self.statefile + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.state, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.statefile)
+
+    def ready(self, task):
+        return all(self.tasks[d].status in ("done", "uptodate") for d in task.deps)
+
+    def blocked(self, task):
+        return any(self.tasks[d].status in ("failed", "skipped") for d in task.deps)
+
+    def execute(self, task):
+        task.log = os.path.join(self.logdir, task.name + ".log")
+        os.makedirs(os.path.dirname(task.log), exist_ok=True)
+        start = time.time()
+        with open(task.log, "w") as log:
+            log.write("# cd %s && %s\n"%(task.cwd, " ".join(task.cmd)))
+            log.flush()
+            try:
+                code = subprocess.call(task.cmd, cwd=task.cwd, stdout=log, stderr=subprocess.STDOUT)
+            except OSError as e:
+                log.write("ERROR: %s\n"%e)
+                code = -1
+        task.duration = time.time() - start
+        return code
+
+    def report(self, task):
+        with self.lock:
+            ndone = sum(t.status in ("done", "uptodate", "failed", "skipped") for t in self.tasks.values())
+            print("[%3d/%3d] %-8s %-60s %7.1f s"%(ndone, len(self.tasks), task.status, task.name, task.duration))
+            sys.stdout.flush()
+
+    def run(self):
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.cores) as pool:
+            while True:
+                for task in self.tasks.values():
+                    if task.status != "pending":
+                        continue
+                    if self.blocked(task):
+                        task.status = "skipped"
+                        self.report(task)
+                    elif self.ready(task) and self.upToDate(task):
+                        task.status = "uptodate"
+                        self.report(task)
+                    elif self.ready(task) and len(running) < self.cores:
+                        task.status = "running"
+                        running[pool.submit(self.execute, task)] = task
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    task.status = "done" if future.result() == 0 else "failed"
+                    if task.status == "done":
+                        self.saveState(task)
+                    self.report(task)
+        return [t for t in self.tasks.values() if t.status not in ("done", "uptodate")]
+
+def summary(tasks, notDone):
+    print("\n>> %i tasks, %i run, %i up to date, %i failed, %i skipped"%(len(tasks),
+          sum(t.status == "done" for t in tasks), sum(t.status == "uptodate" for t in tasks),
+          sum(t.status == "failed" for t in notDone), sum(t.status == "skipped" for t in notDone)))
+    for task in notDone:
+        if task.status == "failed":
+            print("   FAILED  %-60s log: %s"%(task.name, task.log))
+    for task in notDone:
+        if task.status == "skipped":
+            print("   skipped %s"%task.name)
+
+def main():
+    parser = optparse.OptionParser("usage: %prog [options]\n")
+    parser.add_option('-C', dest='campaign', default = "2023_MayStrips", help="Campaign to run (%s)"%",".join(campaigns))
+    parser.add_option('-D', dest='Dataset', action='append', default = [], help="Only run these sensors of the campaign")
+    parser.add_option('-j', '--cores', dest='cores', type='int', default = os.cpu_count(), help="Number of tasks run at the same time")
+    parser.add_option('-l', '--logdir', dest='logdir', default = "../output/pipeline_logs/", help="Directory of the task logs")
+    parser.add_option('-s', '--state', dest='statefile', default = "../output/pipeline_state.json", help="Fingerprints of the last successful runs")
+    parser.add_option('-f', '--force', dest='force', action='store_true', default = False, help="Run every task, even if up to date")
+    parser.add_option('-n', '--dry-run', dest='dryRun', action='store_true', default = False, help="Only print the tasks")
+    options, args = parser.parse_args()
+
+    if options.campaign not in campaigns:
+        parser.error("unknown campaign %s"%options.campaign)
+    sensors = [s for s in campaigns[options.campaign] if not options.Dataset or s["name"] in options.Dataset]
+    tasks = [task for sensor in sensors for task in getSensorTasks(sensor)]
+
+    if options.dryRun:
+        for task in tasks:
+            print("%-60s <- %s\n    cd %s && %s"%(task.name, ", ".join(task.deps), os.path.relpath(task.cwd), " ".join(task.cmd)))
+        return
+
+    logdir = os.path.abspath(os.path.join(macroDir, options.logdir))
+    print(">> Running %i tasks of %i sensors on %i cores, logs in %s"%(len(tasks), len(sensors), options.cores, logdir))
+    statefile = os.path.abspath(os.path.join(macroDir, options.statefile))
+    notDone = Scheduler(tasks, max(options.cores, 1), logdir, statefile, options.force).run()
+    summary(tasks, notDone)
+    if notDone:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
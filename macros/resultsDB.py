@@ -0,0 +1,188 @@
+import os
+import sys
+import sqlite3
+import datetime
+import subprocess
+
+import mySensorInfo as msi
+
+# Results database written by the macros that measure sensor performance.
+# Values are stored in an SQLite file, one row per
+#     (sensor, bias voltage, region, cut variant, quantity, channel)
+# together with their provenance (macro, command line, input files, git
+# commit, time), instead of being pasted by hand into mySensorInfo.py.
+#
+#     db = resultsDB.ResultsDB()
+#     db.record(dataset, {"time_resolution": 32.1}, region="Overall", variant="tight", inputs=[path])
+#     values = db.table(["time_resolution", "res_two_strip"], region="Overall", variant="tight")
+
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "output", "results.sqlite")
+
+regions = ["Overall", "Metal", "Gap", "MidGap"]
+# Suffix of each region in the mySensorInfo dictionaries
+regionSuffix = {"Overall": "", "Metal": "_m", "Gap": "_g", "MidGap": "_mg"}
+
+# Same aliases as the mySensorInfo dictionaries use for each stored quantity
+resolutionAliases = {
+    "res_one_strip": ["position_oneStrip", "position_oneStripRMS"],
+    "res_two_strip": ["position_twoStrip"],
+    "time_resolution": ["res_time"],
+    "efficiency_one_strip": ["efficiency_oneStrip"],
+    "efficiency_two_strip": ["efficiency_twoStrip"],
+    "rise_time": ["risetime"],
+    "baseline_rms": ["baseline", "baseline_RMS"],
+}
+
+schema = """
+CREATE TABLE IF NOT EXISTS results (
+    sensor       TEXT NOT NULL,
+    bias_voltage REAL NOT NULL,
+    region       TEXT NOT NULL,
+    variant      TEXT NOT NULL,
+    quantity     TEXT NOT NULL,
+    channel      TEXT NOT NULL DEFAULT '',
+    value        REAL,
+    error        REAL,
+    dataset      TEXT,
+    macro        TEXT,
+    command      TEXT,
+    inputs       TEXT,
+    git_commit   TEXT,
+    created      TEXT,
+    PRIMARY KEY (sensor, bias_voltage, region, variant, quantity, channel)
+);
+CREATE INDEX IF NOT EXISTS results_by_quantity ON results (quantity, region, variant);
+CREATE INDEX IF NOT EXISTS results_by_dataset ON results (dataset);
+"""
+
+def withAliases(values, suffix=""):
+    # Copy of {quantity: value} with the mySensorInfo names of each quantity
+    info_dict = {}
+    for quantity, value in values.items():
+        for name in [quantity] + resolutionAliases.get(quantity, []):
+            info_dict[name + suffix] = value
+    return info_dict
+
+def splitDataset(dataset):
+    # (sensor key, bias voltage) of a dataset name; default BV if not in the name
+    sensor = msi.RemoveBV(dataset)
+    if sensor != dataset:
+        return sensor, float(dataset.split('_')[-1][:-1])
+    geometry = msi.registry.get(sensor, {})
+    return sensor, float(geometry.get("BV", 0.0))
+
+def datasetName(sensor, bv):
+    # Inverse of splitDataset, keeping non integer bias voltages (e.g. 110.5V)
+    return "%s_%gV"%(sensor, bv)
+
+def _gitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+class ResultsDB:
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path if path else default_path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Several pipeline tasks may write at the same time: wait for the lock
+        self.connection = sqlite3.connect(self.path, timeout=120)
+        self.connection.executescript(schema)
+        self._commit = None
+
+    def close(self):
+        self.connection.close()
+
+    def provenance(self, inputs=()):
+        if self._commit is None:
+            self._commit = _gitCommit()
+        return {"macro": os.path.basename(sys.argv[0]),
+                "command": " ".join(sys.argv),
+                "inputs": ";".join(os.path.abspath(i) for i in inputs),
+                "git_commit": self._commit,
+                "created": datetime.datetime.now().isoformat(timespec="seconds")}
+
+    def record(self, dataset, values, region="Overall", variant="default", errors=None, channel="", inputs=()):
+        """Store {quantity: value} of a dataset, replacing previous values of the same key."""
+        errors = errors or {}
+        self._insert(dataset, [(quantity, channel, value, errors.get(quantity)) for quantity, value in values.items()],
+                     region, variant, inputs)
+
+    def record_channels(self, dataset, quantity, channel_values, region="Overall", variant="default", inputs=()):
+        # channel_values[row][column], stored with channel "<row>_<column>"
+        self._insert(dataset, [(quantity, "%i_%i"%(r, c), value, None)
+                               for r, row in enumerate(channel_values) for c, value in enumerate(row)],
+                     region, variant, inputs)
+
+    def _insert(self, dataset, values, region, variant, inputs):
+        sensor, bv = splitDataset(dataset)
+        prov = self.provenance(inputs)
+        rows = [(sensor, bv, region, variant, quantity, channel, float(value), error, dataset,
+                 prov["macro"], prov["command"], prov["inputs"], prov["git_commit"], prov["created"])
+                for quantity, channel, value, error in values]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+
+    def get(self, dataset, region="Overall", variant="default"):
+        # {quantity: value} of one dataset (channel values excluded)
+        sensor, bv = splitDataset(dataset)
+        cursor = self.connection.execute(
+            "SELECT quantity, value FROM results WHERE sensor=? AND bias_voltage=? AND region=? AND variant=? AND channel=''",
+            (sensor, bv, region, variant))
+        return dict(cursor.fetchall())
+
+    def channels(self, dataset, quantity, region="Overall", variant="default"):
+        # Per channel values as [row][column], as in mySensorInfo.resolutions2023_onestrip
+        sensor, bv = splitDataset(dataset)
+        cursor = self.connection.execute(
+            "SELECT channel, value FROM results WHERE sensor=? AND bias_voltage=? AND region=? AND variant=? AND quantity=? AND channel!=''",
+            (sensor, bv, region, variant, quantity))
+        # Files written before the separator have two digit "<row><column>" channels
+        values = [tuple(int(i) for i in (ch.split("_") if "_" in ch else ch)) + (v,) for ch, v in cursor.fetchall()]
+        if not values:
+            return []
+        table = [[0.0] * (max(v[1] for v in values) + 1) for i in range(max(v[0] for v in values) + 1)]
+        for r, c, v in values:
+            table[r][c] = v
+        return table
+
+    def table(self, quantities, region="Overall", variant="default"):
+        """{dataset: {quantity: value}} of all datasets, in a single indexed query."""
+        marks = ",".join("?" * len(quantities))
+        cursor = self.connection.execute(
+            "SELECT sensor, bias_voltage, quantity, value FROM results "
+            "WHERE quantity IN (%s) AND region=? AND variant=? AND channel=''"%marks,
+            list(quantities) + [region, variant])
+        result = {}
+        for sensor, bv, quantity, value in cursor.fetchall():
+            result.setdefault(datasetName(sensor, bv), {})[quantity] = value
+        return result
+
+    def resolutions(self, dataset, variants=("tight", "default")):
+        # Values of all regions in the layout of mySensorInfo.resolutions2023,
+        # each region taken from the first variant that has values
+        info_dict = {}
+        for reg in regions:
+            for variant in variants:
+                values = self.get(dataset, reg, variant)
+                if values:
+                    info_dict.update(withAliases(values, regionSuffix[reg]))
+                    break
+        return info_dict
+
+    def all_resolutions(self, variants=("tight", "default")):
+        """{dataset: resolutions(dataset)} of every dataset, in a single query."""
+        marks = ",".join("?" * len(variants))
+        cursor = self.connection.execute(
+            "SELECT sensor, bias_voltage, region, variant, quantity, value FROM results "
+            "WHERE channel='' AND variant IN (%s)"%marks, list(variants))
+        found = {}
+        for sensor, bv, region, variant, quantity, value in cursor.fetchall():
+            if region in regionSuffix:
+                found.setdefault((datasetName(sensor, bv), region), {}).setdefault(variant, {})[quantity] = value
+        result = {}
+        for (dataset, region), byVariant in found.items():
+            variant = next(v for v in variants if v in byVariant)
+            result.setdefault(dataset, {}).update(withAliases(byVariant[variant], regionSuffix[region]))
+        return result
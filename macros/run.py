@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import runpy
+import shlex
+import optparse
+import traceback
+
+# Run a list of plot macros for one sensor inside a single interpreter.
+# PyROOT, myStyle, the compiled langaus library and the _Analyze.root handles
+# of histCache are loaded once and shared by all the macros, instead of being
+# paid again by each `python Plot_*.py -D sensor` process.
+#
+#     python run.py -D HPK_W9_15_2_20T_1P0_500P_50M_E600_114V -x 1.9 --both
+#     python -m macros.run -D <sensor> --plots amp,eff,timeres -x 1.9
+
+macroDir = os.path.dirname(os.path.abspath(__file__))
+
+# name: (macro, default options, accepts -x, accepts -t)
+# Default options follow test/sh/runEverything2023_MayStrips.sh
+plotList = [
+    ("maps",     ("Plot_SimpleXYMaps.py",                 [],                         False, False)),
+    ("charge",   ("Plot_AmpChargeVsXY.py",                [],                         False, False)),
+    ("cutflow",  ("Plot_CutFlow.py",                      [],                         False, False)),
+    ("risetime", ("Plot_RisetimeVsX.py",                  [],                         True,  True)),
+    ("jitter",   ("Plot_JitterVsX.py",                    [],                         True,  True)),
+    ("amp",      ("Plot_AmplitudeVsX.py",                 ["-y", "200.0"],            True,  True)),
+    ("ampxy",    ("Plot_AmplitudeVsXY.py",                ["-z", "0.0", "-Z", "200.0"], False, True)),
+    ("res1d",    ("Plot_Resolution1D.py",                 [],                         False, True)),
+    ("eff",      ("Plot_Efficiency.py",                   [],                         True,  True)),
+    ("xres",     ("Plot_ResolutionXRecoVsX.py",           [],                         True,  True)),
+    ("combpos",  ("Plot_ResolutionCombinedPosMethod1.py", [],                         True,  True)),
+    ("timeres",  ("Plot_ResolutionTimeVsX.py",            ["-y", "100"],              True,  True)),
+]
+plots = dict(plotList)
+# Options only used without -t, and plots only run with -t (as pipeline.py)
+defaultOnlyArgs = {"res1d": ["-c"]}
+tightOnly = ["combpos"]
+
+def runMacro(macro, args):
+    # Execute macro as __main__ with args, as `python macro args` would
+    argv = sys.argv
+    sys.argv = [macro] + args
+    try:
+        runpy.run_path(os.path.join(macroDir, macro), run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise
+    finally:
+        sys.argv = argv
+
+def getJobs(options):
+    names = list(plots) if (options.plots == "all") else [p.strip() for p in options.plots.split(",") if p.strip()]
+    unknown = [n for n in names if n not in plots]
+    if unknown:
+        raise Exception("ERROR: unknown plots %s, choose from %s"%(",".join(unknown), ",".join(plots)))
+
+    extra = {}
+    for e in options.extra:
+        name, _, args = e.partition("=")
+        extra[name] = shlex.split(args)
+
+    modes = [False, True] if options.both else [options.useTight]
+    jobs = []
+    for tight in modes:
+        for name in names:
+            macro, defaults, acceptsX, acceptsTight = plots[name]
+            if (tight and not acceptsTight) or (not tight and name in tightOnly):
+                continue
+            args = ["-D", options.Dataset] + extra.get(name, defaults)
+            if not tight and name not in extra:
+                args += defaultOnlyArgs.get(name, [])
+            if acceptsX and options.xlength:
+                args += ["-x", options.xlength]
+            if tight:
+                args.append("-t")
+            jobs.append((name, macro, args))
+    return jobs
+
+def main():
+    parser = optparse.OptionParser("usage: %prog [options]\n")
+    parser.add_option('-D', dest='Dataset', default = "", help="Dataset, which determines filepath")
+    parser.add_option('-p', '--plots', dest='plots', default = "all", help="Comma separated plots to run (%s) or all"%",".join(plots))
+    parser.add_option('-x', '--xlength', dest='xlength', default = "", help="X axis range [-x, x], passed to the macros that take it")
+    parser.add_option('-t', dest='useTight', action='store_true', default = False, help="Use tight cut for pass")
+    parser.add_option('-b', '--both', dest='both', action='store_true', default = False, help="Run every plot with default and tight cuts")
+    parser.add_option('-a', '--args', dest='extra', action='append', default = [], help="Replace default options of a plot, e.g. -a 'amp=-y 250'")
+    parser.add_option('-k', '--keep-going', dest='keepGoing', action='store_true', default = False, help="Continue after a failing plot")
+    options, args = parser.parse_args()
+
+    if not options.Dataset:
+        parser.error("a dataset is needed (-D)")
+
+    # Macros use paths relative to the macros directory
+    os.chdir(macroDir)
+    if macroDir not in sys.path:
+        sys.path.insert(0, macroDir)
+
+    failed = []
+    start = time.time()
+    for name, macro, args in getJobs(options):
+        print("\n>> [%s] python %s %s"%(name, macro, " ".join(args)))
+        t0 = time.time()
+        try:
+            runMacro(macro, args)
+        except BaseException as e:
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            traceback.print_exc()
+            failed.append("%s %s"%(macro, " ".join(args)))
+            if not options.keepGoing:
+                break
+        print(">> [%s] done in %.1f s"%(name, time.time() - t0))
+
+    print("\n>> Finished in %.1f s"%(time.time() - start))
+    if failed:
+        print(">> Failed:")
+        for f in failed:
+            print("     " + f)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
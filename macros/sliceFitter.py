@@ -0,0 +1,194 @@
+import numpy as np
+try:
+    import ROOT
+except ImportError:
+    # Only needed for the TF1 helpers
+    ROOT = None
+import histArrays as ha
+
+# Batched gaussian fits of all the x-slices of a TH2.
+# The TH2 is read once into numpy and every column is fitted at the same time
+# with a vectorized Levenberg-Marquardt chi2 minimization. It reproduces the
+# usual per-slice recipe used in the macros:
+#     tmpHist = th2.ProjectionY("py",i,i)
+#     tmpHist.Rebin(2)
+#     fit = TF1('fit','gaus', mean - 1.5*rms, mean + 1.5*rms)
+#     tmpHist.Fit(fit, "Q", "", fitlow, fithigh)
+
+class SliceFitResult:
+    # Arrays have one element per x bin (index 0 is ROOT bin 1)
+    def __init__(self, nbins):
+        self.entries = np.zeros(nbins)
+        self.mean = np.zeros(nbins)
+        self.rms = np.zeros(nbins)
+        self.fitlow = np.zeros(nbins)
+        self.fithigh = np.zeros(nbins)
+        self.constant = np.zeros(nbins)
+        self.fit_mean = np.zeros(nbins)
+        self.fit_mean_error = np.zeros(nbins)
+        self.sigma = np.zeros(nbins)
+        self.sigma_error = np.zeros(nbins)
+        self.chi2 = np.zeros(nbins)
+        self.ndf = np.zeros(nbins, dtype=int)
+        self.fitted = np.zeros(nbins, dtype=bool)
+
+def _rebin_columns(values, group):
+    # Merge groups of consecutive y bins (in-range only), as TH1::Rebin does
+    if group <= 1:
+        return values
+    ny = values.shape[1] - (values.shape[1] % group)
+    return values[:, :ny].reshape(values.shape[0], -1, group).sum(axis=2)
+
+def _gaus_and_jacobian(x, params):
+    constant, mean, sigma = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+    z = (x[None, :] - mean)/sigma
+    g = np.exp(-0.5*z*z)
+    f = constant*g
+    jac = np.stack([g, f*z/sigma, f*z*z/sigma], axis=-1)
+    return f, jac
+
+def _chi2(x, y, w, params):
+    f, _ = _gaus_and_jacobian(x, params)
+    return np.sum(w*(y - f)**2, axis=1)
+
+def _fit_gaus_batch(x, y, w, params, active, max_iter=100, tolerance=1e-8):
+    # Vectorized Levenberg-Marquardt over all active columns
+    ncol = y.shape[0]
+    lam = np.full(ncol, 1e-3)
+    chi2 = _chi2(x, y, w, params)
+    converged = ~active
+    eye = np.eye(3)[None, :, :]
+    for _ in range(max_iter):
+        if converged.all():
+            break
+        f, jac = _gaus_and_jacobian(x, params)
+        jtwj = np.einsum('cni,cn,cnj->cij', jac, w, jac)
+        jtwr = np.einsum('cni,cn->ci', jac, w*(y - f))
+
+        diag = np.einsum('cii->ci', jtwj)
+        hessian = jtwj + lam[:, None, None]*diag[:, :, None]*eye
+        # Keep converged or empty columns solvable without touching them
+        hessian[converged] = eye[0]
+        jtwr[converged] = 0.0
+        step = np.linalg.solve(hessian, jtwr[:, :, None])[:, :, 0]
+
+        trial = params + step
+        trial_chi2 = _chi2(x, y, w, trial)
+        better = (trial_chi2 <= chi2) & np.isfinite(trial_chi2) & ~converged
+
+        small = np.abs(chi2 - trial_chi2) <= tolerance*np.maximum(chi2, 1.0)
+        params[better] = trial[better]
+        converged|= better & small
+        chi2[better] = trial_chi2[better]
+        lam = np.where(better, lam/10., lam*10.)
+        converged|= lam > 1e10
+
+    # Parabolic errors from the chi2 curvature, as Minuit reports them
+    _, jac = _gaus_and_jacobian(x, params)
+    jtwj = np.einsum('cni,cn,cnj->cij', jac, w, jac)
+    jtwj[~active] = np.eye(3)
+    cov = np.linalg.pinv(jtwj)
+    errors = np.sqrt(np.abs(np.einsum('cii->ci', cov)))
+    return params, errors, chi2
+
+class Slices:
+    # ProjectionY of every x bin of a TH2 (index 0 is ROOT bin 1).
+    # entries, mean and rms are those of the non-rebinned projection, as
+    # GetEntries, GetMean and GetRMS return them; contents and sumw2 are
+    # rebinned along y and x holds the rebinned bin centers.
+    def __init__(self, th2, rebin_y=1):
+        contents = ha.get_contents(th2)
+        sumw2 = ha.get_sumw2(th2)
+        nbins = th2.GetNbinsX()
+        group = max(rebin_y, 1)
+
+        # Drop x under/overflow; keep y under/overflow only for the entries count
+        columns = contents[1:nbins+1, :]
+        self.entries = columns.sum(axis=1)
+        columns = columns[:, 1:-1]
+
+        y_centers = ha.get_bin_centers(th2.GetYaxis())
+        sumw = columns.sum(axis=1)
+        safe_sumw = np.where(sumw > 0, sumw, 1.0)
+        self.mean = (columns*y_centers).sum(axis=1)/safe_sumw
+        variance = (columns*y_centers**2).sum(axis=1)/safe_sumw - self.mean**2
+        self.rms = np.sqrt(np.clip(variance, 0.0, None))
+
+        y_edges = ha.get_bin_edges(th2.GetYaxis())
+        ny = len(y_centers) - (len(y_centers) % group)
+        self.edges = y_edges[:ny+1:group]
+        self.x = 0.5*(self.edges[1:] + self.edges[:-1])
+        self.contents = _rebin_columns(columns, group)
+        self.sumw2 = _rebin_columns(sumw2[1:nbins+1, 1:-1], group)
+        self.nbins = nbins
+
+def fit_gaus_slices(th2, nsigma=1.5, rebin_y=2, min_entries=0.0):
+    """Fit a gaussian to every ProjectionY of th2 at once.
+
+    The fit range of each slice is mean +/- nsigma*RMS of the (non-rebinned)
+    projection, and the slice is rebinned by rebin_y before fitting.
+    Slices with entries <= min_entries are not fitted.
+    """
+    slices = Slices(th2, rebin_y)
+    nbins = slices.nbins
+    result = SliceFitResult(nbins)
+    result.entries = slices.entries
+    result.mean = slices.mean
+    result.rms = slices.rms
+    result.fitlow = result.mean - nsigma*result.rms
+    result.fithigh = result.mean + nsigma*result.rms
+
+    # Chi2 weights of the bins in range (empty bins are skipped, as in TH1::Fit)
+    x = slices.x
+    y = slices.contents
+    err2 = slices.sumw2
+    in_range = (x[None, :] >= result.fitlow[:, None]) & (x[None, :] <= result.fithigh[:, None])
+    w = np.where(in_range & (err2 > 0), 1.0/np.where(err2 > 0, err2, 1.0), 0.0)
+
+    active = (result.entries > min_entries) & (result.rms > 0) & (np.count_nonzero(w, axis=1) >= 3)
+
+    # Moment seeding
+    params = np.zeros((nbins, 3))
+    params[:, 0] = np.where(w > 0, y, 0.0).max(axis=1)
+    params[:, 1] = result.mean
+    params[:, 2] = np.where(result.rms > 0, result.rms, 1.0)
+    params, errors, chi2 = _fit_gaus_batch(x, y, w, params, active)
+
+    result.fitted = active
+    result.constant = np.where(active, params[:, 0], 0.0)
+    result.fit_mean = np.where(active, params[:, 1], 0.0)
+    result.fit_mean_error = np.where(active, errors[:, 1], 0.0)
+    result.sigma = np.where(active, np.abs(params[:, 2]), 0.0)
+    result.sigma_error = np.where(active, errors[:, 2], 0.0)
+    result.chi2 = np.where(active, chi2, 0.0)
+    result.ndf = np.where(active, np.count_nonzero(w, axis=1) - 3, 0)
+    return result
+
+def get_tf1(result, i, name="fit"):
+    # TF1 with the batch parameters of bin i (ROOT numbering), e.g. for drawing
+    fit = ROOT.TF1(name, "gaus", result.fitlow[i-1], result.fithigh[i-1])
+    fit.SetParameters(result.constant[i-1], result.fit_mean[i-1], result.sigma[i-1])
+    fit.SetParError(1, result.fit_mean_error[i-1])
+    fit.SetParError(2, result.sigma_error[i-1])
+    return fit
+
+def compare_with_tf1(th2, result, rebin_y=2, name=""):
+    # Re-run the per-slice TF1 fits and print the differences w.r.t. the batch fit
+    nbins = th2.GetNbinsX()
+    print(" >> Batch vs TF1 gaussian fit comparison %s"%name)
+    print("%5s %12s %12s %12s %12s %10s"%("Bin", "Mean(TF1)", "Mean(batch)", "Sigma(TF1)", "Sigma(batch)", "dSigma[%]"))
+    max_diff = 0.0
+    for i in range(1, nbins+1):
+        if not result.fitted[i-1]:
+            continue
+        tmpHist = th2.ProjectionY("py_compare",i,i)
+        tmpHist.Rebin(rebin_y)
+        fit = ROOT.TF1('fit_compare','gaus',result.fitlow[i-1],result.fithigh[i-1])
+        tmpHist.Fit(fit,"Q0", "", result.fitlow[i-1], result.fithigh[i-1])
+        sigma_tf1 = abs(fit.GetParameter(2))
+        diff = 100.*(result.sigma[i-1] - sigma_tf1)/sigma_tf1 if sigma_tf1 else 0.0
+        max_diff = max(max_diff, abs(diff))
+        print("%5i %12.6f %12.6f %12.6f %12.6f %10.3f"%(i, fit.GetParameter(1), result.fit_mean[i-1],
+                                                         sigma_tf1, result.sigma[i-1], diff))
+    print(" >> Maximum relative sigma difference: %.3f%%"%max_diff)
+    return max_diff
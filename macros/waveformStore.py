@@ -0,0 +1,112 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow
+    _engine = "pyarrow"
+except ImportError:
+    _engine = "c"
+
+# Binary store of the waveform CSV files written by Analyze
+# (waveforms_gabriele/waveform_<region>_<i>.csv, one event per file with a
+# Time[ns] column and one column per channel).
+# The CSV files of a region are parsed once, in a thread pool and with only
+# the needed columns, into a float32 array of shape
+# (n_waveforms, n_channels, n_samples) saved as .npy next to them, and later
+# loads are memory-mapped. The store is rebuilt when the CSV files change.
+#
+#     import waveformStore as ws
+#     time, waveforms, channels = ws.load(outdir+"/waveforms_gabriele", "stripCenter")
+#     lead = ws.leadingChannel(waveforms)
+
+timeColumn = "Time[ns]"
+_storeVersion = 1
+
+def listFiles(directory, region):
+    # waveform_<region>_<i>.csv files of a region, ordered by i
+    pattern = re.compile(r"^waveform_%s_(\d+)\.csv$" % re.escape(region))
+    files = []
+    for fname in os.listdir(directory):
+        match = pattern.match(fname)
+        if match:
+            files.append((int(match.group(1)), os.path.join(directory, fname)))
+    return [f for _, f in sorted(files)]
+
+def readCSV(path, channels=None):
+    """(channel names, time, values[channel, sample]) of one waveform CSV file.
+
+    Only the time column and channels (all channels when None) are parsed.
+    """
+    usecols = None if channels is None else [timeColumn] + list(channels)
+    df = pd.read_csv(path, header=0, usecols=usecols, dtype=np.float32, engine=_engine)
+    names = [c for c in df.columns if c != timeColumn]
+    return names, df[timeColumn].to_numpy(dtype=np.float32), df[names].to_numpy(dtype=np.float32).T
+
+def _storePaths(directory, region):
+    base = os.path.join(directory, "waveforms_%s" % region)
+    return base + ".npy", base + "_time.npy", base + ".json"
+
+def _manifest(files, channels):
+    entries = []
+    for f in files:
+        stat = os.stat(f)
+        entries.append([os.path.basename(f), stat.st_size, stat.st_mtime_ns])
+    return {"version":_storeVersion, "channels":channels, "files":entries}
+
+def convert(directory, region, channels=None, workers=None):
+    """Parse all CSV files of region into the binary store and return its paths."""
+    files = listFiles(directory, region)
+    if not files:
+        raise Exception("ERROR: no waveform files for region %s in %s" % (region, directory))
+
+    with ThreadPoolExecutor(workers if workers else min(32, (os.cpu_count() or 1) + 4)) as pool:
+        results = list(pool.map(lambda f: readCSV(f, channels), files))
+
+    names, time, values = results[0]
+    waveforms = np.empty((len(files),) + values.shape, dtype=np.float32)
+    times = np.empty((len(files), len(time)), dtype=np.float32)
+    for i, (n, t, v) in enumerate(results):
+        if n != names or v.shape != values.shape:
+            raise Exception("ERROR: %s has columns %s and %d samples, expected %s and %d" % (files[i], n, v.shape[1], names, values.shape[1]))
+        waveforms[i] = v
+        times[i] = t
+
+    wavePath, timePath, manifestPath = _storePaths(directory, region)
+    # Manifest written last: a store without it is never used
+    if os.path.exists(manifestPath):
+        os.remove(manifestPath)
+    np.save(wavePath, waveforms)
+    np.save(timePath, times)
+    with open(manifestPath, "w") as f:
+        json.dump(_manifest(files, names if channels is None else list(channels)), f)
+    return wavePath, timePath
+
+def load(directory, region, channels=None, workers=None, rebuild=False):
+    """(time[waveform, sample], waveforms[waveform, channel, sample], channel names) of region.
+
+    The arrays are memory-mapped from the store, which is (re)built from the
+    CSV files when missing or out of date.
+    """
+    wavePath, timePath, manifestPath = _storePaths(directory, region)
+    manifest = None
+    if os.path.exists(manifestPath) and not rebuild:
+        with open(manifestPath) as f:
+            manifest = json.load(f)
+        files = listFiles(directory, region)
+        current = _manifest(files, manifest["channels"])
+        if manifest != current or (channels is not None and list(channels) != manifest["channels"]):
+            manifest = None
+    if manifest is None:
+        convert(directory, region, channels, workers)
+        with open(manifestPath) as f:
+            manifest = json.load(f)
+    return np.load(timePath, mmap_mode="r"), np.load(wavePath, mmap_mode="r"), manifest["channels"]
+
+def leadingChannel(waveforms):
+    # Channel holding the most negative sample of each waveform, as
+    # df.iloc[:, -7:].unstack().idxmin() on one file (first channel on ties)
+    return np.asarray(waveforms).min(axis=2).argmin(axis=1)
@@ -0,0 +1,108 @@
+import numpy as np
+
+# Vectorized filling of ROOT histograms from numpy arrays. The bin of every
+# entry is found with numpy, the bins are accumulated with bincount and the
+# contents, errors and statistics are written into the histogram at once,
+# instead of one h.Fill call per event from python.
+#
+# The result is the same as filling in a loop: under/overflow bins, Sumw2,
+# the entries and the statistics used by GetMean/GetRMS are all updated.
+#
+#     h = ROOT.TH2D(name, name, 100, -1, 1, 100, -1, 1)
+#     BulkFill.fill(h, x, y)
+
+def _toArray(buf, size):
+    # PyROOT hands back a low level view without length information
+    buf.reshape((size,))
+    return np.array(buf, dtype=np.float64, copy=True)
+
+def findBin(axis, x):
+    # Vectorized axis.FindFixBin: 0 is the underflow, nbins+1 the overflow (also for NaN)
+    nbins = axis.GetNbins()
+    if axis.IsVariableBinSize():
+        edges = np.array([axis.GetBinLowEdge(i) for i in range(1, nbins + 2)])
+        return np.searchsorted(edges, x, side="right")
+    xmin, xmax = axis.GetXmin(), axis.GetXmax()
+    bins = np.full(len(x), nbins + 1, dtype=np.int64)
+    bins[x < xmin] = 0
+    inside = (x >= xmin) & (x < xmax)
+    # Same arithmetic as TAxis::FindFixBin
+    bins[inside] = np.minimum(1 + (nbins * (x[inside] - xmin) / (xmax - xmin)).astype(np.int64), nbins)
+    return bins
+
+def _bins(h, coords):
+    # Global bin of every entry and mask of the entries inside the axes ranges
+    axes = [h.GetXaxis(), h.GetYaxis()][:len(coords)]
+    gbin = np.zeros(len(coords[0]), dtype=np.int64)
+    inRange = np.ones(len(coords[0]), dtype=bool)
+    stride = 1
+    for axis, c in zip(axes, coords):
+        b = findBin(axis, c)
+        gbin += stride * b
+        inRange &= (b >= 1) & (b <= axis.GetNbins())
+        stride *= axis.GetNbins() + 2
+    return gbin, inRange, stride
+
+def _stats(coords, w, inRange):
+    # Sums of TH1::GetStats, over the in-range entries (ROOT default)
+    x = coords[0][inRange]
+    w = w[inRange]
+    stats = [np.sum(w), np.sum(w * w), np.sum(w * x), np.sum(w * x * x)]
+    if len(coords) > 1:
+        y = coords[1][inRange]
+        stats += [np.sum(w * y), np.sum(w * y * y), np.sum(w * x * y)]
+    return stats
+
+def _getStats(h):
+    # Read before SetContent, which resets the statistics and the entries
+    stats = np.zeros(13)
+    h.GetStats(stats)
+    return stats, h.GetEntries()
+
+def _putStats(h, old, stats, nEntries):
+    old, entries = old
+    old[:len(stats)] += stats
+    h.PutStats(old)
+    h.SetEntries(entries + nEntries)
+
+def fill(h, x, y=None, w=None):
+    """Fill a TH1 or TH2 with arrays x (and y), with optional weights w."""
+    coords = [np.asarray(x, dtype=np.float64)] + ([np.asarray(y, dtype=np.float64)] if y is not None else [])
+    if len(coords) != h.GetDimension():
+        raise ValueError("BulkFill.fill: %s has dimension %d, got %d arrays" % (h.GetName(), h.GetDimension(), len(coords)))
+    weights = np.ones(len(coords[0])) if w is None else np.asarray(w, dtype=np.float64)
+    if w is not None and h.GetSumw2N() == 0:
+        h.Sumw2()
+
+    gbin, inRange, nCells = _bins(h, coords)
+    old = _getStats(h)
+    h.SetContent(_toArray(h.GetArray(), nCells) + np.bincount(gbin, weights, minlength=nCells))
+    if h.GetSumw2N() > 0:
+        sumw2 = _toArray(h.GetSumw2().GetArray(), nCells) + np.bincount(gbin, weights * weights, minlength=nCells)
+        h.GetSumw2().Set(nCells, sumw2)
+    _putStats(h, old, _stats(coords, weights, inRange), len(coords[0]))
+    return h
+
+def fillProfile2D(h, x, y, z, w=None):
+    """Fill a TProfile2D as h.Fill(x[i], y[i], z[i], w[i]) for all i."""
+    coords = [np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)]
+    z = np.asarray(z, dtype=np.float64)
+    weights = np.ones(len(z)) if w is None else np.asarray(w, dtype=np.float64)
+
+    gbin, inRange, nCells = _bins(h, coords)
+    old = _getStats(h)
+    # fArray holds sum(w*z), fSumw2 sum(w*z^2), fBinEntries sum(w) and fBinSumw2 sum(w^2)
+    h.SetContent(_toArray(h.GetArray(), nCells) + np.bincount(gbin, weights * z, minlength=nCells))
+    sumw2 = _toArray(h.GetSumw2().GetArray(), nCells) + np.bincount(gbin, weights * z * z, minlength=nCells)
+    h.GetSumw2().Set(nCells, sumw2)
+    entries = np.bincount(gbin, weights, minlength=nCells)
+    for b in np.flatnonzero(entries):
+        h.SetBinEntries(int(b), h.GetBinEntries(int(b)) + entries[b])
+    if h.GetBinSumw2().GetSize() > 0:
+        binSumw2 = _toArray(h.GetBinSumw2().GetArray(), nCells) + np.bincount(gbin, weights * weights, minlength=nCells)
+        h.GetBinSumw2().Set(nCells, binSumw2)
+
+    stats = _stats(coords, weights, inRange)
+    stats += [np.sum((weights * z)[inRange]), np.sum((weights * z * z)[inRange])]
+    _putStats(h, old, stats, len(z))
+    return h
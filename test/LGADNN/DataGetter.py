@@ -1,39 +1,133 @@
+import os
+import json
+import shutil
+import hashlib
 import uproot
 import numpy as np
-import pandas as pd
 from glob import glob
 import time
 import matplotlib.pyplot as plt
 
+# The loader uses the uproot 4 API (keys, num_entries, iterate with library="np")
+if int(uproot.__version__.split(".")[0]) < 4:
+    raise Exception("ERROR: uproot >= 4 is needed, found %s (pip install 'uproot>=4')"%uproot.__version__)
+
 def getSamplesToRun(names):
     s = glob(names)
     if len(s) == 0:
         raise Exception("No files find that correspond to: "+names)
     return s
 
+# Preprocessed splits are cached as one .npy file per array in
+# <cacheDir>/<key>/, keyed by the content hash of the input files, the
+# training variables and the tree, and are opened memory-mapped. Bump
+# cacheVersion when the content of the preprocessed arrays changes.
+cacheVersion = 1
+statKeys = ("mean", "std", "scale")
+# Memory-mapped splits already opened in this process, shared by training and
+# validation. Splits read without a cache directory are not kept
+_loaded = {}
+
+def fileHash(filename, cacheDir):
+    # sha1 of the file content, remembered per (path, size, mtime) in cacheDir/hashes.json
+    path = os.path.realpath(filename)
+    stat = os.stat(path)
+    index = os.path.join(cacheDir, "hashes.json")
+    hashes = {}
+    if os.path.exists(index):
+        with open(index) as f:
+            hashes = json.load(f)
+    entry = hashes.get(path)
+    if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[2]
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            h.update(block)
+    hashes[path] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+    tmp = "%s.%d.tmp" % (index, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(hashes, f, indent=1)
+    os.replace(tmp, index)
+    return h.hexdigest()
+
+def cacheKey(dataSet, config, cacheDir):
+    key = {"version":cacheVersion, "files":[fileHash(f, cacheDir) for f in dataSet],
+           "allVars":list(config["allVars"]), "tree":config["tree"], "targets":DataGetter.targets}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def loadCache(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    return dict((key, np.load(os.path.join(path, key+".npy"), mmap_mode="r")) for key in meta["arrays"])
+
+def writeCache(path, data, meta):
+    # Written to a temporary directory and renamed, so a partial entry is never read
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    os.makedirs(tmp)
+    for key, values in data.items():
+        np.save(os.path.join(tmp, key+".npy"), np.ascontiguousarray(values))
+    meta["arrays"] = list(data)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Written meanwhile by another job
+        shutil.rmtree(tmp, ignore_errors=True)
+
+# Read dataSet and compute the normalization, without shuffling. Uses the cache when config["cacheDir"] is set
+def preprocess(dataSet, config):
+    key = (tuple(dataSet), tuple(config["allVars"]), config["tree"], config.get("cacheDir", "cache"))
+    if not key[3]:
+        return _preprocess(dataSet, config)
+    if key not in _loaded:
+        _loaded[key] = _preprocess(dataSet, config)
+    # New dict, so callers can replace arrays without touching the shared one
+    return dict(_loaded[key])
+
+def _preprocess(dataSet, config):
+    cacheDir = config.get("cacheDir", "cache")
+    path = None
+    if cacheDir:
+        os.makedirs(cacheDir, exist_ok=True)
+        path = os.path.join(cacheDir, cacheKey(dataSet, config, cacheDir))
+        if os.path.exists(path):
+            return loadCache(path)
+
+    dg = DataGetter.DefinedVariables(config["allVars"])
+    data = dg.importData(samplesToRun = tuple(dataSet), treename = config["tree"])
+
+    # Get the rescale inputs to have unit variance centered at 0 between -1 and 1
+    data["mean"] = np.mean(data["data"], 0)
+    data["std"] = np.std(data["data"], 0)
+    data["scale"] = 1.0 / data["std"]
+
+    if path:
+        writeCache(path, data, {"version":cacheVersion, "files":list(dataSet), "allVars":list(config["allVars"]), "tree":config["tree"]})
+        return loadCache(path)
+    return data
+
 # Takes training vars, signal and background files and returns training data
 def get_data(dataSet, config):
-    dg = DataGetter.DefinedVariables(config["allVars"])
-    trainData = dg.importData(samplesToRun = tuple(dataSet), treename = config["tree"])
+    trainData = preprocess(dataSet, config)
 
     # Randomly shuffle the signal and background before mixing them together
     np.random.seed(config["seed"]) 
     perms = np.random.permutation(trainData["data"].shape[0])
     for key in trainData:
-        trainData[key] = trainData[key][perms]
-
-    # Get the rescale inputs to have unit variance centered at 0 between -1 and 1
-    def scale(data):
-        data["mean"] = np.mean(data["data"], 0)
-        data["std"] = np.std(data["data"], 0)
-        data["scale"] = 1.0 / data["std"]
-    scale(trainData)
+        if key not in statKeys:
+            trainData[key] = trainData[key][perms]
     return trainData
 
 class DataGetter:
+    # Branches returned besides the training variables: {key in the returned dict: branch}
+    targets = {"targetX":"x", "targetT":"timePhotek", "time3":"time3", "amp2":"amp2", "amp3":"amp3", "amp4":"amp4", "y":"y"}
+
     #The constructor simply takes in a list and saves it to self.l
-    def __init__(self, variables):
+    def __init__(self, variables, stepSize = "100 MB"):
         self.l = variables
+        self.stepSize = stepSize
         self.columnHeaders = None
         self.data = None
 
@@ -49,12 +143,12 @@ class DataGetter:
         return self.data
 
     def getColumnHeaders(self, samplesToRun, treename):
+        # Branch names come from the tree metadata, no basket is read
         if self.columnHeaders is None:
             try:
-                sample = samplesToRun[0]                
-                f = uproot.open(sample)
-                self.columnHeaders = f[treename].pandas.df().columns.tolist()
-                f.close()
+                sample = samplesToRun[0]
+                with uproot.open(sample) as f:
+                    self.columnHeaders = f[treename].keys()
             except IndexError as e:
                 print(e)
                 raise IndexError("No sample in samplesToRun")
@@ -66,50 +160,69 @@ class DataGetter:
         for v in variables:            
             if not v in self.columnHeaders:
                 raise ValueError("Variable not found in input root file: %s"%v)
-        
-    def getDataSets(self, samplesToRun, treename):
-        dsets = []
+
+    def getNumEntries(self, samplesToRun, treename):
+        # {filename: number of entries} of the readable samples
+        entries = {}
         if len(samplesToRun) == 0:
             raise IndexError("No sample in samplesToRun")
         for filename in samplesToRun:
             try:
-                f = uproot.open(filename)
-                pdf = f[treename].pandas.df()
-                dsets.append( pdf )
-                f.close()
+                with uproot.open(filename) as f:
+                    entries[filename] = f[treename].num_entries
             except Exception as e:
                 print("Warning: \"%s\" has issues" % filename, e)
-                continue
-        return dsets
+        return entries
+
+    def fill(self, values, start, filename, treename, branches):
+        # Stream branches of filename in chunks of self.stepSize into values[start:],
+        # dropping entries with a NaN in any branch. Returns the number of rows written
+        n = start
+        with uproot.open(filename) as f:
+            for chunk in f[treename].iterate(branches, step_size=self.stepSize, library="np"):
+                keep = np.ones(len(chunk[branches[0]]), dtype=bool)
+                for b in branches:
+                    keep &= ~np.isnan(chunk[b])
+                nKeep = np.count_nonzero(keep)
+                for i, b in enumerate(branches):
+                    values[n:n+nKeep, i] = chunk[b][keep]
+                n += nKeep
+        return n - start
 
     def importData(self, samplesToRun, treename = "myMiniTree"):
         #variables to train
         variables = self.getList()
         self.getColumnHeaders(samplesToRun, treename)
         self.checkVariables(variables)
-        
-        # Get data into the right format
-        dsets = self.getDataSets(samplesToRun, treename)
-        data = pd.concat(dsets)
-        data = data.dropna()
+
+        # Only the training and target branches are read, training variables first
+        branches = list(variables) + [b for b in dict.fromkeys(self.targets.values()) if b not in variables]
+        column = dict((b, i) for i, b in enumerate(branches))
+
+        # Preallocate for all entries and keep the rows that pass the NaN cut
+        entries = self.getNumEntries(samplesToRun, treename)
+        values = np.empty((sum(entries.values()), len(branches)))
+        n = 0
+        for filename in entries:
+            try:
+                n += self.fill(values, n, filename, treename, branches)
+            except Exception as e:
+                print("Warning: \"%s\" has issues" % filename, e)
+                continue
+        values = values[:n]
 
         #setup and get training data
-        npyInputData = data[variables].astype(float).values
+        npyInputData = values[:, :len(variables)]
 
         #setup and get labels
         npyInputAnswers = np.zeros((npyInputData.shape[0], 2))
         npyInputAnswers[:,1] = 1
 
         #setup and get target values
-        npyInputTargetX = data[["x"]].values
-        npyInputTargetT = data[["timePhotek"]].values
-        npyTime3 = data[["time3"]].values
-        npyAmp2 = data[["amp2"]].values
-        npyAmp3 = data[["amp3"]].values
-        npyAmp4 = data[["amp4"]].values
-        npyY = data[["y"]].values
-
-        return {"data":npyInputData, "labels":npyInputAnswers, "targetX":npyInputTargetX, "targetT":npyInputTargetT, "time3":npyTime3, "amp2":npyAmp2, "amp3":npyAmp3, "amp4":npyAmp4, "y":npyY}
+        result = {"data":npyInputData, "labels":npyInputAnswers}
+        for key, b in self.targets.items():
+            result[key] = values[:, column[b]:column[b]+1]
+        return result
 
 if __name__ == '__main__':
     config = {}
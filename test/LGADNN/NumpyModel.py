@@ -0,0 +1,83 @@
+import numpy as np
+
+# TensorFlow-free inference of the models made by Train.model_reg.
+# Train.save_model_npz writes the normalization constants and the weights of
+# every Dense layer to <outputDir>/model.npz; NumpyModel evaluates the same
+# network with numpy only, so the position/time reconstruction can run in
+# plotting macros and batch jobs without importing TensorFlow.
+#
+#     import NumpyModel
+#     model = NumpyModel.NumpyModel("Output/<training>/model.npz")
+#     x, t = model.predict(data)
+#
+# The network: (x - mean) * scale -> split (relu) -> hiddenX_i (relu) ->
+# first_output, and split -> hiddenT_i (relu) -> second_output. Dropout is
+# the identity at inference.
+
+formatVersion = 1
+
+def export(model, mean, scale, path):
+    """Write the normalization and Dense weights of a Keras model_reg model to path (.npz)."""
+    arrays = {"version":np.array(formatVersion), "mean":np.asarray(mean, dtype=np.float64),
+              "scale":np.asarray(scale, dtype=np.float64)}
+    counts = {}
+    for branch in ("X", "T"):
+        counts[branch] = len([l for l in model.layers if l.name.startswith("hidden%s_"%branch)])
+    names = ["split"] + ["hiddenX_%d"%i for i in range(counts["X"])] + ["first_output"] \
+                      + ["hiddenT_%d"%i for i in range(counts["T"])] + ["second_output"]
+    for name in names:
+        kernel, bias = model.get_layer(name).get_weights()
+        arrays[name+"/kernel"] = kernel
+        arrays[name+"/bias"] = bias
+    arrays["nHiddenX"] = np.array(counts["X"])
+    arrays["nHiddenT"] = np.array(counts["T"])
+    np.savez(path, **arrays)
+    return path
+
+class NumpyModel:
+    def __init__(self, path):
+        with np.load(path) as data:
+            if int(data["version"]) != formatVersion:
+                raise ValueError("Unsupported model file version %d in %s" % (int(data["version"]), path))
+            self.mean = data["mean"]
+            self.scale = data["scale"]
+            layer = lambda name: (data[name+"/kernel"], data[name+"/bias"])
+            self.split = layer("split")
+            self.hiddenX = [layer("hiddenX_%d"%i) for i in range(int(data["nHiddenX"]))]
+            self.hiddenT = [layer("hiddenT_%d"%i) for i in range(int(data["nHiddenT"]))]
+            self.outputX = layer("first_output")
+            self.outputT = layer("second_output")
+
+    def nInputs(self):
+        return self.mean.shape[0]
+
+    @staticmethod
+    def dense(x, weights, relu=True):
+        kernel, bias = weights
+        out = x.dot(kernel)
+        out += bias
+        return np.maximum(out, 0.0, out=out) if relu else out
+
+    def predictBatch(self, x):
+        # Outputs [first_output, second_output] of one batch, as model.predict
+        x = (np.asarray(x, dtype=np.float64) - self.mean) * self.scale
+        split = self.dense(x, self.split)
+        layer = split
+        for weights in self.hiddenX:
+            layer = self.dense(layer, weights)
+        outX = self.dense(layer, self.outputX, relu=False)
+        layer = split
+        for weights in self.hiddenT:
+            layer = self.dense(layer, weights)
+        outT = self.dense(layer, self.outputT, relu=False)
+        return [outX, outT]
+
+    def predict(self, x, batchSize=65536):
+        # Batched over the rows of x (e.g. a memory-mapped array), outputs preallocated
+        nRows = x.shape[0]
+        output = [np.empty((nRows, self.outputX[1].shape[0])), np.empty((nRows, self.outputT[1].shape[0]))]
+        for start in range(0, nRows, batchSize):
+            batch = self.predictBatch(x[start:start+batchSize])
+            for o, b in zip(output, batch):
+                o[start:start+batchSize] = b
+        return output
@@ -0,0 +1,57 @@
+import numpy as np
+
+# Profile statistics of a 2D histogram counts array, computed for all
+# columns at once. counts[i, j] is the content of x bin i and y bin j (the
+# layout of np.histogram2d and plt.hist2d), and the statistics are those of
+# the y distribution of each x bin. Use axis=0 for the other direction.
+#
+#     h, xedges, yedges, image = plt.hist2d(x, y, bins=[100, 100])
+#     stats = ProfileStats.profileStats(h, yedges)
+#     plt.errorbar(0.5*(xedges[1:]+xedges[:-1]), stats["mean"], yerr=stats["rms"])
+
+def _columns(counts, axis):
+    counts = np.asarray(counts, dtype=np.float64)
+    return counts if axis == 1 else counts.T
+
+def profileStats(counts, edges, axis=1, sumw2=None):
+    """Per column sum of weights, mean, RMS and error on the mean.
+
+    Values are taken at the bin centers given by edges. Empty columns get NaN.
+    sumw2 (same shape as counts) gives the effective number of entries of
+    weighted histograms, otherwise counts are taken as unweighted entries.
+    """
+    counts = _columns(counts, axis)
+    edges = np.asarray(edges, dtype=np.float64)
+    centers = 0.5 * (edges[1:] + edges[:-1])
+
+    sumw = counts.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = counts.dot(centers) / sumw
+        var = np.einsum("ij,ij->i", counts, (centers[None, :] - mean[:, None])**2) / sumw
+        rms = np.sqrt(np.maximum(var, 0.0))
+        nEff = sumw if sumw2 is None else sumw**2 / _columns(sumw2, axis).sum(axis=1)
+        meanError = rms / np.sqrt(nEff)
+    return {"sumw":sumw, "mean":mean, "rms":rms, "meanError":meanError}
+
+def quantiles(counts, edges, q, axis=1):
+    """Quantiles q of each column, interpolated linearly inside the bins.
+
+    Returns an array of shape (columns, len(q)), NaN for empty columns.
+    """
+    counts = _columns(counts, axis)
+    edges = np.asarray(edges, dtype=np.float64)
+    q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+
+    cum = np.cumsum(counts, axis=1)
+    target = q[None, :] * cum[:, -1:]
+    # First bin where the cumulative sum reaches the target of each quantile
+    j = np.sum(cum[:, :, None] < target[:, None, :], axis=1)
+    j = np.minimum(j, counts.shape[1] - 1)
+    rows = np.arange(counts.shape[0])[:, None]
+    below = np.where(j > 0, cum[rows, np.maximum(j - 1, 0)], 0.0)
+    content = counts[rows, j]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frac = np.where(content > 0, (target - below) / content, 0.0)
+    values = edges[j] + np.clip(frac, 0.0, 1.0) * (edges[j + 1] - edges[j])
+    values[cum[:, -1] <= 0] = np.nan
+    return values
@@ -1,4 +1,6 @@
-from DataGetter import get_data, getSamplesToRun
+from DataGetter import getSamplesToRun, preprocess
+import BulkFill
+import ProfileStats
 import numpy as np
 import os
 from scipy.stats import norm
@@ -15,6 +17,7 @@ from matplotlib.colors import LogNorm
 import matplotlib.lines as ml
 from sklearn.metrics import roc_curve, auc, precision_recall_curve, average_precision_score, roc_auc_score
 import json
+import tensorflow as tf
 
 class Validation:
 
@@ -25,6 +28,7 @@ class Validation:
         self.result_log = result_log
         self.metric = {}
         self.doLog = False
+        self.predictFn = None
 
     def __del__(self):
         del self.model
@@ -32,6 +36,7 @@ class Validation:
         del self.trainData
         del self.result_log
         del self.metric
+        del self.predictFn
         
     def plot2DVar(self, name, binxl, binxh, numbin, xIn, yIn, nbiny):
         fig = plt.figure()
@@ -39,22 +44,10 @@ class Validation:
         plt.colorbar()
     
         bin_centersx = 0.5 * (xedges[:-1] + xedges[1:])
-        bin_centersy = 0.5 * (yedges[:-1] + yedges[1:])
-        y = []
-        ye = []
-        for i in range(h.shape[0]):
-            ynum = 0
-            ynum2 = 0
-            ydom = 0
-            for j in range(len(h[i])):
-                ynum += h[i][j] * bin_centersy[j]
-                ynum2 += h[i][j] * (bin_centersy[j]**2)
-                ydom += h[i][j]        
-            yavg = ynum / ydom if ydom != 0 else -1
-            yavg2 = ynum2 / ydom if ydom != 0 else -1
-            sigma = np.sqrt(yavg2 - (yavg**2)) if ydom != 0 else 0
-            y.append(yavg)
-            ye.append(sigma)
+        stats = ProfileStats.profileStats(h, yedges)
+        empty = stats["sumw"] == 0
+        y = np.where(empty, -1, stats["mean"])
+        ye = np.where(empty, 0, stats["rms"])
             
         xerr = 0.5*(xedges[1]-xedges[0])
         #plt.errorbar(bin_centersx, y, xerr=xerr, yerr=ye, fmt='o', color='xkcd:red')
@@ -63,6 +56,50 @@ class Validation:
 
         plt.close(fig)
 
+    # Profile of a residual vs x: mean, RMS and central 68% band of each x bin
+    def plotResidualProfile(self, name, xlab, ylab, binxl, binxh, numbin, xIn, yIn, binyl, binyh, nbiny=200):
+        h, xedges, yedges = np.histogram2d(xIn, yIn, bins=[numbin, nbiny], range=[[binxl, binxh], [binyl, binyh]])
+        stats = ProfileStats.profileStats(h, yedges)
+        band = ProfileStats.quantiles(h, yedges, [0.16, 0.84])
+        bin_centersx = 0.5 * (xedges[:-1] + xedges[1:])
+
+        fig = plt.figure()
+        plt.fill_between(bin_centersx, band[:,0], band[:,1], color='xkcd:light blue', label='68% band')
+        plt.errorbar(bin_centersx, stats["mean"], xerr=0.5*(xedges[1]-xedges[0]), yerr=stats["rms"], fmt='o', color='xkcd:red', label='mean, RMS')
+        plt.xlabel(xlab)
+        plt.ylabel(ylab)
+        plt.legend(loc='upper right')
+        fig.savefig(self.config["outputDir"]+"/"+name+".png", dpi=fig.dpi)
+        plt.close(fig)
+        return stats
+
+    def predictFunction(self):
+        # Traced once with a fixed input signature, so every batch reuses the same graph
+        if self.predictFn is None:
+            spec = tf.TensorSpec((None, self.model.inputs[0].shape[1]), self.model.inputs[0].dtype)
+            self.predictFn = tf.function(lambda x: self.model(x, training=False), input_signature=[spec])
+        return self.predictFn
+
+    def predictBatches(self, data):
+        # Yield (start, stop, outputs) for fixed size batches of data["data"], reading one batch at a time
+        predictFn = self.predictFunction()
+        dtype = self.model.inputs[0].dtype.as_numpy_dtype
+        nRows = data["data"].shape[0]
+        batchSize = self.config.get("predictBatchSize", 65536)
+        for start in range(0, nRows, batchSize):
+            stop = min(start + batchSize, nRows)
+            outputs = predictFn(np.asarray(data["data"][start:stop], dtype=dtype))
+            yield start, stop, [o.numpy() for o in outputs]
+
+    def predict(self, data):
+        # Same as model.predict(data["data"]), written batch by batch into preallocated outputs
+        nRows = data["data"].shape[0]
+        output = [np.empty((nRows, o.shape[1])) for o in self.model.outputs]
+        for start, stop, batch in self.predictBatches(data):
+            for o, b in zip(output, batch):
+                o[start:stop] = b
+        return output
+
     def getResults(self, output, outputNum=0, columnNum=0):
         return output[outputNum][:,columnNum].ravel()
         #return output[:,columnNum].ravel()
@@ -106,8 +143,7 @@ class Validation:
         plotMax = 1.0
         for i in range(0, len(hists)):
             h = ROOT.TH1D(name,name,bins,arange[0],arange[1])
-            for x in hists[i]:
-                h.Fill(x)
+            BulkFill.fill(h, hists[i])
             h.Draw("he sames")
             plotMax = h.GetMaximum()
 
@@ -143,8 +179,7 @@ class Validation:
         h.GetXaxis().SetTitle(xlab)
         h.GetYaxis().SetTitle(ylab)
 
-        for i in range(0, len(xIn)):
-            h.Fill(xIn[i],yIn[i])
+        BulkFill.fill(h, xIn, yIn)
 
         h.Draw("colz")
         c.Print(self.config["outputDir"]+"/%s.png"%(name))
@@ -165,8 +200,7 @@ class Validation:
         h.GetXaxis().SetTitle(xlab)
         h.GetYaxis().SetTitle(ylab)
 
-        for i in range(0, len(xIn)):
-            h.Fill(xIn[i],yIn[i], zIn[i])
+        BulkFill.fillProfile2D(h, xIn, yIn, zIn)
 
         h.Draw("colz")
         c.Print(self.config["outputDir"]+"/%s.png"%(name))
@@ -214,6 +248,7 @@ class Validation:
         self.plot1D([time3Train - t_Train_true], colors, labels, "tResTime3ROOT"+suffix, 'Events', 'time3 - photek', arange=arange, bins=nBinsReg, doLog=False)
 
         self.plot2D(name="xTracker_NN-PhotekROOT"+suffix, xlab="Tracker", ylab="NN - Photek", binxl=0.17, binxh=0.59, numbin=90, xIn=x_Train, yIn=timeDiffTrain, nbiny=nBinsReg, doLog=False, binyl=arange[0], binyh=arange[1])        
+        self.plotResidualProfile(name="xTracker_NN-PhotekProfile"+suffix, xlab="Tracker", ylab="NN - Photek", binxl=0.17, binxh=0.59, numbin=90, xIn=x_Train, yIn=timeDiffTrain, binyl=arange[0], binyh=arange[1])
         self.plot3D(name="xTracker_yTracker_NN-PhotekROOT"+suffix, xlab="x Tracker", ylab="y Tracker", binxl=0.17, binxh=0.59, numbin=90, xIn=x_Train, yIn=y_Train, zIn=timeDiffTrain, nbiny=100,binyl=9.7,binyh=11.7)
 
     def xPlots(self, x_Train, x_Val, y_Train, y_Val, x_Train_true, x_Val_true, colors, labels, suffix = ""):
@@ -233,12 +268,13 @@ class Validation:
         self.plotDisc([x_Train_true, x_Val_true], colors, labels, "xTrainTrue"+suffix, 'Events', 'tracker', arange=sensorRange, bins=nBinsReg)
 
         self.plot2D(name="xTracker_NN-TrackerROOT"+suffix, xlab="Tracker", ylab="NN - tracker", binxl=sensorRange[0], binxh=sensorRange[1], numbin=nBinsReg, xIn=x_Train, yIn=positionDiffTrain, nbiny=nBinsReg, doLog=False, binyl=arange[0], binyh=arange[1])        
+        self.plotResidualProfile(name="xTracker_NN-TrackerProfile"+suffix, xlab="Tracker", ylab="NN - tracker", binxl=sensorRange[0], binxh=sensorRange[1], numbin=nBinsReg//2, xIn=x_Train, yIn=positionDiffTrain, binyl=arange[0], binyh=arange[1])
         self.plot3D(name="xTracker_yTracker_NN-TrackerROOT"+suffix, xlab="x Tracker", ylab="y Tracker", binxl=sensorRange[0], binxh=sensorRange[1], numbin=nBinsReg, xIn=x_Train, yIn=y_Train, zIn=positionDiffTrain, nbiny=100,binyl=9.7,binyh=11.7)
 
     def makePlots(self, doQuickVal=True):
-        valData = get_data(["BNL2020_220V_272_Val.root"], self.config)
-        output_Train = self.model.predict(self.trainData["data"])
-        output_Val = self.model.predict(valData["data"])
+        valData = preprocess(["BNL2020_220V_272_Val.root"], self.config)
+        output_Train = self.predict(self.trainData)
+        output_Val = self.predict(valData)
 
         x_Train = self.getResults(output_Train, outputNum=0, columnNum=0)
         x_Train_true = self.trainData["targetX"][:,0]
@@ -289,17 +325,14 @@ class Validation:
         xmax=0.85
         recoHisto = ROOT.TH2D( "deltaX_vs_Xtrack", "deltaX_vs_Xtrack; X_{track} [mm]; #X_{reco} - X_{track} [mm]", int((xmax-xmin)/0.01),xmin,xmax, 200,-0.5,0.5 )
 
-        allData = get_data(["BNL2020_220V_272.root"], self.config)
-        output_all = self.model.predict(allData["data"])
-        x_all = self.getResults(output_all, outputNum=0, columnNum=0)
-        t_all = self.getResults(output_all, outputNum=1, columnNum=0)
-        x_all_true = allData["targetX"][:,0]
-        t_all_true = allData["targetT"][:,0]
-
-        for i in range(0, len(x_all)):
-            recoHisto.Fill( x_all_true[i],  x_all_true[i]-x_all[i])
+        # Predictions of the full sample are filled batch by batch and never kept
+        allData = preprocess(["BNL2020_220V_272.root"], self.config)
+        for start, stop, output_all in self.predictBatches(allData):
+            x_all = self.getResults(output_all, outputNum=0, columnNum=0)
+            x_all_true = np.asarray(allData["targetX"][start:stop,0])
+            BulkFill.fill(recoHisto, x_all_true, x_all_true-x_all)
 
-        fOut = ROOT.TFile.Open("NN_Output.root", "RECREATE")
+        fOut = ROOT.TFile.Open(self.config["outputDir"]+"/NN_Output.root", "RECREATE")
         fOut.cd()
         recoHisto.Write()
         fOut.Close()
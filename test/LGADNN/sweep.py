@@ -0,0 +1,159 @@
+#!/bin/env python
+import os
+import sys
+import csv
+import json
+import math
+import time
+import random
+import argparse
+import itertools
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Hyperparameter sweep of train.py on the local CPUs.
+# The sweep file gives the base hyperconfig and either a grid (every
+# combination is a trial) or parameter ranges for a random search:
+#
+#     {"base":   {"atag":"Sweep", "nNodesT":100, "nHLayersT":2, "epochs":200, ...},
+#      "grid":   {"nNodesX":[50, 100, 200], "drop_out":[0.2, 0.5]},
+#      "random": {"lr":{"min":1e-4, "max":1e-2, "log":true}, "batch_size":[1000, 5000]},
+#      "nTrials": 20}
+#
+# Trials run as separate train.py processes, each limited to --threads TF
+# threads, with as many at once as the cores allow. The best validation
+# losses of every finished trial are collected into <sweepDir>/leaderboard.csv,
+# updated after each trial.
+#
+#     python sweep.py --sweep sweep.json --cores 16 --threads 2 --patience 10
+
+lgadnnDir = os.path.dirname(os.path.abspath(__file__))
+
+def expandGrid(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+def sampleRandom(space, rng):
+    # A list is a set of choices, a dict a [min, max] range (log scale and integer optional)
+    trial = {}
+    for name in sorted(space):
+        spec = space[name]
+        if isinstance(spec, list):
+            trial[name] = rng.choice(spec)
+            continue
+        low, high = spec["min"], spec["max"]
+        if spec.get("log", False):
+            value = 10**rng.uniform(math.log10(low), math.log10(high))
+        else:
+            value = rng.uniform(low, high)
+        trial[name] = int(round(value)) if spec.get("int", False) else value
+    return trial
+
+def getTrials(sweep, seed):
+    grid = expandGrid(sweep.get("grid", {}))
+    if "random" not in sweep:
+        return [dict(sweep.get("base", {}), **g) for g in grid]
+    rng = random.Random(seed)
+    trials = []
+    for i in range(sweep.get("nTrials", 10)):
+        trial = dict(sweep.get("base", {}))
+        trial.update(rng.choice(grid))
+        trial.update(sampleRandom(sweep["random"], rng))
+        trials.append(trial)
+    # Random draws of choices can repeat, and equal configs share an output directory
+    unique = []
+    for t in trials:
+        if t not in unique:
+            unique.append(t)
+    return unique
+
+def outputDir(hyperconfig):
+    # Same naming as Train.makeOutputDir
+    d = "Output/"
+    for key in sorted(hyperconfig.keys()):
+        d += key+"_"+str(hyperconfig[key])+"_"
+    return d
+
+class Sweep:
+    def __init__(self, trials, sweepDir, cores, threads, args):
+        self.trials = trials
+        self.sweepDir = sweepDir
+        self.threads = threads
+        self.workers = max(1, cores // threads)
+        self.args = args
+        self.results = []
+        self.lock = threading.Lock()
+
+    def command(self, i):
+        cmd = [sys.executable, "train.py", "--json", os.path.join(self.sweepDir, "trial_%03d.json"%i),
+               "--seed", str(self.args.seed), "--intraThreads", str(self.threads), "--interThreads", str(max(1, self.threads // 2)),
+               "--patience", str(self.args.patience)]
+        return cmd + self.args.trainArgs
+
+    def runTrial(self, i):
+        trial = self.trials[i]
+        with open(os.path.join(self.sweepDir, "trial_%03d.json"%i), "w") as f:
+            json.dump(trial, f, indent=4, sort_keys=True)
+        env = dict(os.environ, OMP_NUM_THREADS=str(self.threads), TF_NUM_INTRAOP_THREADS=str(self.threads))
+        start = time.time()
+        with open(os.path.join(self.sweepDir, "trial_%03d.log"%i), "w") as log:
+            code = subprocess.call(self.command(i), cwd=lgadnnDir, stdout=log, stderr=subprocess.STDOUT, env=env)
+
+        result = {"trial":i, "status":"done" if code == 0 else "failed", "minutes":round((time.time() - start)/60.0, 1),
+                  "outputDir":outputDir(trial)}
+        configPath = os.path.join(lgadnnDir, result["outputDir"], "config.json")
+        if code == 0 and os.path.exists(configPath):
+            with open(configPath) as f:
+                result.update(json.load(f).get("metric", {}))
+        result.update(trial)
+        with self.lock:
+            self.results.append(result)
+            self.writeLeaderboard()
+            print("[%d/%d] trial %03d %s in %.1f min, val_loss %s"%(len(self.results), len(self.trials), i, result["status"],
+                                                                   result["minutes"], result.get("val_loss", "-")))
+        return result
+
+    def writeLeaderboard(self):
+        # Finished trials ordered by best val_loss, failed ones last
+        ranked = sorted(self.results, key=lambda r: (r["status"] != "done", r.get("val_loss", float("inf"))))
+        columns = ["rank", "trial", "status", "val_loss"]
+        for r in ranked:
+            columns += [k for k in r if k not in columns]
+        path = os.path.join(self.sweepDir, "leaderboard.csv")
+        with open(path + ".tmp", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, restval="")
+            writer.writeheader()
+            for rank, r in enumerate(ranked, 1):
+                writer.writerow(dict(r, rank=rank))
+        os.replace(path + ".tmp", path)
+
+    def run(self):
+        print("Running %d trials, %d at a time with %d threads each"%(len(self.trials), self.workers, self.threads))
+        with ThreadPoolExecutor(self.workers) as pool:
+            list(pool.map(self.runTrial, range(len(self.trials))))
+        return self.results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(usage="%(prog)s [options] -- [train.py options]")
+    parser.add_argument("--sweep",    dest="sweep",    help="Sweep JSON file (base, grid, random, nTrials)", required=True)
+    parser.add_argument("--sweepDir", dest="sweepDir", help="Directory for trial configs, logs and the leaderboard", default="Sweep")
+    parser.add_argument("--cores",    dest="cores",    help="Cores to use", type=int, default=os.cpu_count())
+    parser.add_argument("--threads",  dest="threads",  help="TF threads per trial", type=int, default=2)
+    parser.add_argument("--patience", dest="patience", help="Early stopping patience of each trial, 0 to disable", type=int, default=10)
+    parser.add_argument("--seed",     dest="seed",     help="Seed of the random search and of every trial", type=int, default=1234)
+    parser.add_argument("trainArgs",  nargs="*",       help="Extra train.py options, after --")
+    args = parser.parse_args()
+
+    with open(args.sweep) as f:
+        sweep = json.load(f)
+    trials = getTrials(sweep, args.seed)
+    sweepDir = os.path.abspath(args.sweepDir)
+    os.makedirs(sweepDir, exist_ok=True)
+
+    results = Sweep(trials, sweepDir, args.cores, args.threads, args).run()
+    failed = [r for r in results if r["status"] != "done"]
+    print("Leaderboard: %s"%os.path.join(sweepDir, "leaderboard.csv"))
+    if failed:
+        print("%d trials failed, see the logs in %s"%(len(failed), sweepDir))
+        sys.exit(1)
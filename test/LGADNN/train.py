@@ -7,16 +7,37 @@ tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.ERROR)
 import tensorflow.keras as K
 from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
 import numpy as np
-from DataGetter import get_data,getSamplesToRun
+from DataGetter import get_data,getSamplesToRun,preprocess
 import shutil
 from Validation import Validation
+import NumpyModel
 import json
 import argparse
 import os
 import time
 
+class Throughput(K.callbacks.Callback):
+    # Report the training samples/sec of each epoch, validation excluded
+    def __init__(self, nSamples):
+        super().__init__()
+        self.nSamples = nSamples
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.time()
+        self.stop = None
+
+    def on_test_begin(self, logs=None):
+        if self.stop is None:
+            self.stop = time.time()
+
+    def on_epoch_end(self, epoch, logs=None):
+        rate = self.nSamples / ((self.stop if self.stop else time.time()) - self.start)
+        if logs is not None:
+            logs["samples_per_sec"] = rate
+        print(" - %.0f samples/sec" % rate)
+
 class Train:
-    def __init__(self, USER, seed, saveAndPrint, hyperconfig, doQuickVal=False, doReweight=False, model="*", tree = "myMiniTree"):
+    def __init__(self, USER, seed, saveAndPrint, hyperconfig, doQuickVal=False, doReweight=False, model="*", tree = "myMiniTree", cacheDir = "cache", streaming = False, shuffleBuffer = 100000, patience = 0):
         self.user = USER
         #self.logdir = "/storage/local/data1/gpuscratch/%s"%(self.user)
         #self.logdir = "./"
@@ -25,6 +46,12 @@ class Train:
         self.saveAndPrint = saveAndPrint
         self.model = model
         self.config["tree"] = tree
+        self.config["cacheDir"] = cacheDir
+        self.config["streaming"] = streaming
+        self.config["shuffleBuffer"] = shuffleBuffer
+        self.config["blockSize"] = 4096
+        self.config["nShards"] = 16
+        self.config["patience"] = patience
         self.config["verbose"] = 1
         self.config["dataSet"] = "./"
         self.config["metrics"]=['accuracy']
@@ -68,12 +95,12 @@ class Train:
         main_input = K.layers.Input(shape=(trainData["data"].shape[1],), name='main_input')
         # Set the rescale inputs to have unit variance centered at 0 between -1 and 1
         layerLambda = K.layers.Lambda(lambda x: (x - K.backend.constant(trainData["mean"])) * K.backend.constant(trainData["scale"]), name='normalizeData')(main_input)
-        layerSplit = K.layers.Dense(config["nNodesX"], activation='relu')(layerLambda)
+        layerSplit = K.layers.Dense(config["nNodesX"], activation='relu', name='split')(layerLambda)
         #layerSplit = layerLambda
 
         layer = layerSplit
-        for n in n_hidden_layers_X:
-            layer = K.layers.Dense(n, activation='relu')(layer)
+        for i, n in enumerate(n_hidden_layers_X):
+            layer = K.layers.Dense(n, activation='relu', name='hiddenX_%d'%i)(layer)
         layer = K.layers.Dropout(config["drop_out"],seed=config["seed"])(layer)
         first_output = K.layers.Dense(trainData["targetX"].shape[1], activation=None, name='first_output')(layer)
 
@@ -81,8 +108,8 @@ class Train:
         #layer = K.layers.concatenate([first_output, layerSplit], name='concat_layer')
         #layer = main_input
         layer = layerSplit
-        for n in n_hidden_layers_T:
-            layer = K.layers.Dense(n, activation='relu')(layer)
+        for i, n in enumerate(n_hidden_layers_T):
+            layer = K.layers.Dense(n, activation='relu', name='hiddenT_%d'%i)(layer)
         layer = K.layers.Dropout(config["drop_out"],seed=config["seed"])(layer)
         second_output = K.layers.Dense(trainData["targetT"].shape[1], activation=None, name='second_output')(layer)
 
@@ -98,6 +125,43 @@ class Train:
         
         return model
 
+    def make_dataset(self, data, shuffle=True):
+        # Stream data (memory-mapped arrays of DataGetter.preprocess) through tf.data:
+        # the rows are split into blocks dealt to nShards shards, which are read in parallel
+        # and interleaved, then shuffled in a buffer, batched and prefetched during training
+        keys = ["data", "targetX", "targetT"]
+        nRows = data["data"].shape[0]
+        block = self.config["blockSize"]
+        nBlocks = (nRows + block - 1) // block
+        nShards = max(1, min(self.config["nShards"], nBlocks))
+
+        def readBlock(i):
+            start = int(i) * block
+            return tuple(np.asarray(data[k][start:start+block], dtype=np.float64) for k in keys)
+
+        def loadBlock(i):
+            values = tf.numpy_function(readBlock, [i], [tf.float64] * len(keys))
+            for v, k in zip(values, keys):
+                v.set_shape((None, data[k].shape[1]))
+            return tuple(values)
+
+        def readShard(s):
+            # Shard s holds blocks s, s+nShards, s+2*nShards, ...
+            blocks = tf.data.Dataset.range(s, nBlocks, nShards)
+            if shuffle:
+                blocks = blocks.shuffle(nBlocks // nShards + 1, seed=self.config["seed"])
+            return blocks.map(loadBlock, num_parallel_calls=tf.data.AUTOTUNE)
+
+        ds = tf.data.Dataset.range(nShards)
+        ds = ds.interleave(readShard, cycle_length=nShards, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        ds = ds.unbatch()
+        if shuffle:
+            ds = ds.shuffle(self.config["shuffleBuffer"], seed=self.config["seed"], reshuffle_each_iteration=True)
+        ds = ds.batch(self.config["batch_size"])
+        # Inputs and the two regression targets in the layout model.fit expects
+        ds = ds.map(lambda x, tx, tt: (x, (tx, tt)), num_parallel_calls=tf.data.AUTOTUNE)
+        return ds.prefetch(tf.data.AUTOTUNE)
+
     def get_callbacks(self):
         tbCallBack = K.callbacks.TensorBoard(log_dir=self.logdir+"/log_graph", histogram_freq=0, write_graph=True, write_images=True)
         log_model = K.callbacks.ModelCheckpoint(self.config["outputDir"]+"/BestNN.hdf5", monitor='val_loss', verbose=self.config["verbose"], save_best_only=True)
@@ -107,8 +171,20 @@ class Train:
             #callbacks = [log_model, tbCallBack, earlyStop]
             #callbacks = [log_model, tbCallBack]
             callbacks = [tbCallBack]
+        if self.config["patience"] > 0:
+            callbacks.append(K.callbacks.EarlyStopping(monitor="val_loss", min_delta=0, patience=self.config["patience"], verbose=0, mode="auto", baseline=None, restore_best_weights=True))
         return callbacks
 
+    def training_metrics(self, result_log):
+        # Best validation losses of the run, kept in config.json for the sweep leaderboard
+        history = result_log.history
+        best = int(np.argmin(history["val_loss"]))
+        metric = {"best_epoch":best, "epochs_run":len(history["val_loss"])}
+        for key in history:
+            if key.startswith("val_"):
+                metric[key] = float(history[key][best])
+        return metric
+
     def gpu_allow_mem_grow(self):
         gpus = tf.config.experimental.list_physical_devices('GPU')
         if gpus:
@@ -136,6 +212,13 @@ class Train:
         # Save frozen graph from frozen ConcreteFunction to hard drive
         tf.io.write_graph(graph_or_graph_def=frozen_func.graph, logdir=self.config["outputDir"], name="keras_frozen.pb", as_text=False)
 
+    def save_model_npz(self, model, trainData):
+        # Weights for the TF-free NumpyModel, checked against Keras on a few events
+        path = NumpyModel.export(model, trainData["mean"], trainData["scale"], self.config["outputDir"]+"/model.npz")
+        sample = np.asarray(trainData["data"][:1000])
+        diff = max(np.max(np.abs(a - b)) for a, b in zip(NumpyModel.NumpyModel(path).predict(sample), model.predict(sample)))
+        print("Wrote %s, max difference to Keras %.3g" % (path, diff))
+
     def plot_model(self, model):
         try:
             K.utils.plot_model(model, to_file=self.config["outputDir"]+"/model.png", show_shapes=True)
@@ -167,6 +250,13 @@ class Train:
         trainData = get_data(["BNL2020_220V_272_Train.root"], self.config)
         testData = get_data(["BNL2020_220V_272_Test.root"], self.config)        
         return trainData, testData
+
+    def importStreamingData(self):
+        # Unshuffled (memory-mapped when cached) data, shuffled by the tf.data pipeline instead
+        print("----------------Preparing data------------------")
+        trainData = preprocess(["BNL2020_220V_272_Train.root"], self.config)
+        testData = preprocess(["BNL2020_220V_272_Test.root"], self.config)
+        return trainData, testData
        
     def train(self):   
         # Define vars for training
@@ -175,20 +265,28 @@ class Train:
         print(len(self.config["allVars"]), self.config["allVars"])
 
         #Get stuff from input ROOT files
-        trainData, testData = self.importData()
+        if self.config["streaming"]:
+            trainData, testData = self.importStreamingData()
+        else:
+            trainData, testData = self.importData()
 
         # Make model
         print("----------------Preparing training model------------------")
         self.gpu_allow_mem_grow()
         model = self.make_model_reg(trainData)
-        callbacks = self.get_callbacks()
+        callbacks = self.get_callbacks() + [Throughput(trainData["data"].shape[0])]
         
         # Training model
         print("----------------Training model------------------")
-        result_log = model.fit(trainData["data"], [trainData["targetX"], trainData["targetT"]], 
-                               batch_size=self.config["batch_size"], epochs=self.config["epochs"], callbacks=callbacks,
-                               validation_data=(testData["data"], [testData["targetX"], testData["targetT"]]), 
-                               )
+        if self.config["streaming"]:
+            result_log = model.fit(self.make_dataset(trainData), epochs=self.config["epochs"], callbacks=callbacks,
+                                   validation_data=self.make_dataset(testData, shuffle=False),
+                                   )
+        else:
+            result_log = model.fit(trainData["data"], [trainData["targetX"], trainData["targetT"]], 
+                                   batch_size=self.config["batch_size"], epochs=self.config["epochs"], callbacks=callbacks,
+                                   validation_data=(testData["data"], [testData["targetX"], testData["targetT"]]), 
+                                   )
 
         # Model Visualization
         print("----------------Printed model layout------------------")
@@ -198,10 +296,12 @@ class Train:
         # Save trainig model as a protocol buffers file
         print("----------------Saving model------------------")
         self.save_model_pb(model)
+        self.save_model_npz(model, trainData)
        
         #Plot results
         print("----------------Validation of training------------------")
         val = Validation(model, self.config, trainData, result_log)
+        val.metric.update(self.training_metrics(result_log))
         val.makePlots()
         del val
         
@@ -216,10 +316,22 @@ if __name__ == '__main__':
     parser.add_argument("--json",         dest="json",         help="JSON config file", default="NULL") 
     parser.add_argument("--model",        dest="model",        help="Signal model to train on", type=str, default="*") 
     parser.add_argument("--tree",         dest="tree",         help="myMiniTree to train on", default="myMiniTree")
+    parser.add_argument("--cacheDir",     dest="cacheDir",     help="Directory of the preprocessed data cache, empty to disable", default="cache")
+    parser.add_argument("--streaming",    dest="streaming",    help="Feed the training through a tf.data pipeline", action="store_true", default=False)
+    parser.add_argument("--shuffleBuffer",dest="shuffleBuffer",help="Shuffle buffer size of the tf.data pipeline", type=int, default=100000)
+    parser.add_argument("--patience",     dest="patience",     help="Stop after this many epochs without val_loss improvement, 0 to disable", type=int, default=0)
+    parser.add_argument("--intraThreads", dest="intraThreads", help="TF intra-op threads, 0 for the TF default", type=int, default=0)
+    parser.add_argument("--interThreads", dest="interThreads", help="TF inter-op threads, 0 for the TF default", type=int, default=0)
     parser.add_argument("--saveAndPrint", dest="saveAndPrint", help="Save pb and print model", action="store_true", default=False)
     parser.add_argument("--seed",         dest="seed",         help="Use specific seed", type=int, default=-1)
     args = parser.parse_args()
 
+    # Thread pools must be sized before TF runs any op
+    if args.intraThreads > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(args.intraThreads)
+    if args.interThreads > 0:
+        tf.config.threading.set_inter_op_parallelism_threads(args.interThreads)
+
     # Get seed from time, but allow user to reseed with their own number
     masterSeed = int(time.time())
     if args.seed != -1:
@@ -242,6 +354,6 @@ if __name__ == '__main__':
     else: 
         hyperconfig = {"atag" : "GoldenTEST", "nNodesX":100, "nHLayersX":2, "nNodesT":100, "nHLayersT":2, "drop_out":0.5, "batch_size":5000, "epochs":2000, "lr":0.001}
 
-    t = Train(USER, masterSeed, args.saveAndPrint, hyperconfig, args.quickVal, args.reweight, model=args.model, tree=args.tree)
+    t = Train(USER, masterSeed, args.saveAndPrint, hyperconfig, args.quickVal, args.reweight, model=args.model, tree=args.tree, cacheDir=args.cacheDir, streaming=args.streaming, shuffleBuffer=args.shuffleBuffer, patience=args.patience)
     t.train()
 